@@ -0,0 +1,189 @@
+"""
+/ask_batch vs osobne /ask_stream dla zestawu pytań (generowanie raportu offline).
+
+Offline: MODEL_BACKEND=local z opóźnieniami generowania (LOCAL_LLM_TTFT_MS, LOCAL_LLM_TOKEN_MS), płaski
+indeks, bez cache odpowiedzi. Serwer uvicorn w wątku tego procesu. Wariant "single" wysyła pytania jako
+osobne /ask_stream przy współbieżności --concurrency, wariant "batch" – jedno /ask_batch
+(ASK_BATCH_CONCURRENCY = --concurrency). Liczone są wywołania embeddingów i cross-encodera po stronie serwera.
+Wynik: czas całości, odpowiedzi/s, czas do pierwszej odpowiedzi, liczba wywołań embed/predict.
+
+Użycie:
+    python benchmarks/bench_ask_batch.py --questions 48 --concurrency 8
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "panel_summarizer_ai_app"))
+os.environ.setdefault("DATA_DIR", str(ROOT / "data"))
+
+
+def _parse_args():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--video-id", default="Ya5Cg9qRspg")
+    ap.add_argument("--questions", type=int, default=48)
+    ap.add_argument("--concurrency", type=int, default=8)
+    ap.add_argument("--top-k", type=int, default=5)
+    ap.add_argument("--ttft-ms", type=float, default=100)
+    ap.add_argument("--token-ms", type=float, default=5)
+    return ap.parse_args()
+
+
+ARGS = _parse_args()
+# konfiguracja przed importem modułów aplikacji (czytają env przy imporcie)
+os.environ.setdefault("MODEL_BACKEND", "local")
+os.environ.setdefault("VECTOR_BACKEND", "flat")
+os.environ.setdefault("VECTOR_INDEX_DIR", tempfile.mkdtemp(prefix="bench_batch_"))
+os.environ.setdefault("ANSWER_CACHE_ENABLED", "0")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+os.environ.setdefault("TRACE_FILE", "")
+os.environ["LOCAL_LLM_TTFT_MS"] = str(ARGS.ttft_ms)
+os.environ["LOCAL_LLM_TOKEN_MS"] = str(ARGS.token_ms)
+os.environ["ASK_BATCH_CONCURRENCY"] = str(ARGS.concurrency)
+
+import httpx  # noqa: E402
+import uvicorn  # noqa: E402
+
+import main  # noqa: E402
+import vectors_repository as vr  # noqa: E402
+
+CALLS = {"embed": 0, "predict": 0, "predict_pairs": 0}
+
+
+def _count_calls():
+    """Liczniki wywołań modeli po stronie serwera (embeddingi pytań, predict cross-encodera)."""
+    emb, ce = vr.embedding, vr._cross_encoder
+    nested = threading.local()  # lokalne aembed_* wołają wersje sync – liczymy tylko zewnętrzne wywołanie
+
+    def wrap(obj, name, key):
+        fn = getattr(obj, name)
+
+        def counted(*args, **kwargs):
+            if not getattr(nested, "active", False):
+                CALLS[key] += 1
+                if key == "predict" and args:
+                    CALLS["predict_pairs"] += len(args[0])
+            return fn(*args, **kwargs)
+        setattr(obj, name, counted)
+
+    for name in ("embed_query", "embed_documents"):
+        wrap(emb, name, "embed")
+    for name in ("aembed_query", "aembed_documents"):
+        fn = getattr(emb, name)
+
+        async def acounted(*args, _fn=fn, **kwargs):
+            CALLS["embed"] += 1
+            nested.active = True
+            try:
+                return await _fn(*args, **kwargs)
+            finally:
+                nested.active = False
+        setattr(emb, name, acounted)
+    if ce is not None:
+        wrap(ce, "predict", "predict")
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _serve():
+    port = _free_port()
+    server = uvicorn.Server(uvicorn.Config(main.app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+    return server, thread, f"http://127.0.0.1:{port}"
+
+
+def _questions(n: int):
+    lines = (ROOT / "notes.txt").read_text(encoding="utf-8").splitlines()
+    base = [ln.strip() for ln in lines if ln.strip().endswith("?") and not ln.startswith("http")] or ["O czym jest panel?"]
+    # unikalne pytania (bez deduplikacji wewnątrz wsadu)
+    return [f"{base[i % len(base)]} (wariant {i // len(base) + 1})" if i >= len(base) else base[i] for i in range(n)]
+
+
+async def _single(base: str, questions, top_k: int, concurrency: int):
+    sem = asyncio.Semaphore(concurrency)
+    first = []
+    started = time.perf_counter()
+    async with httpx.AsyncClient(timeout=600) as client:
+        async def _one(q):
+            async with sem:
+                r = await client.post(f"{base}/ask_stream", json={"question": q, "top_k": top_k})
+                r.raise_for_status()
+                first.append(time.perf_counter() - started)
+        await asyncio.gather(*[_one(q) for q in questions])
+    return time.perf_counter() - started, min(first), len(first)
+
+
+async def _batch(base: str, questions, top_k: int):
+    first, answered = None, 0
+    started = time.perf_counter()
+    async with httpx.AsyncClient(timeout=600) as client:
+        async with client.stream("POST", f"{base}/ask_batch", json={"questions": questions, "top_k": top_k}) as r:
+            r.raise_for_status()
+            async for line in r.aiter_lines():
+                if line and json.loads(line)["type"] == "result":
+                    answered += 1
+                    if first is None:
+                        first = time.perf_counter() - started
+    return time.perf_counter() - started, first, answered
+
+
+def main_bench():
+    chunks_path = ROOT / "data" / "transcripts" / f"{ARGS.video_id}_chunks.json"
+    chunks = json.loads(chunks_path.read_text(encoding="utf-8"))
+    vr.store_chunks(vr.get_collection(main.COLLECTION_NAME), chunks, video_id=ARGS.video_id)
+    _count_calls()
+    questions = _questions(ARGS.questions)
+
+    rows = []
+    server, thread, base = _serve()
+    try:
+        asyncio.run(_single(base, questions[:2], ARGS.top_k, 2))  # rozgrzewka
+        for variant in ("single", "batch"):
+            for key in CALLS:
+                CALLS[key] = 0
+            if variant == "single":
+                wall, first, answered = asyncio.run(_single(base, questions, ARGS.top_k, ARGS.concurrency))
+            else:
+                wall, first, answered = asyncio.run(_batch(base, questions, ARGS.top_k))
+            row = {
+                "variant": variant,
+                "questions": len(questions),
+                "answered": answered,
+                "wall_s": round(wall, 2),
+                "answers_per_s": round(answered / wall, 2) if wall else None,
+                "first_answer_ms": round(first * 1000, 1) if first is not None else None,
+                "embed_calls": CALLS["embed"],
+                "rerank_calls": CALLS["predict"],
+                "rerank_pairs": CALLS["predict_pairs"],
+            }
+            rows.append(row)
+            print(f"[BENCH] {row}")
+    finally:
+        server.should_exit = True
+        thread.join(timeout=10)
+
+    by = {r["variant"]: r for r in rows}
+    summary = {}
+    if by.get("single", {}).get("wall_s") and by.get("batch", {}).get("wall_s"):
+        summary = {"speedup_x": round(by["single"]["wall_s"] / by["batch"]["wall_s"], 2)}
+    print(json.dumps({"config": {"concurrency": ARGS.concurrency, "ttft_ms": ARGS.ttft_ms, "token_ms": ARGS.token_ms},
+                      "rows": rows, "summary": summary}, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main_bench()
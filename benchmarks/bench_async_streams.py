@@ -0,0 +1,188 @@
+"""
+Test obciążeniowy równoległych strumieni odpowiedzi: ścieżka synchroniczna (jak dawne /ask_stream –
+generator sync w StreamingResponse, każdy krok strumienia w puli wątków Starlette) vs ścieżka async
+(obecne /ask_stream z main.py – klient LLM async, reranking w puli CPU).
+
+Offline: MODEL_BACKEND=local z opóźnieniami generowania (LOCAL_LLM_TTFT_MS, LOCAL_LLM_TOKEN_MS), płaski
+indeks, bez cache odpowiedzi. Każdy wariant działa w osobnym serwerze uvicorn (wątek w tym procesie);
+dla każdego poziomu współbieżności otwieranych jest naraz N strumieni.
+Wynik: TTFT p50/p95, czas strumienia p50/p95, strumienie/s, błędy, szczyt liczby wątków.
+
+Użycie:
+    python benchmarks/bench_async_streams.py --concurrency 16,64,128 --token-ms 20
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "panel_summarizer_ai_app"))
+os.environ.setdefault("DATA_DIR", str(ROOT / "data"))
+
+
+def _parse_args():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--video-id", default="Ya5Cg9qRspg")
+    ap.add_argument("--concurrency", default="16,64,128")
+    ap.add_argument("--top-k", type=int, default=5)
+    ap.add_argument("--ttft-ms", type=float, default=200)
+    ap.add_argument("--token-ms", type=float, default=20)
+    ap.add_argument("--variants", default="sync,async")
+    return ap.parse_args()
+
+
+ARGS = _parse_args()
+# konfiguracja przed importem modułów aplikacji (czytają env przy imporcie)
+os.environ.setdefault("MODEL_BACKEND", "local")
+os.environ.setdefault("VECTOR_BACKEND", "flat")
+os.environ.setdefault("VECTOR_INDEX_DIR", tempfile.mkdtemp(prefix="bench_async_"))
+os.environ.setdefault("ANSWER_CACHE_ENABLED", "0")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+os.environ["LOCAL_LLM_TTFT_MS"] = str(ARGS.ttft_ms)
+os.environ["LOCAL_LLM_TOKEN_MS"] = str(ARGS.token_ms)
+
+import httpx  # noqa: E402
+import uvicorn  # noqa: E402
+from fastapi import FastAPI  # noqa: E402
+from fastapi.responses import StreamingResponse  # noqa: E402
+
+import main  # noqa: E402
+import vectors_repository as vr  # noqa: E402
+from api_utils import build_contexts_for_ask  # noqa: E402
+from summarizer import answer  # noqa: E402
+
+
+def _sync_app() -> FastAPI:
+    """Dawny kształt /ask_stream: handler sync, generator sync (retrieval + answer) w StreamingResponse."""
+    app = FastAPI()
+
+    @app.post("/ask_stream")
+    def ask_stream(data: main.AskIn):
+        def generator():
+            contexts = build_contexts_for_ask(data.question, data.top_k, main.COLLECTION_NAME)
+            for delta in answer(contexts, data.question, top_k=len(contexts)):
+                if delta:
+                    yield delta
+        return StreamingResponse(generator(), media_type="text/plain; charset=utf-8")
+
+    return app
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _serve(app: FastAPI):
+    port = _free_port()
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+    return server, thread, f"http://127.0.0.1:{port}"
+
+
+def _questions():
+    lines = (ROOT / "notes.txt").read_text(encoding="utf-8").splitlines()
+    # pojedyncze pytania – jeden strumień LLM na żądanie w obu wariantach
+    return [ln.strip() for ln in lines if ln.strip().endswith("?") and not ln.startswith("http")] or ["O czym jest panel?"]
+
+
+def _pct(values, p):
+    if not values:
+        return None
+    values = sorted(values)
+    return round(values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))], 1)
+
+
+async def _one(client: httpx.AsyncClient, base: str, question: str, top_k: int):
+    started = time.perf_counter()
+    ttft = None
+    async with client.stream("POST", f"{base}/ask_stream", json={"question": question, "top_k": top_k}) as r:
+        r.raise_for_status()
+        async for chunk in r.aiter_text():
+            if chunk and ttft is None:
+                ttft = time.perf_counter() - started
+    return ttft, time.perf_counter() - started
+
+
+async def _level(base: str, n: int, questions, top_k: int, peak: dict):
+    limits = httpx.Limits(max_connections=n + 8, max_keepalive_connections=n + 8)
+    async with httpx.AsyncClient(limits=limits, timeout=600) as client:
+        stop = asyncio.Event()
+
+        async def _watch():
+            while not stop.is_set():
+                peak["threads"] = max(peak["threads"], threading.active_count())
+                await asyncio.sleep(0.05)
+
+        watcher = asyncio.ensure_future(_watch())
+        started = time.perf_counter()
+        results = await asyncio.gather(
+            *[_one(client, base, questions[i % len(questions)], top_k) for i in range(n)], return_exceptions=True
+        )
+        wall = time.perf_counter() - started
+        stop.set()
+        await watcher
+    ok = [r for r in results if not isinstance(r, BaseException)]
+    ttfts = [r[0] * 1000 for r in ok if r[0] is not None]
+    totals = [r[1] * 1000 for r in ok]
+    return {
+        "concurrency": n,
+        "ok": len(ok),
+        "errors": len(results) - len(ok),
+        "ttft_p50_ms": _pct(ttfts, 50),
+        "ttft_p95_ms": _pct(ttfts, 95),
+        "stream_p50_ms": _pct(totals, 50),
+        "stream_p95_ms": _pct(totals, 95),
+        "wall_s": round(wall, 2),
+        "streams_per_s": round(len(ok) / wall, 2) if wall else None,
+        "peak_threads": peak["threads"],
+    }
+
+
+def main_bench():
+    chunks_path = ROOT / "data" / "transcripts" / f"{ARGS.video_id}_chunks.json"
+    chunks = json.loads(chunks_path.read_text(encoding="utf-8"))
+    vr.store_chunks(vr.get_collection(main.COLLECTION_NAME), chunks, video_id=ARGS.video_id)
+    questions = _questions()
+    levels = [int(x) for x in ARGS.concurrency.split(",")]
+
+    apps = {"sync": _sync_app, "async": lambda: main.app}
+    rows = []
+    for variant in ARGS.variants.split(","):
+        server, thread, base = _serve(apps[variant]())
+        try:
+            asyncio.run(_level(base, 2, questions, ARGS.top_k, {"threads": 0}))  # rozgrzewka
+            for n in levels:
+                row = {"variant": variant, **asyncio.run(_level(base, n, questions, ARGS.top_k, {"threads": 0}))}
+                rows.append(row)
+                print(f"[BENCH] {row}")
+        finally:
+            server.should_exit = True
+            thread.join(timeout=10)
+
+    summary = {}
+    for n in levels:
+        by = {r["variant"]: r for r in rows if r["concurrency"] == n}
+        if "sync" in by and "async" in by and by["sync"]["streams_per_s"]:
+            summary[n] = {
+                "throughput_x": round(by["async"]["streams_per_s"] / by["sync"]["streams_per_s"], 2),
+                "ttft_p95_ms": {"sync": by["sync"]["ttft_p95_ms"], "async": by["async"]["ttft_p95_ms"]},
+            }
+    print(json.dumps({"config": {"ttft_ms": ARGS.ttft_ms, "token_ms": ARGS.token_ms},
+                      "rows": rows, "summary": summary}, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main_bench()
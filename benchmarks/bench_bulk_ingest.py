@@ -0,0 +1,117 @@
+"""
+Ingest wielu filmów: po kolei (ingest_youtube dla każdego filmu, jak pojedyncze /process_youtube) vs potok
+bulk_ingest.run_bulk (download -> transcribe -> index z osobną współbieżnością etapów i ograniczonymi kolejkami).
+
+Offline: zamienniki pobierania i transkrypcji z bench_load.py (opóźnienia --download-ms / --transcribe-ms,
+transkrypt z segmentów filmu bazowego – każdy film daje inne chunki), MODEL_BACKEND=local, płaski indeks.
+Po wariancie "bulk" ten sam zestaw zgłaszany jest ponownie ("bulk_again") – wszystkie filmy powinny
+zostać pominięte (manifest indeksu).
+Wynik: czas całości, filmy/h, krotność czasu rzeczywistego audio, zajętość etapów.
+
+Użycie:
+    python benchmarks/bench_bulk_ingest.py --videos 12 --download-concurrency 3 --transcribe-concurrency 2
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "panel_summarizer_ai_app"))
+
+
+def _parse_args():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--video-id", default="Ya5Cg9qRspg", help="film bazowy z data/transcripts")
+    ap.add_argument("--videos", type=int, default=12)
+    ap.add_argument("--video-seconds", type=float, default=600)
+    ap.add_argument("--download-ms", type=float, default=1500)
+    ap.add_argument("--transcribe-ms", type=float, default=2500)
+    ap.add_argument("--download-concurrency", type=int, default=3)
+    ap.add_argument("--transcribe-concurrency", type=int, default=2)
+    ap.add_argument("--index-concurrency", type=int, default=1)
+    ap.add_argument("--queue-size", type=int, default=2)
+    ap.add_argument("--variants", default="sequential,bulk")
+    return ap.parse_args()
+
+
+ARGS = _parse_args()
+WORK = Path(tempfile.mkdtemp(prefix="bench_bulk_"))
+# konfiguracja przed importem modułów aplikacji (czytają env przy imporcie)
+os.environ["DATA_DIR"] = str(WORK / "data")
+os.environ.setdefault("MODEL_BACKEND", "local")
+os.environ.setdefault("VECTOR_BACKEND", "flat")
+os.environ["VECTOR_INDEX_DIR"] = str(WORK / "index")
+os.environ["JOBS_DB"] = str(WORK / "jobs.sqlite")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+os.environ.setdefault("TRACE_FILE", "")
+# wariant "sequential" przez pełne pobranie + transkrypcję, jak etapy potoku bulk (te same opóźnienia zamienników)
+os.environ.setdefault("INGEST_STREAMING", "0")
+os.environ["BULK_DOWNLOAD_CONCURRENCY"] = str(ARGS.download_concurrency)
+os.environ["BULK_TRANSCRIBE_CONCURRENCY"] = str(ARGS.transcribe_concurrency)
+os.environ["BULK_INDEX_CONCURRENCY"] = str(ARGS.index_concurrency)
+os.environ["BULK_QUEUE_SIZE"] = str(ARGS.queue_size)
+
+(WORK / "data" / "transcripts").mkdir(parents=True)
+for name in (f"{ARGS.video_id}.txt", f"{ARGS.video_id}.json", f"{ARGS.video_id}_chunks.json"):
+    shutil.copy(ROOT / "data" / "transcripts" / name, WORK / "data" / "transcripts" / name)
+
+from bench_load import _install_standins  # noqa: E402
+
+_install_standins(argparse.Namespace(video_id=ARGS.video_id, video_seconds=ARGS.video_seconds,
+                                     download_ms=ARGS.download_ms, transcribe_ms=ARGS.transcribe_ms))
+
+from bulk_ingest import run_bulk  # noqa: E402
+from ingest import ingest_youtube  # noqa: E402
+
+
+def _urls(prefix: str):
+    return [f"https://www.youtube.com/watch?v={prefix}{i:06d}" for i in range(ARGS.videos)]
+
+
+def _row(variant: str, wall: float, report=None):
+    row = {"variant": variant, "videos": ARGS.videos, "wall_s": round(wall, 2),
+           "videos_per_hour": round(ARGS.videos / wall * 3600, 1) if wall else None}
+    if report is not None:
+        row.update({
+            "videos_per_hour": report["throughput"]["videos_per_hour"],  # tylko przetworzone (bez pominiętych)
+            "counts": report["counts"],
+            "audio_realtime_factor": report["throughput"]["audio_realtime_factor"],
+            "utilization": {k: v["utilization"] for k, v in report["stages"].items()},
+        })
+    return row
+
+
+def main():
+    rows = []
+    variants = [v.strip() for v in ARGS.variants.split(",") if v.strip()]
+    try:
+        if "sequential" in variants:
+            started = time.perf_counter()
+            for url in _urls("seq"):
+                ingest_youtube(url)
+            rows.append(_row("sequential", time.perf_counter() - started))
+            print(f"[BENCH] {rows[-1]}")
+        if "bulk" in variants:
+            for variant in ("bulk", "bulk_again"):
+                started = time.perf_counter()
+                report = run_bulk(_urls("blk"))
+                rows.append(_row(variant, time.perf_counter() - started, report))
+                print(f"[BENCH] {rows[-1]}")
+    finally:
+        shutil.rmtree(WORK, ignore_errors=True)
+
+    by = {r["variant"]: r for r in rows}
+    summary = {}
+    if by.get("sequential") and by.get("bulk"):
+        summary["speedup_x"] = round(by["sequential"]["wall_s"] / by["bulk"]["wall_s"], 2)
+    print(json.dumps({"config": {k: v for k, v in vars(ARGS).items() if k != "variants"},
+                      "rows": rows, "summary": summary}, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
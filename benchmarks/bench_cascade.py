@@ -0,0 +1,97 @@
+"""
+Benchmark kaskadowego retrievalu vs pełny reranking 20 kandydatów.
+
+Indeksuje zapisane chunki z data/transcripts, a następnie dla każdego pytania (notes.txt + --questions)
+i każdego top_k porównuje:
+  - full:    query_and_rerank_crossencoder (20 kandydatów, reranking wszystkich),
+  - cascade: query_and_rerank_cascade (adaptacyjna liczba kandydatów, wczesne zatrzymanie).
+Recall@k liczony jest względem wyniku pełnego rerankingu (ten sam zbiór top_k = recall 1.0).
+
+Użycie:
+    python benchmarks/bench_cascade.py --video-id Ya5Cg9qRspg --top-k 3,5,8
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "panel_summarizer_ai_app"))
+os.environ.setdefault("DATA_DIR", str(ROOT / "data"))
+
+import vectors_repository as vr  # noqa: E402
+
+
+def _questions(extra_file: str | None):
+    lines = (ROOT / "notes.txt").read_text(encoding="utf-8").splitlines()
+    qs = [ln.strip() for ln in lines if ln.strip() and not ln.startswith("http")]
+    if extra_file:
+        qs.extend(q.strip() for q in Path(extra_file).read_text(encoding="utf-8").splitlines() if q.strip())
+    return qs
+
+
+def _key(c):
+    return (c.get("start"), c.get("end"), c.get("speaker"))
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--video-id", default="Ya5Cg9qRspg")
+    ap.add_argument("--collection", default="bench_cascade")
+    ap.add_argument("--top-k", default="3,5,8")
+    ap.add_argument("--repeats", type=int, default=3)
+    ap.add_argument("--questions", help="plik z dodatkowymi pytaniami (jedno na linię)")
+    args = ap.parse_args()
+
+    chunks_path = ROOT / "data" / "transcripts" / f"{args.video_id}_chunks.json"
+    chunks = json.loads(chunks_path.read_text(encoding="utf-8"))
+    col = vr.get_collection(args.collection)
+    vr.store_chunks(col, chunks, video_id=args.video_id)
+
+    rows = []
+    for k in [int(x) for x in args.top_k.split(",")]:
+        for q in _questions(args.questions):
+            full_ms, casc_ms = [], []
+            for _ in range(args.repeats):
+                t = time.perf_counter()
+                full = vr.query_and_rerank_crossencoder(col, q, n_candidates=20, top_k=k)
+                full_ms.append((time.perf_counter() - t) * 1000)
+                stats = {}
+                t = time.perf_counter()
+                casc = vr.query_and_rerank_cascade(col, q, top_k=k, stats=stats)
+                casc_ms.append((time.perf_counter() - t) * 1000)
+            recall = len({_key(c) for c in full} & {_key(c) for c in casc}) / max(1, len(full))
+            rows.append({
+                "top_k": k,
+                "question": q[:60],
+                "path": stats.get("path"),
+                "reranked": stats.get("reranked"),
+                "full_ms": round(min(full_ms), 1),
+                "cascade_ms": round(min(casc_ms), 1),
+                "recall_vs_full": round(recall, 3),
+            })
+            print(f"[BENCH] {rows[-1]}")
+
+    by_k = {}
+    for r in rows:
+        agg = by_k.setdefault(r["top_k"], {"full_ms": 0.0, "cascade_ms": 0.0, "recall": 0.0, "n": 0})
+        agg["full_ms"] += r["full_ms"]
+        agg["cascade_ms"] += r["cascade_ms"]
+        agg["recall"] += r["recall_vs_full"]
+        agg["n"] += 1
+    summary = {
+        k: {
+            "full_ms_avg": round(a["full_ms"] / a["n"], 1),
+            "cascade_ms_avg": round(a["cascade_ms"] / a["n"], 1),
+            "saved_pct": round(100 * (1 - a["cascade_ms"] / max(a["full_ms"], 1e-9)), 1),
+            "recall_avg": round(a["recall"] / a["n"], 3),
+        }
+        for k, a in by_k.items()
+    }
+    print(json.dumps({"rows": rows, "summary": summary}, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
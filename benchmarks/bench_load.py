@@ -0,0 +1,506 @@
+"""
+Offline test obciążeniowy całego serwisu FastAPI (main.app) – ruch mieszany i per endpoint.
+
+Serwer działa w osobnym procesie (ten sam plik z --serve), żeby RSS dotyczył tylko serwera. Zamienniki:
+  - OpenAI / modele: MODEL_BACKEND=local (embeddingi, LLM z opóźnieniami LOCAL_LLM_TTFT_MS / LOCAL_LLM_TOKEN_MS,
+    cross-encoder) – local_models.py,
+  - YouTube: download_audio_from_youtube zapisuje syntetyczny WAV 16 kHz mono (--video-seconds) po --download-ms,
+  - Whisper + pyannote: transcribe_api po --transcribe-ms zapisuje transkrypt złożony z segmentów filmu bazowego
+    (przesuniętych o hash video_id – każdy nowy film daje inne chunki i pełne indeksowanie),
+  - ingest strumieniowy (INGEST_STREAMING=1, domyślnie): segmenty po SEGMENT_SECONDS oddawane w trakcie
+    "pobierania" (--download-ms rozłożone na segmenty), transkrypcja segmentów w tle w trakcie pobierania.
+Dane w katalogu tymczasowym (kopia transkryptu --video-id), płaski indeks, stan w SQLite.
+
+Operacje:
+  ask        POST /ask_stream (TTFT = pierwszy niepusty fragment, session_id z X-Session-Id),
+  eval       POST /ask_eval_ce dla sesji z wcześniejszych ask,
+  summarize  POST /summarize_stream (refresh=true – pełne generowanie; TTFT = pierwszy fragment poza [POSTĘP]),
+  process    POST /process_youtube + odpytywanie /jobs/{id} do końca zadania (latency = całe zadanie,
+             TTFT = przyjęcie zadania); --process-new-ratio nowych filmów, reszta to ponowne przetworzenie
+             znanego filmu (manifest indeksu).
+Fazy: "isolated" – każda operacja osobno, "mixed" – losowanie wg --mix. Każda faza trwa --duration s przy
+stałej liczbie klientów --concurrency (pętla zamknięta). RSS serwera próbkowany co 0.2 s (start/szczyt/koniec).
+Wynik: p50/p95/p99 opóźnienia i TTFT, żądania/s, błędy, RSS – zapis do benchmarks/results/load_*.json;
+--compare <plik>|latest pokazuje różnice i regresje powyżej --tolerance (--fail-on-regression – kod wyjścia 1).
+
+Użycie:
+    python benchmarks/bench_load.py --concurrency 8 --duration 20
+    python benchmarks/bench_load.py --phases mixed --mix ask=6,eval=2,summarize=1,process=1 --compare latest
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import random
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import wave
+from collections import deque
+from datetime import datetime
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+APP_DIR = ROOT / "panel_summarizer_ai_app"
+OPS = ("ask", "eval", "summarize", "process")
+PROGRESS_MARKER = "[POSTĘP]"  # summarizer.PROGRESS_MARKER
+# metryki porównywane między przebiegami: (klucz, True gdy większa wartość jest lepsza)
+COMPARE_KEYS = [("req_per_s", True), ("latency_p50_ms", False), ("latency_p95_ms", False),
+                ("latency_p99_ms", False), ("ttft_p50_ms", False), ("ttft_p95_ms", False),
+                ("error_rate", False), ("rss_peak_mb", False)]
+
+
+def _parse_args():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--video-id", default="Ya5Cg9qRspg", help="film bazowy z data/transcripts")
+    ap.add_argument("--concurrency", type=int, default=8)
+    ap.add_argument("--duration", type=float, default=20, help="czas jednej fazy (s)")
+    ap.add_argument("--phases", default="isolated,mixed")
+    ap.add_argument("--mix", default="ask=6,eval=2,summarize=1,process=1")
+    ap.add_argument("--top-k", type=int, default=5)
+    ap.add_argument("--summary-max-tokens", type=int, default=800)
+    ap.add_argument("--process-new-ratio", type=float, default=0.5)
+    ap.add_argument("--ttft-ms", type=float, default=100)
+    ap.add_argument("--token-ms", type=float, default=5)
+    ap.add_argument("--video-seconds", type=float, default=300)
+    ap.add_argument("--download-ms", type=float, default=500)
+    ap.add_argument("--transcribe-ms", type=float, default=1500)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--out", default=str(ROOT / "benchmarks" / "results"))
+    ap.add_argument("--compare", help="poprzedni plik wyników albo 'latest'")
+    ap.add_argument("--tolerance", type=float, default=0.2, help="próg regresji (względna zmiana)")
+    ap.add_argument("--fail-on-regression", action="store_true")
+    ap.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    ap.add_argument("--port", type=int, default=0, help=argparse.SUPPRESS)
+    return ap.parse_args()
+
+
+# ---------------------------------------------------------------------------------------------------------
+# proces serwera: zamienniki YouTube i transkrypcji + uvicorn
+# ---------------------------------------------------------------------------------------------------------
+
+def _install_standins(args):
+    """Moduły yt_download i transcribe (importowane leniwie w ingest.py) zastąpione lokalnymi zamiennikami."""
+    import types
+    from concurrent.futures import ThreadPoolExecutor
+    from config import DATA_DIR
+    from tracing import traced
+    from yt_utils import extract_video_id
+
+    audio_dir = Path(DATA_DIR) / "audio"
+    transcripts_dir = Path(DATA_DIR) / "transcripts"
+    audio_dir.mkdir(parents=True, exist_ok=True)
+    base = json.loads((transcripts_dir / f"{args.video_id}.json").read_text(encoding="utf-8"))
+    segment_s, overlap_s = 180, 3  # transcribe.SEGMENT_SECONDS / OVERLAP_SECONDS
+    n_segments = max(1, int(-(-args.video_seconds // segment_s)))
+
+    def audio_path_for(video_id: str) -> str:
+        return str(audio_dir / f"{video_id}.wav")
+
+    def _write_wav(video_id: str) -> str:
+        out = audio_path_for(video_id)
+        with wave.open(out, "wb") as w:
+            w.setnchannels(1)
+            w.setsampwidth(2)
+            w.setframerate(16000)
+            silence = b"\x00\x00" * 16000
+            for _ in range(int(args.video_seconds)):
+                w.writeframes(silence)
+        return out
+
+    def _write_transcript(audio_path: str) -> str:
+        vid = Path(audio_path).stem
+        shift = int(hashlib.md5(vid.encode("utf-8")).hexdigest(), 16) % len(base)
+        segments, t = [], 0.0
+        for i in range(len(base)):
+            s = base[(shift + i) % len(base)]
+            dur = max(0.5, float(s["end"]) - float(s["start"]))
+            if t + dur > args.video_seconds:
+                break
+            segments.append({"start": t, "end": t + dur, "speaker": s["speaker"], "text": s["text"]})
+            t += dur
+        json_out = transcripts_dir / f"{vid}.json"
+        txt_out = transcripts_dir / f"{vid}.txt"
+        json_out.write_text(json.dumps(segments, ensure_ascii=False, indent=2), encoding="utf-8")
+        txt_out.write_text("\n".join(f"[{s['start']:.2f} - {s['end']:.2f}] {s['speaker']}: {s['text'].strip()}"
+                                     for s in segments), encoding="utf-8")
+        return str(txt_out)
+
+    @traced("download_audio_from_youtube")
+    def download_audio_from_youtube(url: str) -> str:
+        time.sleep(args.download_ms / 1000)
+        return _write_wav(extract_video_id(url))
+
+    @traced("transcribe_api")
+    def transcribe_api(audio_path: str) -> str:
+        time.sleep(args.transcribe_ms / 1000)
+        return _write_transcript(audio_path)
+
+    @traced("stream_audio_segments")
+    def stream_audio_segments(url: str, segment_seconds: int, overlap_seconds: int, source=None):
+        vid = extract_video_id(url)
+        for i in range(n_segments):
+            time.sleep(args.download_ms / 1000 / n_segments)
+            yield i, audio_path_for(vid), max(0.0, i * segment_seconds - overlap_seconds)
+        _write_wav(vid)
+
+    @traced("transcribe_stream")
+    def transcribe_stream(segments, audio_path: str) -> str:
+        # transkrypcja segmentu (--transcribe-ms / liczba segmentów) w tle, w trakcie "pobierania"
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            futures = [pool.submit(time.sleep, args.transcribe_ms / 1000 / n_segments) for _ in segments]
+            for f in futures:
+                f.result()
+        return _write_transcript(audio_path)
+
+    sys.modules["yt_download"] = types.SimpleNamespace(
+        download_audio_from_youtube=download_audio_from_youtube, stream_audio_segments=stream_audio_segments,
+        audio_path_for=audio_path_for)
+    sys.modules["transcribe"] = types.SimpleNamespace(
+        transcribe_api=transcribe_api, transcribe_stream=transcribe_stream,
+        SEGMENT_SECONDS=segment_s, OVERLAP_SECONDS=overlap_s)
+
+
+def serve(args):
+    sys.path.insert(0, str(APP_DIR))
+    os.chdir(APP_DIR)
+    _install_standins(args)
+    import uvicorn
+    import main
+    uvicorn.run(main.app, host="127.0.0.1", port=args.port, log_level="warning")
+
+
+# ---------------------------------------------------------------------------------------------------------
+# sterownik: start serwera, fazy obciążenia, RSS, zapis i porównanie wyników
+# ---------------------------------------------------------------------------------------------------------
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _prepare_data(work: Path, video_id: str) -> Path:
+    data = work / "data"
+    (data / "transcripts").mkdir(parents=True)
+    for name in (f"{video_id}.txt", f"{video_id}.json", f"{video_id}_chunks.json"):
+        shutil.copy(ROOT / "data" / "transcripts" / name, data / "transcripts" / name)
+    return data
+
+
+def _start_server(args, work: Path):
+    import httpx
+
+    port = _free_port()
+    env = dict(os.environ)
+    env.update({
+        "DATA_DIR": str(_prepare_data(work, args.video_id)),
+        "MODEL_BACKEND": "local",
+        "VECTOR_BACKEND": "flat",
+        "VECTOR_INDEX_DIR": str(work / "index"),
+        "STATE_DB": str(work / "state.sqlite"),
+        "JOBS_DB": str(work / "jobs.sqlite"),
+        "TRACE_FILE": "",
+        "LOG_LEVEL": "WARNING",
+        "ANSWER_CACHE_ENABLED": env.get("ANSWER_CACHE_ENABLED", "0"),
+        "LOCAL_LLM_TTFT_MS": str(args.ttft_ms),
+        "LOCAL_LLM_TOKEN_MS": str(args.token_ms),
+    })
+    cmd = [sys.executable, str(Path(__file__).resolve()), "--serve", "--port", str(port),
+           "--video-id", args.video_id, "--video-seconds", str(args.video_seconds),
+           "--download-ms", str(args.download_ms), "--transcribe-ms", str(args.transcribe_ms)]
+    proc = subprocess.Popen(cmd, env=env, stdout=subprocess.DEVNULL, start_new_session=True)
+    base = f"http://127.0.0.1:{port}"
+    deadline = time.time() + 300
+    while time.time() < deadline:
+        try:
+            if httpx.get(f"{base}/health", timeout=2).status_code == 200:
+                return proc, base
+        except httpx.HTTPError:
+            pass
+        if proc.poll() is not None:
+            raise RuntimeError(f"serwer zakończył się z kodem {proc.returncode}")
+        time.sleep(0.3)
+    raise TimeoutError("serwer nie wystartował")
+
+
+def _stop_server(proc):
+    os.killpg(proc.pid, signal.SIGTERM)
+    try:
+        proc.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        os.killpg(proc.pid, signal.SIGKILL)
+
+
+def _rss_mb(pid: int):
+    try:
+        for line in Path(f"/proc/{pid}/status").read_text().splitlines():
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+class RssSampler:
+    """Próbkuje RSS procesu serwera w tle; window() zwraca start/szczyt/koniec od ostatniego reset()."""
+
+    def __init__(self, pid: int, interval: float = 0.2):
+        self.pid, self.interval = pid, interval
+        self._samples = []
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            rss = _rss_mb(self.pid)
+            if rss is not None:
+                self._samples.append(rss)
+
+    def reset(self):
+        rss = _rss_mb(self.pid)
+        self._samples = [rss] if rss is not None else []
+
+    def window(self):
+        rss = _rss_mb(self.pid)
+        samples = self._samples + ([rss] if rss is not None else [])
+        if not samples:
+            return {"rss_start_mb": None, "rss_peak_mb": None, "rss_end_mb": None}
+        return {"rss_start_mb": round(samples[0], 1), "rss_peak_mb": round(max(samples), 1),
+                "rss_end_mb": round(samples[-1], 1)}
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join(timeout=2)
+
+
+def _pct(values, p):
+    values = sorted(values)
+    return round(values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))], 1) if values else None
+
+
+def _questions():
+    lines = (ROOT / "notes.txt").read_text(encoding="utf-8").splitlines()
+    return [ln.strip() for ln in lines if ln.strip().endswith("?") and not ln.startswith("http")] or ["O czym jest panel?"]
+
+
+def _parse_mix(spec: str):
+    mix = {}
+    for item in spec.split(","):
+        name, _, weight = item.partition("=")
+        name = name.strip()
+        if name not in OPS:
+            raise SystemExit(f"nieznana operacja w --mix: {name} (dostępne: {', '.join(OPS)})")
+        mix[name] = float(weight or 1)
+    return {k: v for k, v in mix.items() if v > 0}
+
+
+class LoadRunner:
+    def __init__(self, base: str, args):
+        self.base, self.args = base, args
+        self.questions = _questions()
+        self.sessions = deque(maxlen=500)
+        self.rng = random.Random(args.seed)
+        self._videos = 0
+        self._run_tag = datetime.now().strftime("%H%M%S")
+
+    async def _stream(self, client, path: str, body: dict, skip_prefix=None):
+        """(status, ttft_ms, nagłówki) – TTFT do pierwszego niepustego fragmentu (poza skip_prefix)."""
+        started, ttft = time.perf_counter(), None
+        async with client.stream("POST", f"{self.base}{path}", json=body) as r:
+            async for chunk in r.aiter_text():
+                if ttft is None and chunk.strip() and not (skip_prefix and chunk.lstrip().startswith(skip_prefix)):
+                    ttft = (time.perf_counter() - started) * 1000
+            return r.status_code, ttft, r.headers
+
+    async def op_ask(self, client):
+        q = self.rng.choice(self.questions)
+        status, ttft, headers = await self._stream(client, "/ask_stream", {"question": q, "top_k": self.args.top_k})
+        if status == 200 and headers.get("x-session-id"):
+            self.sessions.append((headers["x-session-id"], q))
+        return status, ttft
+
+    async def op_eval(self, client):
+        if not self.sessions:
+            await self.op_ask(client)
+        sid, q = self.rng.choice(self.sessions)
+        r = await client.post(f"{self.base}/ask_eval_ce", json={"question": q, "session_id": sid})
+        return (r.status_code if "error" not in r.json() else 500), None
+
+    async def op_summarize(self, client):
+        body = {"video_id": self.args.video_id, "max_tokens": self.args.summary_max_tokens, "refresh": True,
+                "progress": True}  # jak UI
+        status, ttft, _ = await self._stream(client, "/summarize_stream", body, skip_prefix=PROGRESS_MARKER)
+        return status, ttft
+
+    async def op_process(self, client):
+        if self.rng.random() < self.args.process_new_ratio:
+            self._videos += 1
+            vid = f"lt{self._run_tag}{self._videos:05d}"
+        else:
+            vid = self.args.video_id
+        started = time.perf_counter()
+        r = await client.post(f"{self.base}/process_youtube", json={"url": f"https://www.youtube.com/watch?v={vid}"})
+        accepted = (time.perf_counter() - started) * 1000
+        if r.status_code != 200 or "job_id" not in r.json():
+            return r.status_code if r.status_code != 200 else 500, accepted
+        job_id = r.json()["job_id"]
+        while True:
+            await asyncio.sleep(0.1)
+            job = (await client.get(f"{self.base}/jobs/{job_id}")).json()
+            if job.get("status") in ("done", "error"):
+                return (200 if job["status"] == "done" else 500), accepted
+
+    async def run_phase(self, name: str, mix: dict, duration: float):
+        import httpx
+
+        ops, weights = list(mix), list(mix.values())
+        samples = {op: {"latency": [], "ttft": [], "errors": 0, "statuses": {}} for op in ops}
+        deadline = time.perf_counter() + duration
+        limits = httpx.Limits(max_connections=self.args.concurrency + 4,
+                              max_keepalive_connections=self.args.concurrency + 4)
+        async with httpx.AsyncClient(limits=limits, timeout=600) as client:
+            async def _client_loop():
+                while time.perf_counter() < deadline:
+                    op = self.rng.choices(ops, weights)[0]
+                    s = samples[op]
+                    started = time.perf_counter()
+                    try:
+                        status, ttft = await getattr(self, f"op_{op}")(client)
+                    except (httpx.HTTPError, ValueError) as e:
+                        status, ttft = type(e).__name__, None
+                    s["statuses"][str(status)] = s["statuses"].get(str(status), 0) + 1
+                    if status == 200:
+                        s["latency"].append((time.perf_counter() - started) * 1000)
+                        if ttft is not None:
+                            s["ttft"].append(ttft)
+                    else:
+                        s["errors"] += 1
+
+            started = time.perf_counter()
+            await asyncio.gather(*[_client_loop() for _ in range(self.args.concurrency)])
+            wall = time.perf_counter() - started
+
+        rows = []
+        for op in ops:
+            s = samples[op]
+            total = len(s["latency"]) + s["errors"]
+            rows.append({
+                "phase": name,
+                "endpoint": op,
+                "requests": total,
+                "errors": s["errors"],
+                "error_rate": round(s["errors"] / total, 4) if total else 0.0,
+                "statuses": s["statuses"],
+                "wall_s": round(wall, 2),
+                "req_per_s": round(len(s["latency"]) / wall, 2) if wall else None,
+                "latency_p50_ms": _pct(s["latency"], 50),
+                "latency_p95_ms": _pct(s["latency"], 95),
+                "latency_p99_ms": _pct(s["latency"], 99),
+                "ttft_p50_ms": _pct(s["ttft"], 50),
+                "ttft_p95_ms": _pct(s["ttft"], 95),
+                "ttft_p99_ms": _pct(s["ttft"], 99),
+            })
+        return rows
+
+
+def _latest_result(out_dir: Path, exclude: Path):
+    files = sorted(p for p in out_dir.glob("load_*.json") if p != exclude)
+    return files[-1] if files else None
+
+
+def _compare(summary: dict, other_path: Path, tolerance: float):
+    """Różnice względem poprzedniego przebiegu; zwraca listę regresji powyżej tolerance."""
+    other = json.loads(other_path.read_text(encoding="utf-8"))["summary"]
+    print(f"[COMPARE] vs {other_path}")
+    regressions = []
+    for key in sorted(set(summary) & set(other)):
+        for metric, higher_better in COMPARE_KEYS:
+            a, b = summary[key].get(metric), other[key].get(metric)
+            if not isinstance(a, (int, float)) or not isinstance(b, (int, float)):
+                continue
+            rel = (a - b) / b if b else (0.0 if a == b else float("inf"))
+            worse = -rel if higher_better else rel
+            flag = ""
+            if worse > tolerance and (metric != "error_rate" or a - b > 0.01):
+                flag = "  <-- REGRESSION"
+                regressions.append(f"{key}.{metric}")
+            print(f"  {key}.{metric}: {b} -> {a} ({rel:+.1%}){flag}")
+    return regressions
+
+
+def main():
+    args = _parse_args()
+    if args.serve:
+        serve(args)
+        return
+    import httpx
+
+    mix = _parse_mix(args.mix)
+    phases = [p.strip() for p in args.phases.split(",") if p.strip()]
+    work = Path(tempfile.mkdtemp(prefix="bench_load_"))
+    proc, base = _start_server(args, work)
+    sampler = RssSampler(proc.pid)
+    rows = []
+    try:
+        url = f"https://www.youtube.com/watch?v={args.video_id}"
+        r = httpx.post(f"{base}/process_youtube", json={"url": url, "wait": True}, timeout=600)
+        print(f"[BENCH] indexed: {r.json().get('indexed_chunks')} chunks, rss={_rss_mb(proc.pid)} MB")
+        runner = LoadRunner(base, args)
+        # rozgrzewka (nie wchodzi do wyników) – wypełnia też pulę sesji dla eval
+        asyncio.run(runner.run_phase("warmup", {"ask": 1}, duration=2))
+
+        plan = []
+        if "isolated" in phases:
+            plan += [("isolated", {op: 1.0}) for op in mix]
+        if "mixed" in phases:
+            plan.append(("mixed", mix))
+        for name, phase_mix in plan:
+            sampler.reset()
+            phase_rows = asyncio.run(runner.run_phase(name, phase_mix, args.duration))
+            rss = sampler.window()
+            for row in phase_rows:
+                row.update(rss)
+                rows.append(row)
+                print(f"[BENCH] {row}")
+    finally:
+        sampler.stop()
+        _stop_server(proc)
+        shutil.rmtree(work, ignore_errors=True)
+
+    summary = {f"{r['phase']}.{r['endpoint']}": {k: r[k] for k, _ in COMPARE_KEYS} for r in rows}
+    result = {
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "config": {k: v for k, v in vars(args).items() if k not in ("serve", "port", "out", "compare")},
+        "cpu_count": os.cpu_count(),
+        "summary": summary,
+        "rows": rows,
+    }
+    out_dir = Path(args.out)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    out_path = out_dir / f"load_{datetime.now().strftime('%Y%m%d-%H%M%S')}.json"
+    out_path.write_text(json.dumps(result, ensure_ascii=False, indent=2), encoding="utf-8")
+    print(json.dumps({"rows": rows, "summary": summary}, ensure_ascii=False, indent=2))
+    print(f"[BENCH] results -> {out_path}")
+
+    if args.compare:
+        other = _latest_result(out_dir, out_path) if args.compare == "latest" else Path(args.compare)
+        if other is None:
+            print("[COMPARE] brak poprzedniego przebiegu")
+            return
+        regressions = _compare(summary, other, args.tolerance)
+        if regressions:
+            print(f"[COMPARE] regresje: {', '.join(regressions)}")
+            if args.fail_on_regression:
+                sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
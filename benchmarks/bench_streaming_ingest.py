@@ -0,0 +1,177 @@
+"""
+Ingest sekwencyjny vs strumieniowy: czas do pierwszego przetranskrybowanego segmentu i czas całości.
+
+Wariant "sequential" (INGEST_STREAMING=0): pobranie całego pliku -> konwersja do WAV 16 kHz mono -> transcribe_api
+(_split_audio, transkrypcja segmentów). Wariant "streaming": yt_download.stream_audio_segments (jeden proces
+ffmpeg na strumieniu pobierania) -> transcribe_stream (segmenty do Whisper w trakcie pobierania).
+"Pobieranie" to odczyt pliku AAC (ffmpeg, sygnał testowy o długości --minutes) z ograniczoną prędkością
+(--download-speed × czas rzeczywisty). Whisper: lokalny zamiennik API (local_llm_server.py, wątek w tym
+procesie); diarizacja pominięta (brak tokenu HF – mówca UNKNOWN).
+
+Wymaga ffmpeg i zależności transcribe.py (torch, pyannote.audio, soundfile).
+
+Użycie:
+    python benchmarks/bench_streaming_ingest.py --minutes 5,15,30 --download-speed 30
+"""
+import argparse
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "panel_summarizer_ai_app"))
+
+
+def _parse_args():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--minutes", default="5,15,30")
+    ap.add_argument("--download-speed", type=float, default=30, help="prędkość pobierania × czas rzeczywisty")
+    ap.add_argument("--variants", default="sequential,streaming")
+    return ap.parse_args()
+
+
+ARGS = _parse_args()
+WORK = Path(tempfile.mkdtemp(prefix="bench_stream_ingest_"))
+# konfiguracja przed importem modułów aplikacji (czytają env przy imporcie)
+os.environ["DATA_DIR"] = str(WORK / "data")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+os.environ.setdefault("TRACE_FILE", "")
+os.environ.setdefault("HUGGINGFACE_TOKEN", "offline")
+os.environ.setdefault("HF_HUB_OFFLINE", "1")
+os.environ["OPENAI_API_KEY"] = "local"
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _start_whisper_standin() -> None:
+    import uvicorn
+    import local_llm_server
+
+    port = _free_port()
+    server = uvicorn.Server(uvicorn.Config(local_llm_server.app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    os.environ["OPENAI_BASE_URL"] = f"http://127.0.0.1:{port}/v1"
+
+
+_start_whisper_standin()
+
+import transcribe  # noqa: E402
+import yt_download  # noqa: E402
+
+FIRST = {}  # czas ukończenia pierwszej transkrypcji segmentu (perf_counter)
+_inner_transcribe = transcribe._transcribe_segment
+
+
+def _timed_transcribe_segment(*args, **kwargs):
+    result = _inner_transcribe(*args, **kwargs)
+    FIRST.setdefault("t", time.perf_counter())
+    return result
+
+
+transcribe._transcribe_segment = _timed_transcribe_segment
+
+
+class ThrottledReader:
+    """Odczyt pliku z ograniczoną prędkością (udaje pobieranie)."""
+
+    def __init__(self, path: Path, bytes_per_s: float):
+        self._f = path.open("rb")
+        self._rate = bytes_per_s
+        self._started = time.perf_counter()
+        self._read = 0
+
+    def read(self, n: int = 64 * 1024) -> bytes:
+        block = self._f.read(n)
+        self._read += len(block)
+        ahead = self._read / self._rate - (time.perf_counter() - self._started)
+        if ahead > 0:
+            time.sleep(ahead)
+        return block
+
+
+def _make_source(minutes: float) -> Path:
+    out = WORK / f"source_{minutes:g}m.aac"
+    subprocess.run([yt_download._ffmpeg_bin(), "-hide_banner", "-loglevel", "error", "-y", "-f", "lavfi",
+                    "-i", "sine=frequency=440:sample_rate=44100", "-t", str(minutes * 60), "-ac", "2",
+                    "-c:a", "aac", "-b:a", "128k", "-f", "adts", str(out)], check=True)
+    return out
+
+
+def _sequential(src: Path, video_id: str, rate: float):
+    downloaded = WORK / f"{video_id}.aac"
+    reader = ThrottledReader(src, rate)
+    with downloaded.open("wb") as f:
+        while True:
+            block = reader.read()
+            if not block:
+                break
+            f.write(block)
+    wav = yt_download.audio_path_for(video_id)
+    subprocess.run([yt_download._ffmpeg_bin(), "-hide_banner", "-loglevel", "error", "-y", "-i", str(downloaded),
+                    "-ac", "1", "-ar", "16000", wav], check=True)
+    return transcribe.transcribe_api(wav)
+
+
+def _streaming(src: Path, video_id: str, rate: float):
+    url = f"https://www.youtube.com/watch?v={video_id}"
+    segments = yt_download.stream_audio_segments(url, transcribe.SEGMENT_SECONDS, transcribe.OVERLAP_SECONDS,
+                                                 source=ThrottledReader(src, rate))
+    return transcribe.transcribe_stream(segments, yt_download.audio_path_for(video_id))
+
+
+def main():
+    rows = []
+    variants = [v.strip() for v in ARGS.variants.split(",") if v.strip()]
+    try:
+        for minutes in (float(m) for m in ARGS.minutes.split(",")):
+            src = _make_source(minutes)
+            rate = src.stat().st_size / (minutes * 60 / ARGS.download_speed)
+            for variant in variants:
+                video_id = f"bench_{minutes:g}m_{variant}"
+                FIRST.clear()
+                started = time.perf_counter()
+                txt = (_sequential if variant == "sequential" else _streaming)(src, video_id, rate)
+                total = time.perf_counter() - started
+                segments = json.loads(Path(txt).with_suffix(".json").read_text(encoding="utf-8"))
+                row = {
+                    "variant": variant,
+                    "minutes": minutes,
+                    "download_s": round(minutes * 60 / ARGS.download_speed, 1),
+                    "first_segment_s": round(FIRST["t"] - started, 2) if "t" in FIRST else None,
+                    "total_s": round(total, 2),
+                    "transcript_segments": len(segments),
+                }
+                rows.append(row)
+                print(f"[BENCH] {row}")
+    finally:
+        shutil.rmtree(WORK, ignore_errors=True)
+
+    summary = {}
+    for minutes in sorted({r["minutes"] for r in rows}):
+        by = {r["variant"]: r for r in rows if r["minutes"] == minutes}
+        if by.get("sequential", {}).get("first_segment_s") and by.get("streaming", {}).get("first_segment_s"):
+            summary[f"{minutes:g}m"] = {
+                "first_segment_speedup_x": round(by["sequential"]["first_segment_s"] / by["streaming"]["first_segment_s"], 2),
+                "total_speedup_x": round(by["sequential"]["total_s"] / by["streaming"]["total_s"], 2),
+            }
+    print(json.dumps({"config": {"download_speed": ARGS.download_speed,
+                                 "segment_seconds": transcribe.SEGMENT_SECONDS,
+                                 "transcribe_workers": transcribe.TRANSCRIBE_WORKERS},
+                      "rows": rows, "summary": summary}, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
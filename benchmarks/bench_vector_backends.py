@@ -0,0 +1,133 @@
+"""
+Benchmark backendów wektorowych: Chroma (in-memory) vs FlatCollection (NumPy, float16 memmap).
+
+Mierzy czas budowy indeksu, opóźnienie zapytań (średnia/p50/p95) i RSS procesu.
+Każdy backend uruchamiany jest w osobnym procesie, żeby pomiar pamięci był niezależny.
+
+Użycie:
+    python benchmarks/bench_vector_backends.py --rows 20000 --dim 1536 --queries 200
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+APP_DIR = Path(__file__).resolve().parents[1] / "panel_summarizer_ai_app"
+sys.path.insert(0, str(APP_DIR))
+
+
+def _rss_mb() -> float:
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss / (1024 * 1024)
+    except ImportError:
+        import resource
+        # ru_maxrss: KB na Linuksie (szczytowe RSS)
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _percentile(values, p):
+    s = sorted(values)
+    if not s:
+        return 0.0
+    idx = min(len(s) - 1, int(round(p / 100.0 * (len(s) - 1))))
+    return s[idx]
+
+
+def _data(rows: int, dim: int, queries: int, seed: int = 0):
+    import numpy as np
+    rng = np.random.default_rng(seed)
+    vecs = rng.standard_normal((rows, dim), dtype=np.float32)
+    qs = rng.standard_normal((queries, dim), dtype=np.float32)
+    speakers = [f"SPEAKER_{i % 5 + 1:02d}" for i in range(rows)]
+    return vecs, qs, speakers
+
+
+def run_single(backend: str, rows: int, dim: int, queries: int, n_results: int, batch: int) -> dict:
+    vecs, qs, speakers = _data(rows, dim, queries)
+    rss_before = _rss_mb()
+    tmp = tempfile.mkdtemp(prefix="bench_flat_")
+
+    if backend == "flat":
+        from flat_index import FlatCollection
+        col = FlatCollection(tmp, "bench")
+    else:
+        import chromadb
+        col = chromadb.Client().get_or_create_collection("bench")
+
+    t0 = time.perf_counter()
+    for s in range(0, rows, batch):
+        e = min(rows, s + batch)
+        col.upsert(
+            documents=[f"chunk {i}" for i in range(s, e)],
+            metadatas=[{"id": i, "speaker": speakers[i]} for i in range(s, e)],
+            ids=[str(i) for i in range(s, e)],
+            embeddings=vecs[s:e].tolist(),
+        )
+    build_s = time.perf_counter() - t0
+    # dane wejściowe nie powinny zawyżać RSS indeksu
+    del vecs
+
+    lat = []
+    for q in qs:
+        t = time.perf_counter()
+        col.query(query_embeddings=[q.tolist()], n_results=n_results)
+        lat.append((time.perf_counter() - t) * 1000)
+
+    lat_where = []
+    for q in qs[: max(1, queries // 4)]:
+        t = time.perf_counter()
+        col.query(query_embeddings=[q.tolist()], n_results=n_results, where={"speaker": "SPEAKER_02"})
+        lat_where.append((time.perf_counter() - t) * 1000)
+
+    return {
+        "backend": backend,
+        "rows": rows,
+        "dim": dim,
+        "build_s": round(build_s, 3),
+        "query_ms_avg": round(sum(lat) / len(lat), 3),
+        "query_ms_p50": round(_percentile(lat, 50), 3),
+        "query_ms_p95": round(_percentile(lat, 95), 3),
+        "query_where_ms_avg": round(sum(lat_where) / len(lat_where), 3),
+        "rss_mb": round(_rss_mb(), 1),
+        "rss_delta_mb": round(_rss_mb() - rss_before, 1),
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--backends", default="chroma,flat")
+    ap.add_argument("--rows", type=int, default=20000)
+    ap.add_argument("--dim", type=int, default=1536)
+    ap.add_argument("--queries", type=int, default=200)
+    ap.add_argument("--n-results", type=int, default=20)
+    ap.add_argument("--batch", type=int, default=1000)
+    ap.add_argument("--single", help=argparse.SUPPRESS)
+    args = ap.parse_args()
+
+    if args.single:
+        print(json.dumps(run_single(args.single, args.rows, args.dim, args.queries, args.n_results, args.batch)))
+        return
+
+    results = []
+    for backend in [b.strip() for b in args.backends.split(",") if b.strip()]:
+        cmd = [sys.executable, __file__, "--single", backend,
+               "--rows", str(args.rows), "--dim", str(args.dim), "--queries", str(args.queries),
+               "--n-results", str(args.n_results), "--batch", str(args.batch)]
+        out = subprocess.run(cmd, capture_output=True, text=True, env=os.environ.copy())
+        if out.returncode != 0:
+            print(f"[BENCH] {backend} failed:\n{out.stderr}")
+            continue
+        res = json.loads(out.stdout.strip().splitlines()[-1])
+        results.append(res)
+        print(f"[BENCH] {res}")
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+"""
+Skalowanie przepustowości /ask_stream od 1 do N workerów uvicorn na jednej maszynie.
+
+Dla każdej liczby workerów uruchamia `uvicorn main:app --workers N` (osobny proces) w trybie
+wieloprocesowym: STATE_BACKEND=sqlite (sesje, cache, wersje indeksu), VECTOR_BACKEND=flat (indeks na
+dysku), MODEL_BACKEND=local. Indeks budowany jest raz przez /process_youtube (wait=true), potem
+--requests zapytań przy stałej współbieżności. Na końcu sprawdza, czy sesje z X-Session-Id są widoczne
+pod /sessions/{id} niezależnie od workera, który obsłużył zapytanie.
+
+Użycie:
+    python benchmarks/bench_workers.py --workers 1,2,4 --concurrency 32 --requests 400
+"""
+import argparse
+import asyncio
+import json
+import os
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+
+ROOT = Path(__file__).resolve().parents[1]
+APP_DIR = ROOT / "panel_summarizer_ai_app"
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _env(state_dir: Path, args) -> dict:
+    env = dict(os.environ)
+    env.setdefault("DATA_DIR", str(ROOT / "data"))
+    env.setdefault("MODEL_BACKEND", "local")
+    env.update({
+        "VECTOR_BACKEND": "flat",
+        "STATE_BACKEND": "sqlite",
+        "VECTOR_INDEX_DIR": str(state_dir / "index"),
+        "STATE_DB": str(state_dir / "state.sqlite"),
+        "JOBS_DB": str(state_dir / "jobs.sqlite"),
+        "ANSWER_CACHE_ENABLED": "0",
+        "LOG_LEVEL": "WARNING",
+        "LOCAL_LLM_TTFT_MS": str(args.ttft_ms),
+        "LOCAL_LLM_TOKEN_MS": str(args.token_ms),
+    })
+    return env
+
+
+def _start(workers: int, env: dict):
+    port = _free_port()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+         "--workers", str(workers), "--log-level", "warning"],
+        cwd=str(APP_DIR), env={**env, "WEB_CONCURRENCY": str(workers)},
+        stdout=subprocess.DEVNULL, start_new_session=True,
+    )
+    base = f"http://127.0.0.1:{port}"
+    deadline = time.time() + 300
+    while time.time() < deadline:
+        try:
+            if httpx.get(f"{base}/health", timeout=2).status_code == 200:
+                return proc, base
+        except httpx.HTTPError:
+            pass
+        if proc.poll() is not None:
+            raise RuntimeError(f"uvicorn zakończył się z kodem {proc.returncode}")
+        time.sleep(0.5)
+    raise TimeoutError("serwer nie wystartował")
+
+
+def _stop(proc):
+    os.killpg(proc.pid, signal.SIGTERM)
+    try:
+        proc.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        os.killpg(proc.pid, signal.SIGKILL)
+
+
+def _questions():
+    lines = (ROOT / "notes.txt").read_text(encoding="utf-8").splitlines()
+    return [ln.strip() for ln in lines if ln.strip().endswith("?") and not ln.startswith("http")] or ["O czym jest panel?"]
+
+
+def _pct(values, p):
+    values = sorted(values)
+    return round(values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))], 1) if values else None
+
+
+async def _load(base: str, n_requests: int, concurrency: int, questions, top_k: int):
+    sem = asyncio.Semaphore(concurrency)
+    latencies, session_ids, errors = [], [], 0
+    limits = httpx.Limits(max_connections=concurrency + 4, max_keepalive_connections=concurrency + 4)
+    async with httpx.AsyncClient(limits=limits, timeout=600) as client:
+        async def _one(i: int):
+            nonlocal errors
+            async with sem:
+                started = time.perf_counter()
+                try:
+                    r = await client.post(f"{base}/ask_stream",
+                                          json={"question": questions[i % len(questions)], "top_k": top_k})
+                    r.raise_for_status()
+                    latencies.append((time.perf_counter() - started) * 1000)
+                    session_ids.append(r.headers.get("x-session-id"))
+                except httpx.HTTPError:
+                    errors += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*[_one(i) for i in range(n_requests)])
+        wall = time.perf_counter() - started
+
+        # sesje zapisane przez dowolny worker muszą być widoczne z każdego (stan współdzielony)
+        sample = [sid for sid in session_ids if sid][:50]
+        found = 0
+        for sid in sample:
+            r = await client.get(f"{base}/sessions/{sid}")
+            found += r.status_code == 200 and bool(r.json().get("answer"))
+    return {
+        "requests": n_requests,
+        "errors": errors,
+        "wall_s": round(wall, 2),
+        "req_per_s": round(len(latencies) / wall, 2) if wall else None,
+        "latency_p50_ms": _pct(latencies, 50),
+        "latency_p95_ms": _pct(latencies, 95),
+        "latency_mean_ms": round(statistics.mean(latencies), 1) if latencies else None,
+        "sessions_visible": f"{found}/{len(sample)}",
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--video-id", default="Ya5Cg9qRspg")
+    ap.add_argument("--workers", default="1,2,4")
+    ap.add_argument("--concurrency", type=int, default=32)
+    ap.add_argument("--requests", type=int, default=400)
+    ap.add_argument("--top-k", type=int, default=5)
+    ap.add_argument("--ttft-ms", type=float, default=50)
+    ap.add_argument("--token-ms", type=float, default=2)
+    args = ap.parse_args()
+
+    state_dir = Path(tempfile.mkdtemp(prefix="bench_workers_"))
+    env = _env(state_dir, args)
+    questions = _questions()
+    rows = []
+    for i, n in enumerate(int(x) for x in args.workers.split(",")):
+        proc, base = _start(n, env)
+        try:
+            if i == 0:
+                url = f"https://www.youtube.com/watch?v={args.video_id}"
+                r = httpx.post(f"{base}/process_youtube", json={"url": url, "wait": True}, timeout=600)
+                print(f"[BENCH] indexed: {r.json().get('indexed_chunks')} chunks")
+            asyncio.run(_load(base, min(20, args.requests), args.concurrency, questions, args.top_k))  # rozgrzewka
+            row = {"workers": n, **asyncio.run(_load(base, args.requests, args.concurrency, questions, args.top_k))}
+            rows.append(row)
+            print(f"[BENCH] {row}")
+        finally:
+            _stop(proc)
+
+    base_rps = rows[0]["req_per_s"] if rows else None
+    for row in rows:
+        row["speedup"] = round(row["req_per_s"] / base_rps, 2) if base_rps else None
+    print(json.dumps({"cpu_count": os.cpu_count(), "concurrency": args.concurrency, "rows": rows},
+                     ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,264 @@
+"""
+Offline benchmark retrievalu i QA na zapisanych panelach (data/transcripts).
+
+Dla stałego zestawu pytań (benchmarks/questions.json, pytania z notes.txt) mierzy:
+  - opóźnienia etapów: embed, vector_query, rerank, generation (+ TTFT), evaluation,
+  - recall@k / hit@k względem chunków oznaczonych słowami kluczowymi w questions.json,
+  - metryki evaluatora (relevancy, faithfulness).
+Domyślnie działa offline: MODEL_BACKEND=local (deterministyczne embeddingi/LLM/cross-encoder z local_models.py)
+i płaski indeks w katalogu tymczasowym. Wynik zapisywany jest jako JSON do porównywania przebiegów.
+
+Użycie:
+    python benchmarks/qa_benchmark.py --top-k 5 --rerank cascade
+    python benchmarks/qa_benchmark.py --chunk-max 600 --overlap 0.1 --compare benchmarks/results/qa_<poprzedni>.json
+    python benchmarks/qa_benchmark.py --model-backend openai   # prawdziwe modele (wymaga kluczy)
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+APP_DIR = ROOT / "panel_summarizer_ai_app"
+STAGES = ["embed", "vector_query", "rerank", "generation", "evaluation"]
+
+
+class StageTimer:
+    def __init__(self):
+        self.current = {}
+
+    def reset(self):
+        self.current = {s: 0.0 for s in STAGES}
+
+    def add(self, stage: str, seconds: float):
+        self.current[stage] = self.current.get(stage, 0.0) + seconds * 1000
+
+
+class TimedEmbeddings:
+    def __init__(self, inner, timer: StageTimer):
+        self._inner, self._timer = inner, timer
+
+    def embed_query(self, text):
+        t = time.perf_counter()
+        try:
+            return self._inner.embed_query(text)
+        finally:
+            self._timer.add("embed", time.perf_counter() - t)
+
+    def embed_documents(self, texts):
+        t = time.perf_counter()
+        try:
+            return self._inner.embed_documents(texts)
+        finally:
+            self._timer.add("embed", time.perf_counter() - t)
+
+
+class TimedCollection:
+    def __init__(self, inner, timer: StageTimer):
+        self._inner, self._timer = inner, timer
+
+    def query(self, *args, **kwargs):
+        t = time.perf_counter()
+        try:
+            return self._inner.query(*args, **kwargs)
+        finally:
+            self._timer.add("vector_query", time.perf_counter() - t)
+
+
+def _timed_fn(fn, stage: str, timer: StageTimer):
+    def wrapper(*args, **kwargs):
+        t = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            timer.add(stage, time.perf_counter() - t)
+    return wrapper
+
+
+def _pct(values, p):
+    s = sorted(values)
+    if not s:
+        return 0.0
+    return s[min(len(s) - 1, int(round(p / 100.0 * (len(s) - 1))))]
+
+
+def _is_relevant(text: str, groups) -> bool:
+    low = (text or "").lower()
+    return all(any(k.lower() in low for k in g) for g in groups)
+
+
+def _load_chunks(video_id: str, args):
+    tdir = ROOT / "data" / "transcripts"
+    if args.chunk_min is None and args.chunk_max is None and args.overlap is None:
+        return json.loads((tdir / f"{video_id}_chunks.json").read_text(encoding="utf-8"))
+    from chunking import chunk_segments, load_segments
+    return chunk_segments(
+        load_segments(tdir / f"{video_id}.json"),
+        chunk_min_tokens=args.chunk_min if args.chunk_min is not None else 400,
+        chunk_max_tokens=args.chunk_max if args.chunk_max is not None else 1000,
+        overlap_ratio=args.overlap if args.overlap is not None else 0.15,
+    )
+
+
+def _compare(summary: dict, other_path: str):
+    other = json.loads(Path(other_path).read_text(encoding="utf-8"))["summary"]
+    print(f"[COMPARE] vs {other_path}")
+    for key in sorted(set(summary) & set(other)):
+        a, b = summary[key], other[key]
+        if isinstance(a, dict):
+            for sub in a:
+                if sub in b:
+                    print(f"  {key}.{sub}: {b[sub]} -> {a[sub]} ({a[sub] - b[sub]:+.3f})")
+        elif isinstance(a, (int, float)) and isinstance(b, (int, float)):
+            print(f"  {key}: {b} -> {a} ({a - b:+.3f})")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--questions", default=str(ROOT / "benchmarks" / "questions.json"))
+    ap.add_argument("--top-k", type=int, default=5)
+    ap.add_argument("--rerank", choices=["cascade", "full", "none"], default="cascade")
+    ap.add_argument("--model-backend", default=os.getenv("MODEL_BACKEND", "local"))
+    ap.add_argument("--vector-backend", default=os.getenv("VECTOR_BACKEND", "flat"))
+    ap.add_argument("--chunk-min", type=int)
+    ap.add_argument("--chunk-max", type=int)
+    ap.add_argument("--overlap", type=float)
+    ap.add_argument("--no-eval", action="store_true")
+    ap.add_argument("--out", default=str(ROOT / "benchmarks" / "results"))
+    ap.add_argument("--compare", help="poprzedni plik wyników do porównania")
+    args = ap.parse_args()
+
+    # konfiguracja musi być ustawiona przed importem modułów aplikacji
+    os.environ.setdefault("DATA_DIR", str(ROOT / "data"))
+    os.environ["MODEL_BACKEND"] = args.model_backend
+    os.environ["VECTOR_BACKEND"] = args.vector_backend
+    os.environ["VECTOR_INDEX_DIR"] = tempfile.mkdtemp(prefix="qa_bench_index_")
+    sys.path.insert(0, str(APP_DIR))
+
+    import vectors_repository as vr
+    import summarizer
+    import evaluator
+
+    questions = json.loads(Path(args.questions).read_text(encoding="utf-8"))
+    timer = StageTimer()
+
+    col = vr.get_collection("qa_bench")
+    relevant_ids = {}
+    t0 = time.perf_counter()
+    for vid in sorted({q["video_id"] for q in questions}):
+        chunks = _load_chunks(vid, args)
+        vr.store_chunks(col, chunks, video_id=vid)
+        for q in questions:
+            if q["video_id"] == vid:
+                relevant_ids[q["id"]] = {c.get("id", i) for i, c in enumerate(chunks) if _is_relevant(c["text"], q["relevant"])}
+    index_s = time.perf_counter() - t0
+
+    # pomiar etapów przez owinięcie punktów wywołań
+    vr.embedding = TimedEmbeddings(vr.embedding, timer)
+    vr._cross_encode_rerank = _timed_fn(vr._cross_encode_rerank, "rerank", timer)
+    tcol = TimedCollection(col, timer)
+
+    rows = []
+    for q in questions:
+        timer.reset()
+        where = {"video_id": q["video_id"]}
+        k = args.top_k
+        stats = {}
+        if args.rerank == "cascade":
+            ctxs = vr.query_and_rerank_cascade(tcol, q["question"], top_k=k, where=where, stats=stats)
+        else:
+            n = 20 if args.rerank == "full" else k
+            ctxs = vr._build_contexts_from_query(vr.query_db(tcol, q["question"], n_results=n, where=where))
+            ctxs = vr._cross_encode_rerank(q["question"], ctxs, k) if args.rerank == "full" else ctxs[:k]
+
+        t = time.perf_counter()
+        ttft = None
+        parts = []
+        for delta in summarizer.answer(ctxs, q["question"], top_k=len(ctxs)):
+            if ttft is None:
+                ttft = (time.perf_counter() - t) * 1000
+            parts.append(delta)
+        timer.add("generation", time.perf_counter() - t)
+        answer_text = "".join(parts)
+
+        metrics = {}
+        if not args.no_eval:
+            t = time.perf_counter()
+            metrics = evaluator.evaluate_answer_crossencoder(q["question"], answer_text, ctxs)
+            timer.add("evaluation", time.perf_counter() - t)
+
+        rel = relevant_ids.get(q["id"], set())
+        got = [c.get("id") for c in ctxs]
+        hits = sum(1 for i in got if i in rel)
+        rows.append({
+            "id": q["id"],
+            "stages_ms": {s: round(v, 3) for s, v in timer.current.items()},
+            "ttft_ms": round(ttft or 0.0, 3),
+            "cascade_path": stats.get("path"),
+            "retrieved_ids": got,
+            "relevant_count": len(rel),
+            "recall_at_k": round(hits / max(1, min(k, len(rel))), 4) if rel else None,
+            "hit_at_k": bool(hits) if rel else None,
+            "relevancy": metrics.get("relevancy"),
+            "faithfulness": metrics.get("faithfulness"),
+            "answer_chars": len(answer_text),
+        })
+        print(f"[QA_BENCH] {q['id']}: {rows[-1]['stages_ms']} recall@{k}={rows[-1]['recall_at_k']}")
+
+    def _mean(key):
+        vals = [r[key] for r in rows if r[key] is not None]
+        return round(statistics.mean(vals), 4) if vals else None
+
+    summary = {
+        "index_build_s": round(index_s, 3),
+        "stages_ms": {
+            s: round(statistics.mean(r["stages_ms"][s] for r in rows), 3) for s in STAGES
+        },
+        "stages_p95_ms": {
+            s: round(_pct([r["stages_ms"][s] for r in rows], 95), 3) for s in STAGES
+        },
+        "ttft_ms": _mean("ttft_ms"),
+        "recall_at_k": _mean("recall_at_k"),
+        "hit_at_k": _mean("hit_at_k"),
+        "relevancy": _mean("relevancy"),
+        "faithfulness": _mean("faithfulness"),
+    }
+    result = {
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "config": {
+            "top_k": args.top_k,
+            "rerank": args.rerank,
+            "model_backend": args.model_backend,
+            "vector_backend": args.vector_backend,
+            "chunk_min": args.chunk_min,
+            "chunk_max": args.chunk_max,
+            "overlap": args.overlap,
+            "cross_encoder": getattr(vr, "CROSS_ENCODER_MODEL", None),
+            "cascade": {
+                "max_candidates": vr.CASCADE_MAX_CANDIDATES,
+                "skip_gap": vr.CASCADE_SKIP_GAP,
+                "margin": vr.CASCADE_MARGIN,
+                "step": vr.CASCADE_STEP,
+            },
+        },
+        "summary": summary,
+        "rows": rows,
+    }
+
+    out_dir = Path(args.out)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    out_path = out_dir / f"qa_{datetime.now().strftime('%Y%m%d-%H%M%S')}.json"
+    out_path.write_text(json.dumps(result, ensure_ascii=False, indent=2), encoding="utf-8")
+    print(json.dumps(summary, ensure_ascii=False, indent=2))
+    print(f"[QA_BENCH] results -> {out_path}")
+    if args.compare:
+        _compare(summary, args.compare)
+
+
+if __name__ == "__main__":
+    main()
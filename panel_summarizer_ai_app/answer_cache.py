@@ -0,0 +1,176 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from shared_state import SHARED_STATE, connect, register_schema
+
+# Semantyczny cache odpowiedzi /ask_stream: zakres = (kolekcja, video_id, top_k) – odpowiedź z top_k=10
+# kontekstów nie jest odtwarzana dla pytania z top_k=3 (i odwrotnie); wpis ważny tylko dla wersji
+# indeksu, przy której powstał (vectors_repository.index_version – podbijana przy każdym store_chunks).
+# Trafienie = pytanie o podobieństwie kosinusowym embeddingu >= ANSWER_CACHE_THRESHOLD.
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "1") != "0"
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.92"))
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "200"))  # na zakres
+ANSWER_CACHE_REPLAY_CHARS = int(os.getenv("ANSWER_CACHE_REPLAY_CHARS", "48"))
+# STATE_BACKEND=sqlite: wpisy w tabeli answer_cache stanu współdzielonego (wspólne dla workerów);
+# statystyki trafień pozostają per proces
+
+register_schema("""
+CREATE TABLE IF NOT EXISTS answer_cache (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    scope TEXT NOT NULL,
+    version INTEGER NOT NULL,
+    vec BLOB NOT NULL,
+    question TEXT,
+    answer TEXT,
+    contexts TEXT,
+    hits INTEGER DEFAULT 0,
+    created_at REAL,
+    used_at REAL
+);
+CREATE INDEX IF NOT EXISTS answer_cache_scope ON answer_cache (scope, version);
+""")
+
+Scope = Tuple[str, Optional[str], int]
+
+_lock = threading.Lock()
+_scopes: Dict[Scope, "OrderedDict[int, Dict[str, Any]]"] = {}
+_next_id = 0
+_stats = {"hits": 0, "misses": 0, "stores": 0, "invalidated": 0}
+
+
+def _unit(vec) -> np.ndarray:
+    v = np.asarray(vec, dtype=np.float32)
+    return v / max(float(np.linalg.norm(v)), 1e-12)
+
+
+def _scope_key(collection_name: str, video_id: Optional[str], top_k: int) -> str:
+    return f"{collection_name}|{video_id or ''}|{int(top_k)}"
+
+
+def _lookup_shared(scope: str, q: np.ndarray, version: int) -> Optional[Dict[str, Any]]:
+    conn = connect()
+    stale = conn.execute("DELETE FROM answer_cache WHERE scope=? AND version!=?", (scope, version)).rowcount
+    rows = conn.execute("SELECT id, vec FROM answer_cache WHERE scope=? AND version=?", (scope, version)).fetchall()
+    with _lock:
+        _stats["invalidated"] += max(0, stale)
+    if not rows:
+        return None
+    sims = np.frombuffer(b"".join(r["vec"] for r in rows), dtype=np.float32).reshape(len(rows), -1) @ q
+    best = int(np.argmax(sims))
+    if float(sims[best]) < ANSWER_CACHE_THRESHOLD:
+        return None
+    eid = rows[best]["id"]
+    conn.execute("UPDATE answer_cache SET hits=hits+1, used_at=? WHERE id=?", (time.time(), eid))
+    row = conn.execute("SELECT * FROM answer_cache WHERE id=?", (eid,)).fetchone()
+    return {
+        "question": row["question"], "version": row["version"], "answer": row["answer"],
+        "contexts": json.loads(row["contexts"]), "created_at": row["created_at"], "hits": row["hits"],
+        "similarity": float(sims[best]),
+    }
+
+
+def _store_shared(scope: str, question: str, vec: np.ndarray, version: int, answer: str,
+                  contexts: List[Dict[str, Any]]):
+    conn = connect()
+    now = time.time()
+    conn.execute(
+        "INSERT INTO answer_cache (scope, version, vec, question, answer, contexts, created_at, used_at) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+        (scope, version, vec.astype(np.float32).tobytes(), question, answer,
+         json.dumps(contexts, ensure_ascii=False, default=str), now, now),
+    )
+    conn.execute(
+        "DELETE FROM answer_cache WHERE scope=? AND id IN ("
+        "SELECT id FROM answer_cache WHERE scope=? ORDER BY used_at DESC LIMIT -1 OFFSET ?)",
+        (scope, scope, ANSWER_CACHE_MAX_ENTRIES),
+    )
+
+
+def lookup(collection_name: str, video_id: Optional[str], q_vec, version: int,
+           top_k: int) -> Optional[Dict[str, Any]]:
+    """Najbardziej podobny wpis z bieżącej wersji indeksu powyżej progu albo None."""
+    if not ANSWER_CACHE_ENABLED:
+        return None
+    q = _unit(q_vec)
+    if SHARED_STATE:
+        hit = _lookup_shared(_scope_key(collection_name, video_id, top_k), q, version)
+        with _lock:
+            _stats["hits" if hit else "misses"] += 1
+        return hit
+    with _lock:
+        entries = _scopes.get((collection_name, video_id, int(top_k)))
+        best, best_sim = None, -1.0
+        if entries:
+            for eid in [eid for eid, e in entries.items() if e["version"] != version]:
+                del entries[eid]
+                _stats["invalidated"] += 1
+            for eid, e in entries.items():
+                sim = float(np.dot(q, e["vec"]))
+                if sim > best_sim:
+                    best, best_sim = eid, sim
+        if best is None or best_sim < ANSWER_CACHE_THRESHOLD:
+            _stats["misses"] += 1
+            return None
+        entries.move_to_end(best)
+        entry = entries[best]
+        entry["hits"] += 1
+        _stats["hits"] += 1
+        return {**entry, "similarity": best_sim}
+
+
+def store(collection_name: str, video_id: Optional[str], question: str, q_vec, version: int,
+          answer: str, contexts: List[Dict[str, Any]], top_k: int):
+    global _next_id
+    if not ANSWER_CACHE_ENABLED or not answer.strip():
+        return
+    if SHARED_STATE:
+        _store_shared(_scope_key(collection_name, video_id, top_k), question, _unit(q_vec), version, answer, contexts)
+        with _lock:
+            _stats["stores"] += 1
+        return
+    with _lock:
+        entries = _scopes.setdefault((collection_name, video_id, int(top_k)), OrderedDict())
+        _next_id += 1
+        entries[_next_id] = {
+            "question": question,
+            "vec": _unit(q_vec),
+            "version": version,
+            "answer": answer,
+            "contexts": contexts,
+            "created_at": time.time(),
+            "hits": 0,
+        }
+        while len(entries) > ANSWER_CACHE_MAX_ENTRIES:
+            entries.popitem(last=False)
+        _stats["stores"] += 1
+
+
+def replay(answer: str):
+    """Odtwarza zapisaną odpowiedź jako strumień (porcje ANSWER_CACHE_REPLAY_CHARS znaków)."""
+    step = max(1, ANSWER_CACHE_REPLAY_CHARS)
+    for i in range(0, len(answer), step):
+        yield answer[i:i + step]
+
+
+def answer_cache_stats() -> Dict[str, Any]:
+    if SHARED_STATE:
+        row = connect().execute("SELECT COUNT(*) AS n, COUNT(DISTINCT scope) AS s FROM answer_cache").fetchone()
+        entries, scopes = row["n"], row["s"]
+    else:
+        with _lock:
+            entries, scopes = sum(len(e) for e in _scopes.values()), len(_scopes)
+    with _lock:
+        return {
+            **_stats,
+            "enabled": ANSWER_CACHE_ENABLED,
+            "threshold": ANSWER_CACHE_THRESHOLD,
+            "entries": entries,
+            "scopes": scopes,
+            "backend": "sqlite" if SHARED_STATE else "memory",
+        }
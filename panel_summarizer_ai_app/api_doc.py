@@ -22,13 +22,115 @@ def documentation():
                     "transcripts_sample": "lista kilku plików (jeśli istnieją)"
                 }
             },
+            {
+                "method": "GET",
+                "path": "/index/manifest",
+                "description": "Manifest indeksu: filmy zapisane w kolekcji.",
+                "input": "brak",
+                "output": {
+                    "collection": "nazwa kolekcji",
+                    "path": "plik manifestu (null – tylko w pamięci)",
+                    "videos": "lista wpisów: video_id, chunk_hash, embedding_model, chunks, source (ścieżka, rozmiar, mtime pliku chunków), indexed_at"
+                }
+            },
+            {
+                "method": "GET",
+                "path": "/metrics",
+                "description": "Metryki Prometheus: tokeny, TTFT, tokeny/s, czasy etapów i endpointów.",
+                "input": "brak",
+                "output": "text/plain (format ekspozycji Prometheus)"
+            },
             {
                 "method": "POST",
                 "path": "/process_youtube",
-                "description": "Pobiera audio z YouTube, transkrybuje i buduje chanki. Jeśli istnieją kompletne pliki, używa ich.",
+                "description": "Zgłasza zadanie w tle: pobranie audio z YouTube, transkrypcja, chunking i indeks. Jeśli istnieją kompletne pliki, używa ich. To samo video_id w trakcie przetwarzania dostaje istniejące zadanie.",
                 "input": {
-                    "json": {"url": "pełny URL filmu YouTube"}
+                    "json": {
+                        "url": "pełny URL filmu YouTube",
+                        "precompute_summary": "bool, podsumowanie w tle po chunkingu (domyślnie false)",
+                        "summary_max_tokens": "int (domyślnie 2000)",
+                        "force_reindex": "bool, ponowne embedowanie i zapis chunków mimo zgodnego manifestu indeksu (domyślnie false)",
+                        "wait": "bool, czekaj na wynik zamiast zwracać job_id (domyślnie false)"
+                    }
                 },
+                "output": {
+                    "job_id": "ID zadania",
+                    "status": "queued | running | done | error",
+                    "video_id": "ID filmu",
+                    "deduplicated": "bool, true gdy dołączono do trwającego zadania"
+                },
+                "notes": [
+                    "Przy pełnej kolejce (JOB_MAX_PENDING) zwraca 429.",
+                    "Przy wait=true zwraca wynik jak /jobs/{job_id}/result.",
+                    "Znany film z niezmienionymi chunkami i tym samym modelem embeddingów nie jest indeksowany ponownie (manifest indeksu, GET /index/manifest)."
+                ]
+            },
+            {
+                "method": "POST",
+                "path": "/process_bulk",
+                "description": "Zgłasza ingest wielu filmów jako jedno zadanie w tle: playlisty i kanały rozwijane są do listy filmów, potem potok pobranie -> transkrypcja -> indeks z osobną współbieżnością etapów. Filmy już zindeksowane są pomijane.",
+                "input": {
+                    "json": {
+                        "urls": "lista URL: filmy, playlisty (list=...), kanały (@nazwa, /channel/..., /c/..., /user/...)",
+                        "precompute_summary": "bool, podsumowanie w tle dla każdego nowego filmu (domyślnie false)",
+                        "summary_max_tokens": "int (domyślnie 2000)",
+                        "force_reindex": "bool, przetwarzaj i indeksuj także filmy z manifestu (domyślnie false)",
+                        "max_videos": "int, limit filmów po rozwinięciu (maks. BULK_MAX_VIDEOS)",
+                        "wait": "bool, czekaj na raport końcowy zamiast zwracać job_id (domyślnie false)"
+                    }
+                },
+                "output": {
+                    "job_id": "ID zadania",
+                    "status": "queued | running | done | error",
+                    "sources": "liczba podanych URL",
+                    "deduplicated": "bool, true gdy ten sam zestaw URL jest już przetwarzany"
+                },
+                "notes": [
+                    "Pusta lista URL – 422; pełna kolejka zadań (JOB_MAX_PENDING) – 429.",
+                    "Współbieżność etapów: BULK_DOWNLOAD_CONCURRENCY, BULK_TRANSCRIBE_CONCURRENCY, BULK_INDEX_CONCURRENCY; kolejki między etapami: BULK_QUEUE_SIZE.",
+                    "Przy wait=true zwraca raport jak GET /process_bulk/{job_id}.",
+                    "Każdy film jest zadaniem ingest_youtube z tym samym kluczem co /process_youtube – ponowne zgłoszenie filmu w trakcie bulk dostaje to zadanie; zadania bulk mają własną pulę BULK_JOB_WORKERS."
+                ]
+            },
+            {
+                "method": "GET",
+                "path": "/process_bulk/{job_id}",
+                "description": "Postęp zadania bulk: na żywo w trakcie, raport końcowy po zakończeniu.",
+                "input": "brak",
+                "output": {
+                    "id / status / stage": "jak GET /jobs/{job_id}",
+                    "videos": "liczba filmów po rozwinięciu źródeł",
+                    "counts": "liczba filmów per status: queued | download | transcribe | index | done | skipped | error",
+                    "wall_s": "czas od startu",
+                    "throughput": "videos_per_hour, audio_hours, audio_realtime_factor (godziny audio na godzinę pracy)",
+                    "stages": "per etap: concurrency, items, busy_s, avg_s, utilization",
+                    "sources": "źródła: url, kind (video | playlist | channel), liczba filmów, błąd rozwinięcia",
+                    "results": "per film: video_id, status, stage_s (czasy etapów), audio_s, indexed_chunks, index (indexed | unchanged), summary_job, error"
+                },
+                "notes": [
+                    "404 gdy job_id nie jest zadaniem bulk."
+                ]
+            },
+            {
+                "method": "GET",
+                "path": "/jobs/{job_id}",
+                "description": "Status zadania w tle.",
+                "input": "brak",
+                "output": {
+                    "id": "ID zadania",
+                    "kind": "rodzaj zadania (ingest_youtube | ingest_bulk)",
+                    "key": "klucz deduplikacji (video_id; dla ingest_bulk hash zestawu URL i opcji)",
+                    "status": "queued | running | done | error",
+                    "stage": "etap: queued | running | download | transcribe | chunk | index | done",
+                    "error": "komunikat błędu (gdy error)",
+                    "created_at / started_at / finished_at": "znaczniki czasu (epoch)"
+                }
+            },
+            {
+                "method": "GET",
+                "path": "/jobs/{job_id}/result",
+                "description": "Wynik zadania: 202 gdy trwa, 500 z błędem, 200 z wynikiem.",
+                "input": "brak",
                 "output": {
                     "mode": "reuse_existing | processed_new",
                     "video_id": "ID filmu",
@@ -36,7 +138,10 @@ def documentation():
                     "transcript_txt": "ścieżka do TXT transkryptu",
                     "transcript_json": "ścieżka do JSON transkryptu",
                     "chunks_json": "ścieżka do JSON z chunkami",
-                    "indexed_chunks": "liczba zindeksowanych chunków"
+                    "indexed_chunks": "liczba chunków filmu w indeksie",
+                    "index": "indexed | unchanged (unchanged – manifest zgodny, bez embedowania i zapisu)",
+                    "summary_job": "status podsumowania w tle (gdy precompute_summary)",
+                    "job_id": "ID zadania"
                 }
             },
             {
@@ -47,7 +152,8 @@ def documentation():
                     "json": {
                         "override_text": "opcjonalny surowy tekst do streszczenia",
                         "video_id": "opcjonalne ID filmu do odnalezienia plików",
-                        "max_tokens": "int, limit tokenów podsumowania (domyślnie 800)"
+                        "max_tokens": "int, limit tokenów podsumowania (domyślnie 800)",
+                        "progress": "bool, linie [POSTĘP] map-reduce przed podsumowaniem (domyślnie false)"
                     }
                 },
                 "output": "text/event-stream (StreamingResponse) – napływający tekst podsumowania"
@@ -64,19 +170,112 @@ def documentation():
                 },
                 "output": "text/event-stream (StreamingResponse) – napływający tekst odpowiedzi",
                 "notes": [
-                    "Globalna zmienna LAST_USED_CONTEXTS przechowuje konteksty użyte w ostatnim wywołaniu."
+                    "Nagłówek X-Session-Id: konteksty i odpowiedź zapisane są w sesji (/sessions/{session_id})."
+                ]
+            },
+            {
+                "method": "POST",
+                "path": "/ask_ndjson",
+                "description": "Jeden strumień NDJSON na pytanie: konteksty, delty odpowiedzi i metryki CE.",
+                "input": {
+                    "json": {
+                        "question": "pytanie użytkownika",
+                        "top_k": "int, liczba kontekstów do pobrania (domyślnie 5)",
+                        "video_id": "opcjonalne zawężenie do jednego filmu",
+                        "include_metrics": "bool, czekaj na ewaluację CE (domyślnie true)"
+                    }
+                },
+                "output": "application/x-ndjson – jeden obiekt JSON na linię",
+                "notes": [
+                    "Kolejność zdarzeń: session {session_id, trace_id} -> contexts {contexts, cached} -> delta {text}... -> answer_done {timings} -> metrics {metrics_ce} -> done.",
+                    "Przy błędzie: error {error, session_id}."
+                ]
+            },
+            {
+                "method": "POST",
+                "path": "/ask_batch",
+                "description": (
+                    "Wiele pytań w jednym żądaniu (np. raport offline): jedno wywołanie embeddingów, jedno zapytanie "
+                    "wektorowe i jeden przebieg cross-encodera dla wszystkich pytań; odpowiedzi generowane z "
+                    "ograniczoną współbieżnością (ASK_BATCH_CONCURRENCY) i wysyłane w kolejności ukończenia."
+                ),
+                "input": {
+                    "questions": "lista pytań (maks. ASK_BATCH_MAX_QUESTIONS); każde traktowane jako jedno pytanie",
+                    "top_k": "int, domyślnie 5",
+                    "video_id": "opcjonalnie – zawęża retrieval do jednego filmu",
+                    "use_cache": "bool, domyślnie true – cache odpowiedzi",
+                    "include_contexts": "bool, domyślnie false – konteksty w zdarzeniach result"
+                },
+                "output": "application/x-ndjson – jeden obiekt JSON na linię",
+                "notes": [
+                    "Kolejność zdarzeń: batch {count, trace_id} -> retrieval {retrieval_s, cached, retrieved, duplicates} -> result {index, question, session_id, answer, cached, answer_s}... -> done.",
+                    "index = pozycja pytania w liście questions; błąd pojedynczego pytania: error {index, question, error}.",
+                    "Każde pytanie ma własną sesję (/sessions/{session_id}, /ask_eval_ce z session_id); powtórzone pytania liczone są raz."
                 ]
             },
             {
                 "method": "GET",
-                "path": "/used_contexts",
-                "description": "Zwraca ostatnio użyte konteksty (bez ponownego zapytania do bazy).",
+                "path": "/sessions/{session_id}",
+                "description": "Zapisana sesja odpowiedzi (404 po wygaśnięciu).",
                 "input": "brak",
                 "output": {
-                    "count": "liczba kontekstów",
-                    "contexts": "[{text, speaker, start, end}]"
+                    "session_id": "ID sesji",
+                    "question": "pytanie",
+                    "status": "retrieving | answering | answered | done | error",
+                    "contexts": "[{text, speaker, start, end, ...}]",
+                    "answer": "pełna odpowiedź",
+                    "metrics_ce": "metryki CE (gdy policzone)"
+                }
+            },
+            {
+                "method": "GET",
+                "path": "/traces/{trace_id}",
+                "description": "Waterfall jednego żądania (id z nagłówka X-Trace-Id) lub zadania w tle (trace_id = job_id).",
+                "input": "query: format=json|text (domyślnie json)",
+                "output": {
+                    "trace_id": "ID śladu",
+                    "name": "np. POST /ask_ndjson albo job ingest_youtube",
+                    "duration_ms": "czas całego żądania (dla strumieni – do końca strumienia)",
+                    "spans": "[{span_id, parent_id, name, start_ms, duration_ms, attrs, events, error}]",
+                    "waterfall": "linie wykresu kaskadowego (format=text – tylko on, jako tekst)"
                 }
             },
+            {
+                "method": "GET",
+                "path": "/traces",
+                "description": "Ostatnie ślady tego procesu (query: limit).",
+                "input": "query: limit (domyślnie 20)",
+                "output": {"traces": "[{trace_id, name, started_at, duration_ms, spans}]"}
+            },
+            {
+                "method": "GET",
+                "path": "/used_contexts",
+                "description": "Konteksty sesji (?session_id=...).",
+                "input": "query: session_id (wymagane)",
+                "output": {
+                    "session_id": "ID sesji",
+                    "contexts": "[{text, speaker, start, end}]"
+                },
+                "notes": [
+                    "Bez session_id – 400 (brak fallbacku na ostatnią sesję); nieznana sesja – 404."
+                ]
+            },
+            {
+                "method": "POST",
+                "path": "/ask_eval_ce",
+                "description": "Metryki cross-encodera (relevancy, faithfulness) dla odpowiedzi sesji.",
+                "input": {"json": {"question": "pytanie", "session_id": "ID sesji (wymagane)"}},
+                "output": {
+                    "session_id": "ID sesji",
+                    "question": "pytanie sesji",
+                    "answer": "odpowiedź sesji",
+                    "metrics_ce": "metryki CE",
+                    "used_contexts_count": "liczba kontekstów"
+                },
+                "notes": [
+                    "Bez session_id – 400; nieznana sesja – 404; odpowiedź jeszcze generowana (status retrieving/answering) – 409."
+                ]
+            },
             {
                 "method": "GET",
                 "path": "/",
@@ -91,7 +290,8 @@ def documentation():
         ],
         "notes": [
             "Endpointy /summarize oraz /ask zwracają StreamingResponse (tekst napływa fragmentami).",
-            "Użyj /used_contexts po zakończeniu streamu /ask, aby podejrzeć konteksty.",
-            "Proces /process_youtube indeksuje chanki do kolekcji wektorowej 'panel'."
+            "/ask_ndjson zwraca konteksty, odpowiedź i metryki w jednym strumieniu; dane sesji pod /sessions/{session_id}.",
+            "Proces /process_youtube indeksuje chanki do kolekcji wektorowej 'panel'.",
+            "Każda odpowiedź (poza /metrics, /health, /jobs, /traces) ma nagłówek X-Trace-Id; szczegóły pod /traces/{trace_id}."
         ]
     }
\ No newline at end of file
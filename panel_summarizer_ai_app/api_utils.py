@@ -1,12 +1,17 @@
 import os
 import json
 from pathlib import Path
-from typing import Any, List, Dict
+from typing import Any, List, Dict, Optional
 
 from config import DATA_DIR
-from vectors_repository import get_collection, query_and_rerank_crossencoder
+from async_utils import run_cpu
+from vectors_repository import (
+    get_collection, query_and_rerank_crossencoder, query_and_rerank_cascade, query_and_rerank_batch,
+    aembed_question, aembed_questions,
+)
 
 COLLECTION_NAME_DEFAULT = os.getenv("COLLECTION_NAME", "panel")
+RETRIEVAL_CASCADE = os.getenv("RETRIEVAL_CASCADE", "1") != "0"
 
 def resolve_text_for_summarize(data: Any) -> str:
     """
@@ -69,11 +74,59 @@ def resolve_text_for_summarize(data: Any) -> str:
     raise FileNotFoundError(f"Brak transkryptów w {tdir} (TXT/JSON/_chunks.json)")
 
 
-def build_contexts_for_ask(question: str, top_k: int, collection_name: str = COLLECTION_NAME_DEFAULT) -> List[Dict]:
+def build_contexts_for_ask(question: str, top_k: int, collection_name: str = COLLECTION_NAME_DEFAULT,
+                           where: Optional[Dict[str, Any]] = None, q_vec: Optional[List[float]] = None) -> List[Dict]:
     """
-    Pobiera 20 kandydatów z wektorów i zwraca top_k (max 20) po rerankingu cross-encoderem.
+    Zwraca top_k (max 20) kontekstów. Domyślnie kaskada: reranking cross-encoderem tylko tyle kandydatów,
+    ile wynika z top_k i rozrzutu odległości (RETRIEVAL_CASCADE=0 -> zawsze 20 kandydatów i pełny reranking).
     """
     col = get_collection(collection_name)
+    k = min(int(top_k or 5), 20)
+    if RETRIEVAL_CASCADE:
+        return query_and_rerank_cascade(col, question, top_k=k, where=where, q_vec=q_vec)
     n_candidates = 20
+    return query_and_rerank_crossencoder(col, question, n_candidates=n_candidates, top_k=k, where=where, q_vec=q_vec)
+
+
+def build_contexts_for_ask_batch(questions: List[str], top_k: int,
+                                 collection_name: str = COLLECTION_NAME_DEFAULT,
+                                 where: Optional[Dict[str, Any]] = None) -> List[List[Dict]]:
+    """Osobne top_k kontekstów dla każdego pod-pytania – embeddingi i reranking liczone wsadowo."""
+    col = get_collection(collection_name)
+    k = min(int(top_k or 5), 20)
+    return query_and_rerank_batch(col, questions, top_k=k, where=where)
+
+
+async def abuild_contexts_for_ask(question: str, top_k: int, collection_name: str = COLLECTION_NAME_DEFAULT,
+                                  where: Optional[Dict[str, Any]] = None,
+                                  q_vec: Optional[List[float]] = None) -> List[Dict]:
+    """Async: embedding pytania przez klienta async, zapytanie do indeksu i reranking w puli CPU."""
+    if q_vec is None:
+        q_vec = await aembed_question(question)
+    return await run_cpu(build_contexts_for_ask, question, top_k, collection_name, where=where, q_vec=q_vec)
+
+
+async def abuild_contexts_for_ask_batch(questions: List[str], top_k: int,
+                                        collection_name: str = COLLECTION_NAME_DEFAULT,
+                                        where: Optional[Dict[str, Any]] = None,
+                                        q_vecs: Optional[List[List[float]]] = None) -> List[List[Dict]]:
+    """Async: jedno wywołanie embeddingów dla wszystkich pytań (albo gotowe q_vecs), retrieval w puli CPU."""
+    if q_vecs is None:
+        q_vecs = await aembed_questions(questions)
+    col = get_collection(collection_name)
     k = min(int(top_k or 5), 20)
-    return query_and_rerank_crossencoder(col, question, n_candidates=n_candidates, top_k=k)
\ No newline at end of file
+    return await run_cpu(query_and_rerank_batch, col, questions, top_k=k, where=where, q_vecs=q_vecs)
+
+
+def merge_contexts(per_question: List[List[Dict]]) -> List[Dict]:
+    """Scala konteksty pod-pytań bez duplikatów (kolejność: pierwsze wystąpienie)."""
+    seen = set()
+    merged: List[Dict] = []
+    for ctxs in per_question:
+        for c in ctxs:
+            key = (c.get("id"), c.get("start"), c.get("speaker"), (c.get("text") or "")[:64])
+            if key in seen:
+                continue
+            seen.add(key)
+            merged.append(c)
+    return merged
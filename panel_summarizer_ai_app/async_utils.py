@@ -0,0 +1,40 @@
+import asyncio
+import contextvars
+import functools
+import os
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable
+
+# Osobna pula wątków dla pracy CPU (reranking cross-encoderem, zapytania do indeksu, pakowanie tekstu)
+# wywoływanej z endpointów async – pętla zdarzeń i pula wątków Starlette pozostają wolne.
+CPU_EXECUTOR_WORKERS = int(os.getenv("CPU_EXECUTOR_WORKERS", str(min(8, os.cpu_count() or 4))))
+
+_executor = ThreadPoolExecutor(max_workers=CPU_EXECUTOR_WORKERS, thread_name_prefix="cpu")
+# Blokujące wywołania stanu (sesje, cache odpowiedzi, wersje indeksu – przy STATE_BACKEND=sqlite zapisy
+# z BEGIN IMMEDIATE i czekaniem na blokadę bazy) w osobnej puli: czekanie na blokadę nie wstrzymuje pętli
+# zdarzeń (wszystkich otwartych strumieni) ani nie zajmuje wątków pracy CPU.
+STATE_IO_WORKERS = int(os.getenv("STATE_IO_WORKERS", "8"))
+
+_io_executor = ThreadPoolExecutor(max_workers=STATE_IO_WORKERS, thread_name_prefix="state-io")
+
+
+async def _run_in(executor: ThreadPoolExecutor, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+    loop = asyncio.get_running_loop()
+    # kopia kontekstu (contextvars) – spany z wątku puli trafiają do śladu wywołującego żądania
+    ctx = contextvars.copy_context()
+    return await loop.run_in_executor(executor, functools.partial(ctx.run, fn, *args, **kwargs))
+
+
+async def run_cpu(fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+    """Uruchamia fn(*args, **kwargs) w puli CPU i czeka na wynik bez blokowania pętli."""
+    return await _run_in(_executor, fn, *args, **kwargs)
+
+
+async def run_io(fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+    """Jak run_cpu, ale w puli blokującego I/O stanu (sesje, cache odpowiedzi, wersje indeksu)."""
+    return await _run_in(_io_executor, fn, *args, **kwargs)
+
+
+async def wait_future(fut: Future, timeout: float = None) -> Any:
+    """Czeka na concurrent.futures.Future (np. z kolejki ewaluacji) bez zajmowania wątku."""
+    return await asyncio.wait_for(asyncio.wrap_future(fut), timeout=timeout)
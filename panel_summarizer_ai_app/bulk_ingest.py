@@ -0,0 +1,381 @@
+import json
+import os
+import queue
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from chunking import chunk_transcript_json
+from ingest import COLLECTION_NAME, CHUNK_PARAMS, existing_paths_for_id, index_chunks, maybe_schedule_summary
+from jobs import claim, finish, set_stage, wait_job
+from logging_config import get_logger
+from tracing import in_context, span
+from vectors_repository import indexed_entry
+from yt_utils import classify_source, extract_video_id
+
+logger = get_logger(__name__)
+
+# Ingest wielu filmów (playlisty, kanały, listy URL) jako jedno zadanie w tle (jobs.py, kind "ingest_bulk").
+# Źródła rozwijane są do listy video_id (yt-dlp, bez pobierania), potem filmy przechodzą przez potok etapów
+# download -> transcribe -> index. Każdy etap ma własną pulę wątków (BULK_*_CONCURRENCY), a kolejki między
+# etapami są ograniczone (BULK_QUEUE_SIZE) – pobieranie nie wyprzedza transkrypcji o więcej niż kilka plików.
+# Filmy już zindeksowane (manifest indeksu zgodny z plikiem chunków) są pomijane; istniejące audio
+# i transkrypty skracają drogę (etap przepuszcza film bez pracy).
+# Każdy film przed pobraniem przejmowany jest pod kluczem single-flight /process_youtube (jobs.claim,
+# ("ingest_youtube", video_id)): /process_youtube tego filmu w trakcie bulk dostaje zadanie filmu z potoku,
+# a film przetwarzany już przez inne zadanie potok najpierw przeczekuje (wait_job), potem przepuszcza.
+# Zadania bulk mają własną pulę (BULK_JOB_WORKERS) – nie zajmują slotów JOB_WORKERS pojedynczych filmów.
+BULK_JOB_WORKERS = int(os.getenv("BULK_JOB_WORKERS", "1"))
+BULK_MAX_VIDEOS = int(os.getenv("BULK_MAX_VIDEOS", "200"))
+BULK_DOWNLOAD_CONCURRENCY = int(os.getenv("BULK_DOWNLOAD_CONCURRENCY", "3"))
+BULK_TRANSCRIBE_CONCURRENCY = int(os.getenv("BULK_TRANSCRIBE_CONCURRENCY", "2"))
+BULK_INDEX_CONCURRENCY = int(os.getenv("BULK_INDEX_CONCURRENCY", "1"))
+BULK_QUEUE_SIZE = int(os.getenv("BULK_QUEUE_SIZE", "2"))
+BULK_CLAIM_TIMEOUT = float(os.getenv("BULK_CLAIM_TIMEOUT", "1800"))  # s czekania na zadanie filmu w innym zadaniu
+
+STAGES = ("download", "transcribe", "index")
+_DONE = object()  # koniec strumienia w kolejce etapu
+
+# przebiegi w tym procesie (podgląd na żywo: /process_bulk/{job_id}); wynik końcowy trafia do tabeli zadań
+_runs: Dict[str, "BulkRun"] = {}
+_runs_lock = threading.Lock()
+
+
+def _video_url(video_id: str) -> str:
+    return f"https://www.youtube.com/watch?v={video_id}"
+
+
+def _expand_with_ytdlp(url: str, kind: str, limit: int) -> List[str]:
+    from yt_dlp import YoutubeDL
+
+    if kind == "channel" and not url.rstrip("/").endswith(("/videos", "/streams", "/shorts")):
+        url = url.rstrip("/") + "/videos"  # bez zakładki yt-dlp zwraca zakładki kanału zamiast filmów
+    opts = {"extract_flat": "in_playlist", "quiet": True, "no_warnings": True, "skip_download": True,
+            "playlistend": limit}
+    with YoutubeDL(opts) as ydl:
+        info = ydl.extract_info(url, download=False)
+    ids = []
+    for entry in info.get("entries") or []:
+        vid = (entry or {}).get("id")
+        if vid and (entry.get("ie_key") in (None, "Youtube")):
+            ids.append(vid)
+    return ids
+
+
+def expand_sources(urls: List[str], max_videos: int = BULK_MAX_VIDEOS) -> Tuple[List[str], List[Dict[str, Any]]]:
+    """
+    Rozwija URL-e filmów, playlist i kanałów do listy video_id (bez duplikatów, w kolejności źródeł).
+    Zwraca (video_ids, opis źródeł: rodzaj, liczba filmów, błąd). Limit max_videos dla całego zadania.
+    """
+    video_ids: List[str] = []
+    seen = set()
+    sources = []
+    for url in (u.strip() for u in urls):
+        if not url:
+            continue
+        kind = classify_source(url)
+        source = {"url": url, "kind": kind, "videos": 0, "error": None}
+        sources.append(source)
+        try:
+            if kind is None:
+                raise ValueError("nierozpoznany URL (film, playlista albo kanał YouTube)")
+            if kind == "video":
+                ids = [extract_video_id(url) or url]
+            else:
+                with span("bulk_expand", kind=kind) as sp:
+                    ids = _expand_with_ytdlp(url, kind, max_videos)
+                    sp.set(videos=len(ids))
+            source["videos"] = len(ids)
+        except Exception as e:
+            logger.error(f"[BULK] expand failed url={url}: {e}")
+            source["error"] = str(e)
+            continue
+        for vid in ids:
+            if vid not in seen and len(video_ids) < max_videos:
+                seen.add(vid)
+                video_ids.append(vid)
+    if sum(s["videos"] for s in sources) > len(video_ids):
+        logger.info(f"[BULK] {len(video_ids)} unique videos (limit {max_videos})")
+    return video_ids, sources
+
+
+class BulkRun:
+    """Stan jednego przebiegu: status filmów, czasy etapów, zajętość etapów, przepustowość."""
+
+    def __init__(self, video_ids: List[str], sources: List[Dict[str, Any]], concurrency: Dict[str, int]):
+        self.lock = threading.Lock()
+        self.sources = sources
+        self.concurrency = concurrency
+        self.items: Dict[str, Dict[str, Any]] = {
+            vid: {"video_id": vid, "status": "queued", "stage_s": {}, "audio_s": None, "error": None}
+            for vid in video_ids
+        }
+        self.busy_s = {stage: 0.0 for stage in STAGES}
+        self.started = time.time()
+        self.finished: Optional[float] = None
+
+    def set(self, vid: str, **fields: Any):
+        with self.lock:
+            self.items[vid].update(fields)
+
+    def add_stage_time(self, vid: str, stage: str, seconds: float):
+        with self.lock:
+            self.items[vid]["stage_s"][stage] = round(seconds, 3)
+            self.busy_s[stage] += seconds
+
+    def counts(self) -> Dict[str, int]:
+        with self.lock:
+            out: Dict[str, int] = {}
+            for item in self.items.values():
+                out[item["status"]] = out.get(item["status"], 0) + 1
+            return out
+
+    def progress_text(self) -> str:
+        counts = self.counts()
+        order = ("queued",) + STAGES + ("done", "skipped", "error")
+        return " ".join(f"{k}={counts[k]}" for k in order if counts.get(k)) + f" / {len(self.items)}"
+
+    def snapshot(self, include_videos: bool = True) -> Dict[str, Any]:
+        with self.lock:
+            items = [dict(i, stage_s=dict(i["stage_s"])) for i in self.items.values()]
+            busy = dict(self.busy_s)
+        wall = (self.finished or time.time()) - self.started
+        counts: Dict[str, int] = {}
+        for item in items:
+            counts[item["status"]] = counts.get(item["status"], 0) + 1
+        processed = [i for i in items if i["status"] == "done"]
+        audio_s = sum(i["audio_s"] or 0.0 for i in processed)
+        stages = {}
+        for stage in STAGES:
+            n = sum(1 for i in items if stage in i["stage_s"])
+            workers = self.concurrency[stage]
+            stages[stage] = {
+                "concurrency": workers,
+                "items": n,
+                "busy_s": round(busy[stage], 2),
+                "avg_s": round(busy[stage] / n, 2) if n else None,
+                "utilization": round(busy[stage] / (wall * workers), 3) if wall > 0 else None,
+            }
+        out = {
+            "videos": len(items),
+            "counts": counts,
+            "running": self.finished is None,
+            "wall_s": round(wall, 2),
+            "throughput": {
+                "videos_per_hour": round(len(processed) / wall * 3600, 2) if wall > 0 else None,
+                "audio_hours": round(audio_s / 3600, 3),
+                "audio_realtime_factor": round(audio_s / wall, 2) if wall > 0 else None,
+            },
+            "stages": stages,
+            "sources": self.sources,
+        }
+        if include_videos:
+            out["results"] = items
+        return out
+
+
+def _audio_seconds(transcript_json: Path) -> Optional[float]:
+    try:
+        segments = json.loads(transcript_json.read_text(encoding="utf-8"))
+        return float(max((s.get("end") or 0.0) for s in segments)) if segments else 0.0
+    except (OSError, ValueError):
+        return None
+
+
+class _Pipeline:
+    def __init__(self, run: BulkRun, force_reindex: bool, precompute_summary: bool, summary_max_tokens: int,
+                 progress: Callable[[str], None], bulk_id: Optional[str] = None):
+        self.run = run
+        self.bulk_id = bulk_id
+        self.claims: Dict[str, str] = {}  # video_id -> id zadania ingest_youtube przejętego przez potok
+        self.force_reindex = force_reindex
+        self.precompute_summary = precompute_summary
+        self.summary_max_tokens = summary_max_tokens
+        self._progress = progress
+        self._progress_lock = threading.Lock()
+        self.audio: Dict[str, str] = {}
+
+    def progress(self):
+        # postęp to tylko podgląd – błąd zapisu (np. zajęta baza zadań) nie może zatrzymać wątku etapu
+        try:
+            with self._progress_lock:
+                self._progress(self.run.progress_text())
+        except Exception as e:
+            logger.warning(f"[BULK] progress update failed: {e}")
+
+    def _claim(self, vid: str):
+        params = {"url": _video_url(vid), "bulk_id": self.bulk_id}
+        deadline = time.monotonic() + BULK_CLAIM_TIMEOUT
+        while True:
+            job, claimed = claim("ingest_youtube", vid, params)
+            if claimed:
+                self.claims[vid] = job["id"]
+                return
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError(f"film przetwarzany przez zadanie {job['id']} dłużej niż {BULK_CLAIM_TIMEOUT:.0f} s")
+            logger.info(f"[BULK] video_id={vid} already in progress (job {job['id']}) – waiting")
+            other = wait_job(job["id"], timeout=remaining)
+            if other is not None and other["status"] == "error":
+                raise RuntimeError(f"zadanie {job['id']} tego filmu zakończone błędem: {other['error']}")
+
+    def _result(self, vid: str) -> Dict[str, Any]:
+        txt, transcript_json, chunks_path = existing_paths_for_id(vid)
+        with self.run.lock:
+            item = dict(self.run.items[vid])
+        return {
+            "mode": "processed_new" if vid in self.audio else "reuse_existing",
+            "video_id": vid,
+            "audio": self.audio.get(vid),
+            "transcript_txt": str(txt),
+            "transcript_json": str(transcript_json),
+            "chunks_json": str(chunks_path),
+            "indexed_chunks": item.get("indexed_chunks"),
+            "index": item.get("index"),
+            "summary_job": item.get("summary_job"),
+            "bulk_id": self.bulk_id,
+        }
+
+    # etapy: zwracają normalnie (film przechodzi dalej) albo rzucają wyjątek (film z błędem)
+    def download(self, vid: str):
+        self._claim(vid)
+        set_stage(self.claims[vid], "download")
+        _, transcript_json, _ = existing_paths_for_id(vid)
+        if transcript_json.exists():
+            return  # transkrypt już jest – audio niepotrzebne
+        from yt_download import download_audio_from_youtube, audio_path_for
+        audio_path = audio_path_for(vid)
+        if not Path(audio_path).exists():
+            audio_path = download_audio_from_youtube(_video_url(vid))
+        self.audio[vid] = audio_path
+
+    def transcribe(self, vid: str):
+        set_stage(self.claims[vid], "transcribe")
+        _, transcript_json, _ = existing_paths_for_id(vid)
+        if transcript_json.exists():
+            return
+        from transcribe import transcribe_api
+        transcribe_api(self.audio[vid])
+        if not transcript_json.exists():
+            raise RuntimeError(f"Brak pliku JSON transkryptu po transcribe_api: {transcript_json}")
+
+    def index(self, vid: str):
+        set_stage(self.claims[vid], "index")
+        _, transcript_json, chunks_path = existing_paths_for_id(vid)
+        if not chunks_path.exists():
+            chunk_transcript_json(str(transcript_json), **CHUNK_PARAMS)
+        n_chunks, index_status = index_chunks(vid, str(chunks_path), force_reindex=self.force_reindex)
+        summary = maybe_schedule_summary(self.precompute_summary, vid, chunks_path, self.summary_max_tokens)
+        self.run.set(vid, indexed_chunks=n_chunks, index=index_status, summary_job=summary,
+                     audio_s=_audio_seconds(transcript_json))
+
+    def _worker(self, stage: str, inbox: queue.Queue, outbox: Optional[queue.Queue]):
+        fn = getattr(self, stage)
+        while True:
+            vid = inbox.get()
+            if vid is _DONE:
+                return
+            self.run.set(vid, status=stage)
+            self.progress()
+            started = time.perf_counter()
+            try:
+                try:
+                    with span(f"bulk_{stage}", video_id=vid):
+                        fn(vid)
+                finally:
+                    self.run.add_stage_time(vid, stage, time.perf_counter() - started)
+                self._hand_off(vid, outbox)
+            except Exception as e:
+                # wątek etapu nie może paść – inaczej poprzednie etapy wiszą na pełnej kolejce, a zadanie filmu
+                # zostaje "running" pod żywym właścicielem
+                self._fail(vid, stage, e)
+
+    def _hand_off(self, vid: str, outbox: Optional[queue.Queue]):
+        if outbox is not None:
+            outbox.put(vid)  # blokuje przy pełnej kolejce następnego etapu (ograniczony potok)
+            return
+        finish(self.claims[vid], result=self._result(vid))
+        self.run.set(vid, status="done")
+        self.progress()
+
+    def _fail(self, vid: str, stage: str, e: Exception):
+        logger.error(f"[BULK] {stage} failed video_id={vid}: {e}")
+        self.run.set(vid, status="error", error=f"{stage}: {e}")
+        if vid in self.claims:
+            try:
+                finish(self.claims[vid], error=f"bulk {stage}: {e}")
+            except Exception as fe:
+                logger.error(f"[BULK] could not mark job {self.claims[vid]} as error: {fe}")
+        self.progress()
+
+    def execute(self, video_ids: List[str]):
+        inboxes = [queue.Queue()] + [queue.Queue(maxsize=max(1, BULK_QUEUE_SIZE)) for _ in STAGES[1:]]
+        for vid in video_ids:
+            inboxes[0].put(vid)
+        pools = []
+        for i, stage in enumerate(STAGES):
+            outbox = inboxes[i + 1] if i + 1 < len(STAGES) else None
+            threads = [threading.Thread(target=in_context(self._worker), args=(stage, inboxes[i], outbox),
+                                        name=f"bulk-{stage}-{n}", daemon=True)
+                       for n in range(self.run.concurrency[stage])]
+            for t in threads:
+                t.start()
+            pools.append(threads)
+        # zamykanie etapami: koniec wejścia etapu -> koniec jego wątków -> koniec wejścia następnego
+        for i, threads in enumerate(pools):
+            for _ in threads:
+                inboxes[i].put(_DONE)
+            for t in threads:
+                t.join()
+
+
+def run_bulk(urls: List[str], precompute_summary: bool = False, summary_max_tokens: int = 2000,
+             force_reindex: bool = False, max_videos: Optional[int] = None, bulk_id: Optional[str] = None,
+             progress: Optional[Callable[[str], None]] = None) -> Dict[str, Any]:
+    """
+    Ingest wielu filmów: rozwinięcie źródeł, pominięcie zindeksowanych, potok download -> transcribe -> index.
+    Zwraca raport: statusy filmów, czasy i zajętość etapów, przepustowość (filmy/h, godziny audio, krotność
+    czasu rzeczywistego). force_reindex – ponowny zapis do indeksu także filmów z manifestu.
+    """
+    progress = progress or (lambda stage: None)
+    progress("expand")
+    video_ids, sources = expand_sources(urls, max_videos=min(max_videos or BULK_MAX_VIDEOS, BULK_MAX_VIDEOS))
+    concurrency = {"download": max(1, BULK_DOWNLOAD_CONCURRENCY),
+                   "transcribe": max(1, BULK_TRANSCRIBE_CONCURRENCY),
+                   "index": max(1, BULK_INDEX_CONCURRENCY)}
+    run = BulkRun(video_ids, sources, concurrency)
+    if bulk_id:
+        with _runs_lock:
+            _runs[bulk_id] = run
+
+    pending = []
+    for vid in video_ids:
+        _, _, chunks_path = existing_paths_for_id(vid)
+        entry = None if force_reindex else indexed_entry(COLLECTION_NAME, vid, chunks_path=chunks_path)
+        if entry is not None:
+            run.set(vid, status="skipped", indexed_chunks=entry["chunks"], index="unchanged")
+        else:
+            pending.append(vid)
+    logger.info(f"[BULK] start videos={len(video_ids)} pending={len(pending)} "
+                f"skipped={len(video_ids) - len(pending)} concurrency={concurrency}")
+
+    pipeline = _Pipeline(run, force_reindex, precompute_summary, summary_max_tokens, progress, bulk_id=bulk_id)
+    pipeline.progress()
+    try:
+        pipeline.execute(pending)
+    finally:
+        run.finished = time.time()
+        if bulk_id:
+            with _runs_lock:
+                _runs.pop(bulk_id, None)
+    report = run.snapshot()
+    logger.info(f"[BULK] done in {report['wall_s']}s counts={report['counts']} throughput={report['throughput']}")
+    return report
+
+
+def bulk_status(bulk_id: str) -> Optional[Dict[str, Any]]:
+    """Stan trwającego przebiegu w tym procesie (None, gdy nie działa tutaj albo już się zakończył)."""
+    with _runs_lock:
+        run = _runs.get(bulk_id)
+    return run.snapshot() if run is not None else None
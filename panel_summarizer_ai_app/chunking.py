@@ -1,11 +1,14 @@
 from __future__ import annotations
 from pathlib import Path
 from typing import List, Dict, Any, Optional, Tuple
+from functools import lru_cache
 import json
 
 # LangChain splitter -langchain_text_splitters poczytac dokumentacje
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 
+from tracing import traced
+
 # Opcjonalnie: tiktoken do liczenia tokenów (dokładniej niż znaki)
 try:
     import tiktoken
@@ -13,13 +16,24 @@ try:
 except Exception:
     _HAS_TIKTOKEN = False
 
-def _token_len_fn(model_name: str = "cl100k_base"):
-    if _HAS_TIKTOKEN:
+@lru_cache(maxsize=None)
+def _get_encoding(model_name: str):
+    """Encoder tiktoken albo None – także porażka zapamiętana na proces (offline każda próba to timeout pobierania)."""
+    if not _HAS_TIKTOKEN:
+        return None
+    try:
         try:
-            enc = tiktoken.get_encoding(model_name)
+            return tiktoken.get_encoding(model_name)
         except KeyError:
             # fallback do najczęściej dostępnego encodera
-            enc = tiktoken.get_encoding("cl100k_base")
+            return tiktoken.get_encoding("cl100k_base")
+    except Exception:
+        # brak pliku encodera offline (pobierany przy pierwszym użyciu)
+        return None
+
+def _token_len_fn(model_name: str = "cl100k_base"):
+    enc = _get_encoding(model_name)
+    if enc is not None:
         return lambda s: len(enc.encode(s))
     avg_chars_per_token = 4.0
     return lambda s: max(1, int(len(s) / avg_chars_per_token))
@@ -29,7 +43,7 @@ def _build_splitter(
     chunk_overlap_tokens: int,
     model_name: str = "cl100k_base"
 ) -> RecursiveCharacterTextSplitter:
-    if _HAS_TIKTOKEN:
+    if _get_encoding(model_name) is not None:
         try:
             # Spróbuj utworzyć splitter z tiktoken encoderem
             return RecursiveCharacterTextSplitter.from_tiktoken_encoder(
@@ -220,6 +234,7 @@ def load_segments(json_path: str | Path) -> List[Dict[str, Any]]:
         return data
     raise ValueError("Nieprawidłowy format pliku z segmentami.")
 
+@traced("chunk_transcript_json")
 def chunk_transcript_json(
     json_path: str | Path,
     out_path: Optional[str | Path] = None,
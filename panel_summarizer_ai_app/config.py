@@ -7,6 +7,8 @@ load_dotenv(override=False)
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 HUGGINGFACE_TOKEN = os.getenv("HUGGINGFACE_TOKEN")
 FFMPEG_DIR = os.getenv("FFMPEG_DIR")
+# "openai" (domyślnie) lub "local" – deterministyczne zamienniki modeli z local_models.py (benchmarki offline)
+MODEL_BACKEND = os.getenv("MODEL_BACKEND", "openai").lower()
 
 env_data_dir = os.getenv("DATA_DIR")
 DATA_DIR = str(Path(env_data_dir).resolve())
@@ -0,0 +1,107 @@
+import os
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from logging_config import get_logger
+
+logger = get_logger(__name__)
+
+# Pakowanie kontekstów do promptu QA: chunki z tej samej wypowiedzi (turnu) mówcy są scalane,
+# powtórzone fragmenty z nakładki (overlap w chunkingu) usuwane, a budżet tokenów wypełniany
+# kontekstami w kolejności rerank_score. ANSWER_CONTEXT_TOKEN_BUDGET<=0 wyłącza pakowanie.
+ANSWER_CONTEXT_TOKEN_BUDGET = int(os.getenv("ANSWER_CONTEXT_TOKEN_BUDGET", "3000"))
+_MIN_OVERLAP_CHARS = 20
+_GAP = " […] "
+
+
+def _approx_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+def _score(ctx: Dict[str, Any]) -> float:
+    if ctx.get("rerank_score") is not None:
+        return float(ctx["rerank_score"])
+    if ctx.get("distance") is not None:
+        return -float(ctx["distance"])
+    return 0.0
+
+
+def _turn_key(ctx: Dict[str, Any], i: int) -> Tuple:
+    if ctx.get("turn_start") is None:
+        return ("ctx", i)
+    return (ctx.get("video_id"), ctx.get("speaker"), ctx.get("turn_start"), ctx.get("turn_end"))
+
+
+def _overlap(a: str, b: str) -> int:
+    """Długość najdłuższego sufiksu a będącego prefiksem b (min. _MIN_OVERLAP_CHARS), inaczej 0."""
+    probe = b[:_MIN_OVERLAP_CHARS]
+    if len(probe) < _MIN_OVERLAP_CHARS:
+        return 0
+    idx = a.find(probe, max(0, len(a) - len(b)))
+    while idx != -1:
+        if b.startswith(a[idx:]):
+            return len(a) - idx
+        idx = a.find(probe, idx + 1)
+    return 0
+
+
+def _join(a: Dict[str, Any], b: Dict[str, Any]) -> str:
+    """Dokleja tekst b do a bez części wspólnej; luka czasowa między chunkami oznaczana _GAP."""
+    ta, tb = a["text"], b.get("text") or ""
+    if tb in ta:
+        return ta
+    k = _overlap(ta, tb)
+    if k:
+        return ta + tb[k:]
+    adjacent = a.get("end") is not None and b.get("start") is not None and b["start"] <= a["end"] + 0.5
+    return ta + (" " if adjacent else _GAP) + tb
+
+
+def _merge_group(items: List[Dict[str, Any]]) -> Dict[str, Any]:
+    items = sorted(items, key=lambda c: (c.get("start") is None, c.get("start") or 0.0))
+    merged = {**items[0], "text": items[0].get("text") or ""}
+    for c in items[1:]:
+        merged["text"] = _join(merged, c)
+        if c.get("end") is not None and (merged.get("end") is None or c["end"] > merged["end"]):
+            merged["end"] = c["end"]
+    merged["ids"] = [c.get("id") for c in items]
+    merged["rerank_score"] = max(_score(c) for c in items)
+    return merged
+
+
+def pack_contexts(contexts: List[Dict[str, Any]], budget: Optional[int] = None,
+                  count_tokens: Optional[Callable[[str], int]] = None) -> List[Dict[str, Any]]:
+    """
+    Wybiera konteksty wg rerank_score do wyczerpania budżetu tokenów (liczony po scaleniu turnów),
+    scala chunki z tego samego turnu i usuwa nakładki. Najlepszy kontekst trafia zawsze.
+    Zwraca scalone konteksty w kolejności najlepszego wyniku w grupie.
+    """
+    budget = ANSWER_CONTEXT_TOKEN_BUDGET if budget is None else budget
+    if budget <= 0 or not contexts:
+        return contexts
+    count = count_tokens or _approx_tokens
+
+    order = sorted(range(len(contexts)), key=lambda i: _score(contexts[i]), reverse=True)
+    groups: Dict[Tuple, List[Dict[str, Any]]] = {}
+    group_tokens: Dict[Tuple, int] = {}
+    seen_texts: List[str] = []
+    used = 0
+    for i in order:
+        ctx = contexts[i]
+        text = (ctx.get("text") or "").strip()
+        if not text or any(text in s for s in seen_texts):
+            continue
+        key = _turn_key(ctx, i)
+        candidate = groups.get(key, []) + [ctx]
+        tokens = count(_merge_group(candidate)["text"])
+        cost = tokens - group_tokens.get(key, 0)
+        if used and used + cost > budget:
+            continue
+        groups[key] = candidate
+        group_tokens[key] = tokens
+        seen_texts.append(text)
+        used += cost
+
+    packed = [_merge_group(items) for items in groups.values()]
+    packed.sort(key=lambda c: c["rerank_score"], reverse=True)
+    before = sum(count(c.get("text") or "") for c in contexts)
+    logger.info(f"[PACK] contexts={len(contexts)} -> {len(packed)} tokens={before} -> {used} budget={budget}")
+    return packed
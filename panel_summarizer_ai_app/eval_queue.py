@@ -0,0 +1,91 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, List
+
+from evaluator import evaluate_answer_crossencoder
+from logging_config import get_logger
+
+logger = get_logger(__name__)
+
+# Ewaluacja CE w tle: zlecana po zakończeniu streamu odpowiedzi, wynik w cache LRU po hashu
+# (pytanie, odpowiedź, konteksty). /ask_eval_ce zwraca wynik z cache albo czeka na trwające zadanie.
+EVAL_WORKERS = int(os.getenv("EVAL_WORKERS", "1"))
+EVAL_CACHE_SIZE = int(os.getenv("EVAL_CACHE_SIZE", "256"))
+EVAL_WAIT_TIMEOUT = float(os.getenv("EVAL_WAIT_TIMEOUT", "120"))
+
+_executor = ThreadPoolExecutor(max_workers=EVAL_WORKERS, thread_name_prefix="eval")
+_lock = threading.Lock()
+_cache: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+_pending: Dict[str, Future] = {}
+
+
+def eval_key(question: str, answer_text: str, contexts: List[Dict[str, Any]]) -> str:
+    payload = json.dumps(
+        [question or "", answer_text or "", [(c.get("text") or "") for c in (contexts or [])]],
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _run(key: str, question: str, answer_text: str, contexts: List[Dict[str, Any]]) -> Dict[str, Any]:
+    try:
+        metrics = evaluate_answer_crossencoder(question, answer_text, contexts)
+        with _lock:
+            _cache[key] = metrics
+            _cache.move_to_end(key)
+            while len(_cache) > EVAL_CACHE_SIZE:
+                _cache.popitem(last=False)
+        return metrics
+    finally:
+        with _lock:
+            _pending.pop(key, None)
+
+
+def submit_evaluation(question: str, answer_text: str, contexts: List[Dict[str, Any]]) -> str:
+    """Zleca ewaluację w tle (jeśli nie ma jej w cache ani w kolejce). Zwraca klucz."""
+    key = eval_key(question, answer_text, contexts)
+    with _lock:
+        if key in _cache or key in _pending:
+            return key
+        _pending[key] = _executor.submit(_run, key, question, answer_text, list(contexts or []))
+    logger.info(f"[EVAL_QUEUE] submitted key={key[:12]} pending={len(_pending)}")
+    return key
+
+
+def evaluation_future(question: str, answer_text: str, contexts: List[Dict[str, Any]]) -> Future:
+    """Future z wynikiem: zakończony (cache), trwające zadanie albo nowo zlecone."""
+    key = eval_key(question, answer_text, contexts)
+    with _lock:
+        if key in _cache:
+            _cache.move_to_end(key)
+            logger.info(f"[EVAL_QUEUE] cache hit key={key[:12]}")
+            done: Future = Future()
+            done.set_result(_cache[key])
+            return done
+        fut = _pending.get(key)
+    if fut is None:
+        logger.info(f"[EVAL_QUEUE] miss key={key[:12]}, evaluating")
+        submit_evaluation(question, answer_text, contexts)
+        with _lock:
+            fut = _pending.get(key)
+            metrics = _cache.get(key)
+        if fut is None:
+            # zadanie zakończyło się między sprawdzeniami
+            fut = Future()
+            if metrics is None:
+                fut.set_exception(RuntimeError("Ewaluacja CE nie powiodła się"))
+            else:
+                fut.set_result(metrics)
+    else:
+        logger.info(f"[EVAL_QUEUE] waiting for pending key={key[:12]}")
+    return fut
+
+
+def get_evaluation(question: str, answer_text: str, contexts: List[Dict[str, Any]],
+                   timeout: float = EVAL_WAIT_TIMEOUT) -> Dict[str, Any]:
+    """Wynik z cache, oczekiwanie na trwające zadanie albo (brak obu) nowe zadanie i oczekiwanie."""
+    return evaluation_future(question, answer_text, contexts).result(timeout=timeout)
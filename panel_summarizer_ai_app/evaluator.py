@@ -1,20 +1,15 @@
 from typing import List, Dict, Any, Tuple
 import os, re
 import numpy as np
-_cross_encoders_cache: Dict[str, Any] = {}
+from model_manager import get_model_manager, KIND_CROSS_ENCODER, KIND_BI_ENCODER
+from logging_config import get_logger
+from metrics import timed
 
+logger = get_logger(__name__)
+
+# modele trzymane we wspólnym menedżerze (budżet pamięci, LRU, kolejka inferencji) – patrz model_manager.py
 def _get_ce(model_name: str):
-    try:
-        if model_name in _cross_encoders_cache:
-            return _cross_encoders_cache[model_name]
-        from sentence_transformers import CrossEncoder
-        ce = CrossEncoder(model_name)
-        _cross_encoders_cache[model_name] = ce
-        print(f"[EVAL] CrossEncoder loaded & cached: {model_name}")
-        return ce
-    except Exception as e:
-        print(f"[EVAL] CrossEncoder load failed for {model_name}: {e}")
-        return None
+    return get_model_manager().get(model_name, KIND_CROSS_ENCODER)
 
 RELEVANCY_MODEL = os.getenv("RELEVANCY_CE_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
 NLI_MODEL = os.getenv("NLI_CE_MODEL", "cross-encoder/nli-deberta-v3-base")
@@ -26,10 +21,10 @@ def score_relevancy(question: str, answer_text: str) -> float:
         scores = ce.predict(pairs)
         # nie używaj "if scores" – sprawdzaj długość
         val = float(scores[0]) if len(scores) > 0 else 0.0
-        print(f"[EVAL][relevancy] model={RELEVANCY_MODEL} pairs={len(pairs)} score={val}")
+        logger.info(f"[EVAL][relevancy] model={RELEVANCY_MODEL} pairs={len(pairs)} score={val}")
         return val
     except Exception as e:
-        print(f"[EVAL][relevancy] ERROR: {e}")
+        logger.error(f"[EVAL][relevancy] ERROR: {e}")
         return 0.0
 
 def _split_sentences(text: str) -> List[str]:
@@ -38,31 +33,62 @@ def _split_sentences(text: str) -> List[str]:
     parts = re.split(r'(?<=[\.\?\!])\s+', text.strip())
     return [p.strip() for p in parts if p.strip()]
 
+NLI_BATCH_SIZE = int(os.getenv("NLI_BATCH_SIZE", "32"))
+# opcjonalny prefiltr: dla każdego zdania tylko NLI_PREFILTER_TOP_N najbardziej podobnych kontekstów (0 = wyłączony)
+NLI_PREFILTER_TOP_N = int(os.getenv("NLI_PREFILTER_TOP_N", "0"))
+NLI_PREFILTER_MODEL = os.getenv("NLI_PREFILTER_MODEL", "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2")
+
+def _get_bi_encoder(model_name: str):
+    return get_model_manager().get(model_name, KIND_BI_ENCODER)
+
+def _prefilter_pairs(sentences: List[str], ctx_texts: List[str], top_n: int) -> List[Tuple[int, int]]:
+    """
+    Zwraca pary (idx_zdania, idx_kontekstu) do oceny NLI. Przy włączonym prefiltrze zostawia
+    dla każdego zdania top_n kontekstów wg podobieństwa kosinusowego embeddingów.
+    """
+    all_pairs = [(i, j) for i in range(len(sentences)) for j in range(len(ctx_texts))]
+    if top_n <= 0 or top_n >= len(ctx_texts):
+        return all_pairs
+    model = _get_bi_encoder(NLI_PREFILTER_MODEL)
+    if model is None:
+        return all_pairs
+    try:
+        emb = np.asarray(model.encode(sentences + ctx_texts, batch_size=NLI_BATCH_SIZE, normalize_embeddings=True))
+        sims = emb[:len(sentences)] @ emb[len(sentences):].T
+        keep = np.argsort(-sims, axis=1)[:, :top_n]
+        return [(i, int(j)) for i in range(len(sentences)) for j in keep[i]]
+    except Exception as e:
+        logger.error(f"[EVAL][faithfulness] prefilter ERROR: {e}")
+        return all_pairs
+
 def score_faithfulness(answer_text: str, contexts: List[Dict[str, Any]]) -> Tuple[float, List[Dict[str, Any]]]:
     ce = _get_ce(NLI_MODEL)
     sentences = _split_sentences(answer_text)
     ctx_texts = [(c.get("text") or "") for c in (contexts or [])]
-    results = []
     if len(sentences) == 0 or len(ctx_texts) == 0:
-        print(f"[EVAL][faithfulness] skip: sentences={len(sentences)} ctx_texts={len(ctx_texts)}")
+        logger.info(f"[EVAL][faithfulness] skip: sentences={len(sentences)} ctx_texts={len(ctx_texts)}")
         return 0.0, []
     try:
-        for i, s in enumerate(sentences):
-            pairs = [(s, ct) for ct in ctx_texts]
-            scores = ce.predict(pairs)
-            # użyj np.max, a nie "if scores"
-            best = float(np.max(scores)) if len(scores) > 0 else 0.0
-            results.append({"sentence": s, "best_ctx_score": best})
-            print(f"[EVAL][faithfulness] model={NLI_MODEL} sent#{i} pairs={len(pairs)} best={best}")
-        avg = sum(r["best_ctx_score"] for r in results) / max(1, len(results))
-        print(f"[EVAL][faithfulness] avg={avg} sentences={len(sentences)}")
-        return float(avg), results
+        # wszystkie pary zdanie×kontekst w jednym wywołaniu predict (batchowanie po stronie modelu)
+        index_pairs = _prefilter_pairs(sentences, ctx_texts, NLI_PREFILTER_TOP_N)
+        pairs = [(sentences[i], ctx_texts[j]) for i, j in index_pairs]
+        scores = np.asarray(ce.predict(pairs, batch_size=NLI_BATCH_SIZE))
+        pair_best = scores.reshape(len(pairs), -1).max(axis=1)
+        owners = np.fromiter((i for i, _ in index_pairs), dtype=np.int64, count=len(index_pairs))
+        best = np.full(len(sentences), -np.inf)
+        np.maximum.at(best, owners, pair_best)
+        results = [{"sentence": s, "best_ctx_score": float(b)} for s, b in zip(sentences, best)]
+        avg = float(best.mean())
+        logger.info(f"[EVAL][faithfulness] model={NLI_MODEL} sentences={len(sentences)} pairs={len(pairs)} "
+              f"batch_size={NLI_BATCH_SIZE} prefilter_top_n={NLI_PREFILTER_TOP_N} avg={avg}")
+        return avg, results
     except Exception as e:
-        print(f"[EVAL][faithfulness] ERROR: {e}")
+        logger.error(f"[EVAL][faithfulness] ERROR: {e}")
         return 0.0, []
 
+@timed("evaluate_answer_crossencoder")
 def evaluate_answer_crossencoder(question: str, answer_text: str, contexts: List[Dict[str, Any]]) -> Dict[str, Any]:
-    print(f"[EVAL] inputs: q_len={len(question or '')} ans_len={len(answer_text or '')} ctx_count={len(contexts or [])}")
+    logger.info(f"[EVAL] inputs: q_len={len(question or '')} ans_len={len(answer_text or '')} ctx_count={len(contexts or [])}")
     rel = score_relevancy(question, answer_text)
     faith_avg, per_sentence = score_faithfulness(answer_text, contexts)
     def normalize_0_1(x: float) -> float:
@@ -77,5 +103,5 @@ def evaluate_answer_crossencoder(question: str, answer_text: str, contexts: List
             "models": {"relevancy": RELEVANCY_MODEL, "faithfulness": NLI_MODEL},
         },
     }
-    print(f"[EVAL] output: {out}")
+    logger.info(f"[EVAL] output: {out}")
     return out
\ No newline at end of file
@@ -0,0 +1,358 @@
+import json
+import os
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from logging_config import get_logger
+
+try:
+    import fcntl
+except ImportError:  # Windows – blokada tylko w procesie
+    fcntl = None
+
+logger = get_logger(__name__)
+
+# Płaski indeks wektorowy w procesie (alternatywa dla Chroma przy małych korpusach).
+# Układ na dysku (katalog per kolekcja):
+#   vectors.f16      - macierz embeddingów float16 (wiersze dopisywane na końcu), czytana przez memmap
+#   metadata.jsonl   - tabela metadanych: jeden wiersz JSON {id, document, metadata} na wiersz macierzy
+#   index.json       - nagłówek: wymiar wektorów i generacja plików danych
+# Aktualizacje są append-only: upsert istniejącego id dopisuje nowy wiersz, a starszy zostaje
+# oznaczony jako nieaktywny (wygrywa ostatnie wystąpienie id). delete dopisuje wiersz-nagrobek
+# {"id", "deleted": true} (z zerowym wektorem – wiersze macierzy i metadanych pozostają zrównane).
+# Kompakcja: gdy nieaktywne wiersze przekraczają FLAT_COMPACT_DEAD_RATIO wszystkich, aktywne są
+# przepisywane do plików kolejnej generacji (vectors.<g>.f16, metadata.<g>.jsonl); podmiana nagłówka
+# to moment zatwierdzenia, stare pliki są potem usuwane (otwarte memmapy innych procesów działają dalej).
+# Wiele procesów (workery): zapis i kompakcja pod wyłączną blokadą pliku (LOCK_FILE), a wiersze
+# dopisane przez inne procesy są doczytywane przyrostowo (offset w metadata.jsonl) pod blokadą
+# współdzieloną przed zapytaniem; zmiana nagłówka (nowa generacja) oznacza pełne przeładowanie.
+
+VECTORS_FILE = "vectors.f16"
+METADATA_FILE = "metadata.jsonl"
+HEADER_FILE = "index.json"
+LOCK_FILE = ".lock"
+QUERY_BLOCK_ROWS = 8192  # konwersja float16 -> float32 blokami, żeby nie kopiować całej macierzy
+FLAT_COMPACT_DEAD_RATIO = float(os.getenv("FLAT_COMPACT_DEAD_RATIO", "0.3"))
+FLAT_COMPACT_MIN_ROWS = int(os.getenv("FLAT_COMPACT_MIN_ROWS", "1024"))  # mniejszych kolekcji nie kompaktujemy
+
+
+def _match_where(meta: Dict[str, Any], where: Optional[Dict[str, Any]]) -> bool:
+    """
+    Filtr metadanych w składni zbliżonej do Chroma:
+    {"speaker": "SPEAKER_01"}, {"start": {"$gte": 60}}, {"$and": [...]}, {"$or": [...]}.
+    """
+    if not where:
+        return True
+    for key, cond in where.items():
+        if key == "$and":
+            if not all(_match_where(meta, c) for c in cond):
+                return False
+            continue
+        if key == "$or":
+            if not any(_match_where(meta, c) for c in cond):
+                return False
+            continue
+        val = meta.get(key)
+        if not isinstance(cond, dict):
+            if val != cond:
+                return False
+            continue
+        for op, arg in cond.items():
+            if op == "$eq" and not val == arg:
+                return False
+            if op == "$ne" and not val != arg:
+                return False
+            if op == "$in" and val not in arg:
+                return False
+            if op == "$nin" and val in arg:
+                return False
+            if op in ("$gt", "$gte", "$lt", "$lte"):
+                if val is None:
+                    return False
+                if op == "$gt" and not val > arg:
+                    return False
+                if op == "$gte" and not val >= arg:
+                    return False
+                if op == "$lt" and not val < arg:
+                    return False
+                if op == "$lte" and not val <= arg:
+                    return False
+    return True
+
+
+class FlatCollection:
+    """
+    Dokładne wyszukiwanie top-k (iloczyn macierz-wektor na znormalizowanych embeddingach).
+    Udostępnia podzbiór API kolekcji Chroma używany w vectors_repository: upsert, get, delete, query, count.
+    Odległość w "distances" to kwadrat odległości euklidesowej znormalizowanych wektorów (2 - 2·cos),
+    czyli ta sama skala co domyślna przestrzeń "l2" Chroma dla znormalizowanych embeddingów –
+    progi kaskady (CASCADE_*) znaczą to samo w obu backendach.
+    """
+
+    def __init__(self, root: str | Path, name: str):
+        self.name = name
+        self.dir = Path(root) / name
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.RLock()
+        self._dim: Optional[int] = None
+        self._rows: List[Dict[str, Any]] = []
+        self._alive = np.zeros(0, dtype=bool)
+        self._id_to_row: Dict[str, int] = {}
+        self._matrix: Optional[np.memmap] = None
+        self._meta_offset = 0  # bajty metadata.jsonl już wczytane
+        self._gen = 0
+        self._header_sig: Optional[Tuple[int, int, int]] = None  # (inode, mtime_ns, rozmiar) index.json
+        self._refresh()
+        logger.info(f"[FLAT] Loaded collection '{self.name}': rows={len(self._rows)} live={self.count()} dim={self._dim}")
+
+    # --- stan na dysku ---
+
+    @contextmanager
+    def _file_lock(self, shared: bool = False):
+        if fcntl is None:
+            yield
+            return
+        with (self.dir / LOCK_FILE).open("a") as f:
+            fcntl.flock(f, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _data_paths(self, gen: int) -> Tuple[Path, Path]:
+        if gen == 0:
+            return self.dir / VECTORS_FILE, self.dir / METADATA_FILE
+        return self.dir / f"vectors.{gen}.f16", self.dir / f"metadata.{gen}.jsonl"
+
+    @staticmethod
+    def _stat_sig(path: Path) -> Optional[Tuple[int, int, int]]:
+        try:
+            st = path.stat()
+        except OSError:
+            return None
+        return st.st_ino, st.st_mtime_ns, st.st_size
+
+    def _write_header(self, gen: int):
+        header = self.dir / HEADER_FILE
+        tmp = header.with_suffix(".json.tmp")
+        tmp.write_text(json.dumps({"dim": self._dim, "generation": gen}), encoding="utf-8")
+        os.replace(tmp, header)
+        self._header_sig = self._stat_sig(header)
+
+    def _reset(self, gen: int):
+        self._gen = gen
+        self._rows = []
+        self._alive = np.zeros(0, dtype=bool)
+        self._id_to_row = {}
+        self._matrix = None
+        self._meta_offset = 0
+
+    def _stale(self) -> bool:
+        if self._stat_sig(self.dir / HEADER_FILE) != self._header_sig:
+            return True
+        try:
+            return self._data_paths(self._gen)[1].stat().st_size != self._meta_offset
+        except OSError:
+            return False
+
+    def _refresh(self):
+        """Doczytuje wiersze dopisane od ostatniego odczytu (także przez inne procesy)."""
+        if self._stale():
+            with self._file_lock(shared=True):
+                self._load()
+
+    def _load(self):
+        # wywoływane pod blokadą pliku (współdzieloną albo wyłączną)
+        header = self.dir / HEADER_FILE
+        sig = self._stat_sig(header)
+        if sig is None:
+            return
+        if sig != self._header_sig:
+            info = json.loads(header.read_text(encoding="utf-8"))
+            self._dim = int(info["dim"])
+            gen = int(info.get("generation", 0))
+            if gen != self._gen:
+                # inny proces skompaktował kolekcję – wiersze i offset dotyczą starych plików
+                self._reset(gen)
+            self._header_sig = sig
+        meta_path = self._data_paths(self._gen)[1]
+        if not meta_path.exists() or meta_path.stat().st_size == self._meta_offset:
+            return
+        # po przerwanym (lub trwającym) zapisie bierzemy tylko pełne linie z wektorami na dysku
+        budget = self._vector_rows_on_disk() - len(self._rows)
+        new_rows: List[Dict[str, Any]] = []
+        with meta_path.open("rb") as f:
+            f.seek(self._meta_offset)
+            for raw in f:
+                if len(new_rows) >= budget or not raw.endswith(b"\n"):
+                    break
+                self._meta_offset += len(raw)
+                line = raw.strip()
+                if line:
+                    new_rows.append(json.loads(line))
+        if new_rows:
+            self._append_rows(new_rows)
+
+    def _append_rows(self, new_rows: List[Dict[str, Any]]):
+        base = len(self._rows)
+        self._alive = np.concatenate([self._alive, np.ones(len(new_rows), dtype=bool)])
+        for off, row in enumerate(new_rows):
+            prev = self._id_to_row.pop(row["id"], None)
+            if prev is not None:
+                self._alive[prev] = False
+            if row.get("deleted"):
+                self._alive[base + off] = False
+            else:
+                self._id_to_row[row["id"]] = base + off
+        self._rows.extend(new_rows)
+        self._remap(len(self._rows))
+
+    def _vector_rows_on_disk(self) -> int:
+        path = self._data_paths(self._gen)[0]
+        if not self._dim or not path.exists():
+            return 0
+        return path.stat().st_size // (self._dim * 2)
+
+    def _remap(self, n: int):
+        if n == 0 or not self._dim:
+            self._matrix = None
+            return
+        self._matrix = np.memmap(self._data_paths(self._gen)[0], dtype=np.float16, mode="r", shape=(n, self._dim))
+
+    # --- API zgodne z Chroma ---
+
+    def count(self) -> int:
+        return int(self._alive.sum())
+
+    def upsert(self, documents: List[str], metadatas: List[Dict[str, Any]], ids: List[str], embeddings: List[List[float]]):
+        if not ids:
+            return
+        vecs = np.asarray(embeddings, dtype=np.float32)
+        if vecs.ndim != 2 or vecs.shape[0] != len(ids):
+            raise ValueError(f"Nieprawidłowy kształt embeddingów: {vecs.shape} dla {len(ids)} id")
+        norms = np.linalg.norm(vecs, axis=1, keepdims=True)
+        vecs = vecs / np.maximum(norms, 1e-12)
+
+        with self._lock, self._file_lock():
+            self._load()
+            if self._dim is None:
+                self._dim = int(vecs.shape[1])
+                self._write_header(self._gen)
+            elif vecs.shape[1] != self._dim:
+                raise ValueError(f"Wymiar embeddingów {vecs.shape[1]} != {self._dim} w kolekcji '{self.name}'")
+
+            self._write_rows(vecs.astype(np.float16), [
+                {"id": str(i), "document": d, "metadata": m or {}}
+                for i, d, m in zip(ids, documents, metadatas)
+            ])
+            self._maybe_compact()
+
+    def _write_rows(self, vecs: np.ndarray, new_rows: List[Dict[str, Any]]):
+        # wywoływane pod self._lock i blokadą pliku; najpierw wektory, potem metadane (patrz _load)
+        vec_path, meta_path = self._data_paths(self._gen)
+        with vec_path.open("ab") as f:
+            f.write(vecs.tobytes())
+        payload = "".join(json.dumps(row, ensure_ascii=False) + "\n" for row in new_rows).encode("utf-8")
+        with meta_path.open("ab") as f:
+            f.write(payload)
+        self._meta_offset += len(payload)
+        self._append_rows(new_rows)
+
+    def _maybe_compact(self):
+        total = len(self._rows)
+        dead = total - self.count()
+        if total >= FLAT_COMPACT_MIN_ROWS and dead > FLAT_COMPACT_DEAD_RATIO * total:
+            self._compact()
+
+    def _compact(self):
+        """Przepisuje aktywne wiersze do plików nowej generacji (pod self._lock i wyłączną blokadą pliku)."""
+        total = len(self._rows)
+        live = np.flatnonzero(self._alive)
+        gen = self._gen + 1
+        vec_path, meta_path = self._data_paths(gen)
+        with vec_path.open("wb") as f:
+            for s in range(0, len(live), QUERY_BLOCK_ROWS):
+                f.write(np.ascontiguousarray(self._matrix[live[s:s + QUERY_BLOCK_ROWS]]).tobytes())
+        rows = [self._rows[i] for i in live]
+        payload = "".join(json.dumps(row, ensure_ascii=False) + "\n" for row in rows).encode("utf-8")
+        meta_path.write_bytes(payload)
+        self._write_header(gen)  # zatwierdzenie: od teraz czytelnicy przeładowują nową generację
+        keep = {vec_path.name, meta_path.name}
+        for old in [*self.dir.glob("vectors*.f16"), *self.dir.glob("metadata*.jsonl")]:
+            if old.name not in keep:
+                try:
+                    old.unlink()
+                except OSError:
+                    pass
+        self._reset(gen)
+        self._meta_offset = len(payload)
+        self._append_rows(rows)
+        logger.info(f"[FLAT] Compacted collection '{self.name}': rows {total} -> {len(rows)} (generation {gen})")
+
+    def get(self, ids: Optional[List[str]] = None, where: Optional[Dict[str, Any]] = None,
+            **_ignored) -> Dict[str, List[Any]]:
+        """Aktywne wiersze (opcjonalnie tylko ids i/lub pasujące do where)."""
+        with self._lock:
+            self._refresh()
+            rows = self._select(ids, where)
+        return {"ids": [r["id"] for r in rows], "documents": [r["document"] for r in rows],
+                "metadatas": [r["metadata"] for r in rows]}
+
+    def _select(self, ids: Optional[List[str]], where: Optional[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        candidates = self._id_to_row if ids is None else [str(i) for i in ids if str(i) in self._id_to_row]
+        rows = [self._rows[self._id_to_row[rid]] for rid in candidates]
+        return [r for r in rows if _match_where(r["metadata"], where)]
+
+    def delete(self, ids: Optional[List[str]] = None, where: Optional[Dict[str, Any]] = None):
+        if ids is None and not where:
+            raise ValueError("delete wymaga ids albo where")
+        with self._lock, self._file_lock():
+            self._load()
+            targets = [r["id"] for r in self._select(ids, where)]
+            if not targets or self._dim is None:
+                return
+            self._write_rows(np.zeros((len(targets), self._dim), dtype=np.float16),
+                             [{"id": rid, "document": "", "metadata": {}, "deleted": True} for rid in targets])
+            self._maybe_compact()
+
+    def _scores(self, matrix: np.ndarray, q: np.ndarray) -> np.ndarray:
+        n = matrix.shape[0]
+        if n <= QUERY_BLOCK_ROWS:
+            return matrix.astype(np.float32) @ q
+        out = np.empty(n, dtype=np.float32)
+        for s in range(0, n, QUERY_BLOCK_ROWS):
+            out[s:s + QUERY_BLOCK_ROWS] = matrix[s:s + QUERY_BLOCK_ROWS].astype(np.float32) @ q
+        return out
+
+    def query(self, query_embeddings: List[List[float]], n_results: int = 10,
+              where: Optional[Dict[str, Any]] = None, **_ignored) -> Dict[str, List[List[Any]]]:
+        res: Dict[str, List[List[Any]]] = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+        with self._lock:
+            self._refresh()
+            # migawka pod blokadą: równoległy zapis (_append_rows) wydłuża self._rows w miejscu
+            n = len(self._rows)
+            matrix, rows = self._matrix, self._rows[:n]
+            mask = self._alive[:n].copy()
+        if where and n:
+            mask &= np.fromiter((_match_where(r["metadata"], where) for r in rows), dtype=bool, count=n)
+
+        for q in query_embeddings:
+            if matrix is None or not mask.any():
+                for key in res:
+                    res[key].append([])
+                continue
+            qv = np.asarray(q, dtype=np.float32)
+            qv = qv / max(float(np.linalg.norm(qv)), 1e-12)
+            sims = self._scores(matrix, qv)
+            sims[~mask[:len(sims)]] = -np.inf
+            k = min(int(n_results), int(mask.sum()))
+            top = np.argpartition(-sims, k - 1)[:k]
+            top = top[np.argsort(-sims[top])]
+            res["ids"].append([rows[i]["id"] for i in top])
+            res["documents"].append([rows[i]["document"] for i in top])
+            res["metadatas"].append([rows[i]["metadata"] for i in top])
+            res["distances"].append([max(0.0, float(2.0 - 2.0 * sims[i])) for i in top])
+        return res
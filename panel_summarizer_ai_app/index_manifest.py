@@ -0,0 +1,132 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from logging_config import get_logger
+
+try:
+    import fcntl
+except ImportError:  # Windows – blokada tylko w procesie
+    fcntl = None
+
+logger = get_logger(__name__)
+
+# Manifest indeksu: które filmy (video_id) są w kolekcji, z jakim zestawem chunków (hash) i jakim
+# modelem embeddingów. Ponowne przetworzenie znanego filmu sprawdza manifest zamiast embedować i zapisywać
+# wszystkie chunki od nowa. Manifest leży obok indeksu (ten sam czas życia – patrz
+# vectors_repository.get_manifest); path=None – tylko w pamięci (Chroma w procesie).
+# Zapis: blokada pliku (wiele workerów), plik tymczasowy + os.replace.
+
+# pola chunku wpływające na zawartość indeksu (tekst i metadane zapisywane przez store_chunks)
+_HASH_FIELDS = ("id", "text", "speaker", "start", "end", "turn_start", "turn_end")
+
+
+def chunks_hash(chunks: List[Dict[str, Any]]) -> str:
+    h = hashlib.sha256()
+    for i, c in enumerate(chunks):
+        row = {k: c.get(k) for k in _HASH_FIELDS}
+        row["id"] = c.get("id", i)
+        h.update(json.dumps(row, ensure_ascii=False, sort_keys=True, default=str).encode("utf-8"))
+        h.update(b"\n")
+    return h.hexdigest()
+
+
+def file_signature(path: str | Path) -> Optional[Dict[str, Any]]:
+    """Ścieżka, rozmiar i mtime pliku chunków – porównanie bez czytania i hashowania zawartości."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return {"path": str(Path(path).resolve()), "size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+
+class IndexManifest:
+    def __init__(self, path: Optional[Path]):
+        self.path = Path(path) if path is not None else None
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        self._mtime_ns: Optional[int] = None
+
+    @contextmanager
+    def _file_lock(self):
+        if self.path is None or fcntl is None:
+            yield
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self.path.with_name(self.path.name + ".lock").open("a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _reload(self):
+        """Wczytuje plik, jeśli zmienił się od ostatniego odczytu (zapis z innego procesu)."""
+        if self.path is None:
+            return
+        try:
+            mtime = self.path.stat().st_mtime_ns
+        except FileNotFoundError:
+            self._entries, self._mtime_ns = {}, None
+            return
+        if mtime == self._mtime_ns:
+            return
+        try:
+            self._entries = json.loads(self.path.read_text(encoding="utf-8")).get("videos", {})
+        except (OSError, ValueError) as e:
+            logger.warning(f"[MANIFEST] unreadable {self.path}: {e} – treating as empty")
+            self._entries = {}
+        self._mtime_ns = mtime
+
+    def _write(self):
+        if self.path is None:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_name(f"{self.path.name}.{os.getpid()}.tmp")
+        tmp.write_text(json.dumps({"videos": self._entries}, ensure_ascii=False, indent=2), encoding="utf-8")
+        os.replace(tmp, self.path)
+        self._mtime_ns = self.path.stat().st_mtime_ns
+
+    def get(self, video_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            self._reload()
+            entry = self._entries.get(video_id)
+            return dict(entry) if entry is not None else None
+
+    def record(self, video_id: str, chunk_hash: str, embedding_model: str, chunks: int,
+               source: Optional[Dict[str, Any]] = None):
+        with self._lock, self._file_lock():
+            self._reload()
+            self._entries[video_id] = {
+                "video_id": video_id,
+                "chunk_hash": chunk_hash,
+                "embedding_model": embedding_model,
+                "chunks": chunks,
+                "source": source,
+                "indexed_at": time.time(),
+            }
+            self._write()
+
+    def update_source(self, video_id: str, source: Optional[Dict[str, Any]]):
+        """Nowa sygnatura pliku przy niezmienionej zawartości (np. plik zapisany ponownie)."""
+        with self._lock, self._file_lock():
+            self._reload()
+            if video_id in self._entries:
+                self._entries[video_id]["source"] = source
+                self._write()
+
+    def forget(self, video_id: str):
+        with self._lock, self._file_lock():
+            self._reload()
+            if self._entries.pop(video_id, None) is not None:
+                self._write()
+
+    def videos(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            self._reload()
+            return [dict(e) for e in self._entries.values()]
@@ -0,0 +1,151 @@
+import json
+import os
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from config import DATA_DIR
+from chunking import chunk_transcript_json
+from vectors_repository import get_collection, store_chunks, indexed_entry
+from summary_store import schedule_summary
+from yt_utils import extract_video_id
+from logging_config import get_logger
+
+logger = get_logger(__name__)
+
+# Pipeline ingestu filmu (pobranie audio -> transkrypcja + diarizacja -> chunking -> indeks),
+# uruchamiany jako zadanie w tle (jobs.py). progress(stage) aktualizuje etap w tabeli zadań.
+COLLECTION_NAME = "panel"
+# pobieranie strumieniowe: yt-dlp -> ffmpeg (16 kHz mono) -> segmenty do transkrypcji w trakcie pobierania;
+# 0 – dawna ścieżka (cały plik WAV, potem podział i transkrypcja)
+INGEST_STREAMING = os.getenv("INGEST_STREAMING", "1") == "1"
+CHUNK_PARAMS = {"chunk_min_tokens": 400, "chunk_max_tokens": 1000, "overlap_ratio": 0.15}
+
+
+def existing_paths_for_id(video_id: str):
+    transcripts_dir = Path(DATA_DIR) / "transcripts"
+    txt = transcripts_dir / f"{video_id}.txt"
+    jsn = transcripts_dir / f"{video_id}.json"
+    chunks = transcripts_dir / f"{video_id}_chunks.json"
+    return txt, jsn, chunks
+
+
+def _load_chunks(chunks_path) -> List[Dict[str, Any]]:
+    return json.loads(Path(chunks_path).read_text(encoding="utf-8"))
+
+
+def maybe_schedule_summary(precompute_summary: bool, vid: str, chunks_path,
+                            summary_max_tokens: int) -> Optional[str]:
+    if not precompute_summary:
+        return None
+    status = schedule_summary(vid, _load_chunks(chunks_path), max_tokens=int(summary_max_tokens or 2000))
+    logger.info(f"[PROCESS] Precompute summary video_id={vid}: {status}")
+    return status
+
+
+def index_chunks(vid: str, chunks_path, force_reindex: bool = False) -> Tuple[int, str]:
+    """
+    Indeksuje chunki filmu; zwraca (liczba chunków, "indexed" | "unchanged"). Film zapisany już w kolekcji
+    z tym samym zestawem chunków i modelem embeddingów (manifest indeksu) jest pomijany bez embedowania.
+    """
+    if not force_reindex:
+        entry = indexed_entry(COLLECTION_NAME, vid, chunks_path=chunks_path)
+        if entry is not None:
+            logger.info(f"[PROCESS] Index up to date for video_id={vid} ({entry['chunks']} chunks, manifest)")
+            return entry["chunks"], "unchanged"
+    chunks = _load_chunks(chunks_path)
+    if not force_reindex:
+        entry = indexed_entry(COLLECTION_NAME, vid, chunks_path=chunks_path, chunks=chunks)
+        if entry is not None:
+            logger.info(f"[PROCESS] Index up to date for video_id={vid} ({len(chunks)} chunks, same hash)")
+            return len(chunks), "unchanged"
+    col = get_collection(COLLECTION_NAME)
+    store_chunks(col, chunks, video_id=vid, source=chunks_path)
+    logger.info(f"[PROCESS] Indexed {len(chunks)} chunks into collection '{COLLECTION_NAME}' (force={force_reindex}).")
+    return len(chunks), "indexed"
+
+
+def _download_and_transcribe_stream(url: str, vid: str, progress: Callable[[str], None]) -> Tuple[str, str]:
+    """Pobieranie i transkrypcja jednocześnie: segmenty trafiają do Whisper/diarizacji, gdy tylko są gotowe."""
+    from yt_download import stream_audio_segments, audio_path_for
+    from transcribe import transcribe_stream, SEGMENT_SECONDS, OVERLAP_SECONDS
+
+    def _segments():
+        for n, segment in enumerate(stream_audio_segments(url, SEGMENT_SECONDS, OVERLAP_SECONDS)):
+            if n == 0:
+                progress("transcribe")  # pobieranie trwa dalej, etap: pierwszy segment w transkrypcji
+            yield segment
+
+    audio_path = audio_path_for(vid)
+    return audio_path, transcribe_stream(_segments(), audio_path)
+
+
+def ingest_youtube(url: str, precompute_summary: bool = False, summary_max_tokens: int = 2000,
+                   force_reindex: bool = False,
+                   progress: Optional[Callable[[str], None]] = None) -> Dict[str, Any]:
+    """
+    Przetwarza film: używa istniejących plików transkryptu/chunków albo uruchamia pełny pipeline.
+    force_reindex – ponowne embedowanie i zapis chunków mimo zgodnego manifestu indeksu.
+    Zwraca słownik wyniku (jak dawniej /process_youtube); błędy zgłasza wyjątkiem.
+    """
+    progress = progress or (lambda stage: None)
+    logger.info(f"[PROCESS] ingest url={url}")
+    vid = extract_video_id(url)
+    if not vid:
+        raise ValueError("Nie można wyodrębnić video_id z URL. Podaj URL w formacie YouTube.")
+
+    transcript_txt_path, transcript_json_path, chunks_json_path = existing_paths_for_id(vid)
+    logger.info(f"[PROCESS] Paths -> TXT={transcript_txt_path} JSON={transcript_json_path} CHUNKS={chunks_json_path}")
+
+    # Warunek użycia istniejących plików: transkrypcja JSON i chanki muszą istnieć
+    if transcript_txt_path.exists() and transcript_json_path.exists() and chunks_json_path.exists():
+        logger.info("[PROCESS] Existing transcript JSON and chunks found. Reusing them...")
+        progress("index")
+        n_chunks, index_status = index_chunks(vid, chunks_json_path, force_reindex)
+        return {
+            "mode": "reuse_existing",
+            "video_id": vid,
+            "transcript_txt": str(transcript_txt_path) if transcript_txt_path.exists() else None,
+            "transcript_json": str(transcript_json_path),
+            "chunks_json": str(chunks_json_path),
+            "indexed_chunks": n_chunks,
+            "index": index_status,
+            "summary_job": maybe_schedule_summary(precompute_summary, vid, chunks_json_path, summary_max_tokens),
+        }
+
+    logger.info(f"[PROCESS] Missing transcript/chunks. Running full pipeline (streaming={INGEST_STREAMING})...")
+    progress("download")
+    if INGEST_STREAMING:
+        audio_path, transcript_txt_path = _download_and_transcribe_stream(url, vid, progress)
+    else:
+        # ciężkie zależności (yt-dlp, whisper/pyannote) ładowane dopiero przy pełnym pipeline
+        from yt_download import download_audio_from_youtube
+        from transcribe import transcribe_api
+
+        audio_path = download_audio_from_youtube(url)
+        logger.info(f"[PROCESS] Audio downloaded: {audio_path}")
+
+        progress("transcribe")
+        transcript_txt_path = transcribe_api(audio_path)  # zwraca ścieżkę txt
+    logger.info(f"[PROCESS] Transcription TXT: {transcript_txt_path}")
+
+    transcript_json_path = str(Path(transcript_txt_path).with_suffix(".json"))
+    if not Path(transcript_json_path).exists():
+        raise RuntimeError(f"Brak pliku JSON transkryptu po transcribe_api: {transcript_json_path}")
+
+    progress("chunk")
+    chunks_json_path = chunk_transcript_json(transcript_json_path, **CHUNK_PARAMS)
+    logger.info(f"[PROCESS] Chunks JSON created: {chunks_json_path}")
+
+    progress("index")
+    n_chunks, index_status = index_chunks(vid, chunks_json_path, force_reindex=True)
+    return {
+        "mode": "processed_new",
+        "video_id": vid,
+        "audio": audio_path,
+        "transcript_txt": transcript_txt_path,
+        "transcript_json": transcript_json_path,
+        "chunks_json": chunks_json_path,
+        "indexed_chunks": n_chunks,
+        "index": index_status,
+        "summary_job": maybe_schedule_summary(precompute_summary, vid, chunks_json_path, summary_max_tokens),
+    }
@@ -0,0 +1,308 @@
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from config import DATA_DIR
+from logging_config import get_logger
+from tracing import current_span, start_trace
+
+try:
+    import fcntl
+except ImportError:  # Windows – żywotność właściciela tylko po PID
+    fcntl = None
+
+logger = get_logger(__name__)
+
+# Zadania w tle (np. ingest filmu): ograniczona pula wątków, trwała tabela zadań w SQLite
+# i single-flight po (kind, key) – drugie zgłoszenie tego samego video_id dostaje trwające zadanie.
+# Statusy: queued -> running -> done | error. Etap (stage) ustawia handler przez progress(stage).
+JOBS_DB = Path(os.getenv("JOBS_DB") or Path(DATA_DIR) / "jobs.sqlite")
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_MAX_PENDING = int(os.getenv("JOB_MAX_PENDING", "32"))  # limit zadań w kolejce (queued)
+
+ACTIVE_STATUSES = ("queued", "running")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    key TEXT,
+    status TEXT NOT NULL,
+    stage TEXT,
+    params TEXT,
+    result TEXT,
+    error TEXT,
+    owner TEXT,
+    created_at REAL,
+    started_at REAL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_kind_key ON jobs (kind, key, status);
+"""
+
+# właściciel = host:pid:token procesu; sam PID nie wystarcza – po restarcie kontenera uvicorn znów bywa PID 1.
+# Proces trzyma przez cały czas życia blokadę pliku job_owners/<token>.lock – zwolniona blokada = właściciel nie żyje.
+_OWNER_TOKEN = uuid.uuid4().hex[:16]
+_OWNER = f"{socket.gethostname()}:{os.getpid()}:{_OWNER_TOKEN}"
+_OWNERS_DIR = JOBS_DB.parent / "job_owners"
+_owner_lock_file = None
+_handlers: Dict[str, Callable[[Dict[str, Any], Callable[[str], None]], Dict[str, Any]]] = {}
+_executor = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix="job")
+# rodzaje zadań z własną pulą (register(..., workers=N)) – długie zadania nie zajmują slotów JOB_WORKERS
+_executors: Dict[str, ThreadPoolExecutor] = {}
+_pool_workers: Dict[str, int] = {}
+_init_lock = threading.Lock()
+_initialized = False
+
+
+class JobQueueFull(RuntimeError):
+    pass
+
+
+def _connect() -> sqlite3.Connection:
+    conn = sqlite3.connect(str(JOBS_DB), timeout=30, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def _init():
+    global _initialized
+    with _init_lock:
+        if _initialized:
+            return
+        JOBS_DB.parent.mkdir(parents=True, exist_ok=True)
+        _hold_owner_lock()
+        conn = _connect()
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+            _recover_orphans(conn)
+        finally:
+            conn.close()
+        _initialized = True
+
+
+def _hold_owner_lock():
+    global _owner_lock_file
+    if fcntl is None:
+        return
+    _OWNERS_DIR.mkdir(parents=True, exist_ok=True)
+    _owner_lock_file = (_OWNERS_DIR / f"{_OWNER_TOKEN}.lock").open("a")
+    fcntl.flock(_owner_lock_file, fcntl.LOCK_EX)
+
+
+def _owner_alive(owner: Optional[str]) -> bool:
+    host, pid, token = ((owner or "").split(":") + ["", "", ""])[:3]
+    if host != socket.gethostname():
+        return True  # zadanie innej maszyny – nie ruszamy
+    if not token:
+        return False  # dawny format host:pid – sprzed restartu z tym kodem
+    if fcntl is None:
+        try:
+            os.kill(int(pid), 0)
+            return True
+        except (ProcessLookupError, ValueError):
+            return False
+        except PermissionError:
+            return True
+    path = _OWNERS_DIR / f"{token}.lock"
+    if not path.exists():
+        return False
+    with path.open("a") as f:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return True  # blokadę trzyma działający proces (np. inny worker uvicorn)
+        fcntl.flock(f, fcntl.LOCK_UN)
+    path.unlink(missing_ok=True)
+    return False
+
+
+def _recover_orphans(conn: sqlite3.Connection):
+    # zadania aktywne (queued i running) procesów, które już nie żyją (restart serwera), oznaczamy jako przerwane –
+    # inaczej deduplikacja w submit() wiecznie zwracałaby martwe zadanie dla tego klucza
+    rows = conn.execute(
+        f"SELECT id, owner FROM jobs WHERE status IN ({','.join('?' * len(ACTIVE_STATUSES))})", ACTIVE_STATUSES
+    ).fetchall()
+    for row in rows:
+        _reclaim_if_orphaned(conn, row)
+
+
+def _reclaim_if_orphaned(conn: sqlite3.Connection, row: sqlite3.Row) -> bool:
+    """Aktywne zadanie martwego procesu (restart, padnięty worker) -> error. True, gdy oznaczone."""
+    if row["owner"] == _OWNER or _owner_alive(row["owner"]):
+        return False
+    conn.execute("UPDATE jobs SET status='error', error=?, finished_at=? WHERE id=?",
+                 ("przerwane (proces właściciela nie żyje)", time.time(), row["id"]))
+    logger.warning(f"[JOBS] orphaned job marked as error id={row['id']} owner={row['owner']}")
+    return True
+
+
+def _row_to_job(row: sqlite3.Row) -> Dict[str, Any]:
+    job = dict(row)
+    for field in ("params", "result"):
+        job[field] = json.loads(job[field]) if job.get(field) else None
+    return job
+
+
+def _update(job_id: str, **fields: Any):
+    cols = ", ".join(f"{k}=?" for k in fields)
+    conn = _connect()
+    try:
+        conn.execute(f"UPDATE jobs SET {cols} WHERE id=?", (*fields.values(), job_id))
+    finally:
+        conn.close()
+
+
+def register(kind: str, handler: Callable[[Dict[str, Any], Callable[[str], None]], Dict[str, Any]],
+             workers: Optional[int] = None):
+    """
+    handler(params, progress) -> słownik wyniku (JSON); wyjątek = status error.
+    workers – osobna pula wątków dla tego rodzaju zadań (domyślnie wspólna pula JOB_WORKERS).
+    """
+    _handlers[kind] = handler
+    if workers is not None:
+        _pool_workers[kind] = max(1, workers)
+        _executors[kind] = ThreadPoolExecutor(max_workers=_pool_workers[kind], thread_name_prefix=f"job-{kind}")
+
+
+def _create(kind: str, key: Optional[str], params: Dict[str, Any], status: str) -> Tuple[Dict[str, Any], bool]:
+    """Atomowo: aktywne zadanie o tym samym (kind, key) albo nowy wiersz o statusie status."""
+    _init()
+    conn = _connect()
+    try:
+        # BEGIN IMMEDIATE: sprawdzenie i wstawienie atomowe także między procesami
+        conn.execute("BEGIN IMMEDIATE")
+        if key is not None:
+            rows = conn.execute(
+                "SELECT * FROM jobs WHERE kind=? AND key=? AND status IN (?, ?) ORDER BY created_at",
+                (kind, key, *ACTIVE_STATUSES),
+            ).fetchall()
+            # zadanie innego workera, który padł w trakcie – oznaczamy w tej samej transakcji i tworzymy nowe
+            row = next((r for r in rows if not _reclaim_if_orphaned(conn, r)), None)
+            if row is not None:
+                conn.execute("COMMIT")
+                logger.info(f"[JOBS] deduplicated kind={kind} key={key} -> id={row['id']}")
+                return _row_to_job(row), True
+        if status == "queued":
+            pending = conn.execute("SELECT COUNT(*) FROM jobs WHERE status='queued'").fetchone()[0]
+            if pending >= JOB_MAX_PENDING:
+                conn.execute("ROLLBACK")
+                raise JobQueueFull(f"Kolejka zadań pełna ({pending}/{JOB_MAX_PENDING})")
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        conn.execute(
+            "INSERT INTO jobs (id, kind, key, status, stage, params, owner, created_at, started_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (job_id, kind, key, status, status, json.dumps(params, ensure_ascii=False), _OWNER, now,
+             now if status == "running" else None),
+        )
+        conn.execute("COMMIT")
+    finally:
+        conn.close()
+    return get_job(job_id), False
+
+
+def submit(kind: str, key: Optional[str], params: Dict[str, Any]) -> Tuple[Dict[str, Any], bool]:
+    """
+    Zgłasza zadanie. Zwraca (zadanie, deduplicated) – przy aktywnym zadaniu o tym samym (kind, key)
+    zwracane jest ono zamiast nowego. JobQueueFull, gdy w kolejce jest JOB_MAX_PENDING zadań.
+    """
+    if kind not in _handlers:
+        raise KeyError(f"Nieznany rodzaj zadania: {kind}")
+    job, deduplicated = _create(kind, key, params, "queued")
+    if deduplicated:
+        return job, True
+    logger.info(f"[JOBS] queued kind={kind} key={key} id={job['id']}")
+    _executors.get(kind, _executor).submit(_run, job["id"], kind, params)
+    return get_job(job["id"]), False
+
+
+def claim(kind: str, key: str, params: Dict[str, Any]) -> Tuple[Dict[str, Any], bool]:
+    """
+    Zadanie wykonywane przez wołającego, nie przez pulę (np. film w potoku bulk) – ten sam single-flight po
+    (kind, key) co submit. Zwraca (zadanie, True) po przejęciu (status running; wołający kończy je przez
+    finish) albo (aktywne zadanie, False), gdy ten klucz już ktoś przetwarza.
+    """
+    job, deduplicated = _create(kind, key, params, "running")
+    if not deduplicated:
+        logger.info(f"[JOBS] claimed kind={kind} key={key} id={job['id']}")
+    return job, not deduplicated
+
+
+def set_stage(job_id: str, stage: str):
+    _update(job_id, stage=stage)
+
+
+def finish(job_id: str, result: Optional[Dict[str, Any]] = None, error: Optional[str] = None):
+    """Kończy zadanie przejęte przez claim: done z wynikiem albo error z komunikatem."""
+    if error is not None:
+        _update(job_id, status="error", finished_at=time.time(), error=error)
+    else:
+        _update(job_id, status="done", stage="done", finished_at=time.time(),
+                result=json.dumps(result or {}, ensure_ascii=False, default=str))
+
+
+def _run(job_id: str, kind: str, params: Dict[str, Any]):
+    # ślad zadania ma id zadania: etapy pipeline'u pod /traces/{job_id}
+    with start_trace(f"job {kind}", trace_id=job_id, kind=kind):
+        _run_traced(job_id, kind, params)
+
+
+def _run_traced(job_id: str, kind: str, params: Dict[str, Any]):
+    started = time.time()
+    _update(job_id, status="running", stage="running", started_at=started)
+
+    def _progress(stage: str):
+        _update(job_id, stage=stage)
+        current_span().event("stage", stage=stage)
+
+    try:
+        result = _handlers[kind](params, _progress)
+        _update(job_id, status="done", stage="done", finished_at=time.time(),
+                result=json.dumps(result, ensure_ascii=False, default=str))
+        logger.info(f"[JOBS] done kind={kind} id={job_id} in {time.time() - started:.1f}s")
+    except Exception as e:
+        logger.exception(f"[JOBS] ERROR kind={kind} id={job_id}: {e}")
+        _update(job_id, status="error", finished_at=time.time(), error=str(e))
+
+
+def get_job(job_id: str) -> Optional[Dict[str, Any]]:
+    _init()
+    conn = _connect()
+    try:
+        row = conn.execute("SELECT * FROM jobs WHERE id=?", (job_id,)).fetchone()
+    finally:
+        conn.close()
+    return _row_to_job(row) if row else None
+
+
+def wait_job(job_id: str, timeout: Optional[float] = None, poll_s: float = 0.5) -> Optional[Dict[str, Any]]:
+    """Czeka na zakończenie zadania (done/error) albo timeout; zwraca ostatni stan."""
+    deadline = None if timeout is None else time.monotonic() + timeout
+    while True:
+        job = get_job(job_id)
+        if job is None or job["status"] not in ACTIVE_STATUSES:
+            return job
+        if deadline is not None and time.monotonic() >= deadline:
+            return job
+        time.sleep(poll_s)
+
+
+def job_stats() -> Dict[str, Any]:
+    _init()
+    conn = _connect()
+    try:
+        rows = conn.execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status").fetchall()
+    finally:
+        conn.close()
+    return {"workers": JOB_WORKERS, "max_pending": JOB_MAX_PENDING,
+            "pools": dict(_pool_workers),
+            **{r["status"]: r["n"] for r in rows}}
@@ -0,0 +1,117 @@
+import os
+import threading
+from typing import Any, Dict, Optional
+
+import httpx
+
+from config import OPENAI_API_KEY, MODEL_BACKEND
+
+# Wspólna warstwa klientów LLM: jeden pulowany klient HTTP (keep-alive) na proces, wspólne timeouty
+# i polityka ponowień (retry z wykładniczym backoffem w SDK openai: błędy połączenia, 408/409/429/5xx).
+# OPENAI_BASE_URL pozwala wskazać zgodny serwer, np. lokalny zamiennik z local_llm_server.py.
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL") or None
+LLM_TIMEOUT_S = float(os.getenv("LLM_TIMEOUT_S", "120"))
+LLM_CONNECT_TIMEOUT_S = float(os.getenv("LLM_CONNECT_TIMEOUT_S", "10"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "64"))
+LLM_MAX_KEEPALIVE = int(os.getenv("LLM_MAX_KEEPALIVE", "32"))
+LLM_KEEPALIVE_EXPIRY_S = float(os.getenv("LLM_KEEPALIVE_EXPIRY_S", "60"))
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "text-embedding-3-small")
+
+_lock = threading.RLock()  # fabryki klientów wywołują się nawzajem (np. OpenAI -> http)
+_clients: Dict[str, Any] = {}
+
+
+def _timeout() -> httpx.Timeout:
+    return httpx.Timeout(LLM_TIMEOUT_S, connect=LLM_CONNECT_TIMEOUT_S)
+
+
+def _limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=LLM_MAX_CONNECTIONS,
+        max_keepalive_connections=LLM_MAX_KEEPALIVE,
+        keepalive_expiry=LLM_KEEPALIVE_EXPIRY_S,
+    )
+
+
+def _shared(key: str, factory):
+    with _lock:
+        if key not in _clients:
+            _clients[key] = factory()
+        return _clients[key]
+
+
+def get_http_client() -> httpx.Client:
+    return _shared("http", lambda: httpx.Client(limits=_limits(), timeout=_timeout()))
+
+
+def get_async_http_client() -> httpx.AsyncClient:
+    return _shared("http_async", lambda: httpx.AsyncClient(limits=_limits(), timeout=_timeout()))
+
+
+def get_openai_client():
+    """Współdzielony klient OpenAI (sync) na pulowanym połączeniu HTTP."""
+    from openai import OpenAI
+    return _shared("openai", lambda: OpenAI(
+        api_key=OPENAI_API_KEY,
+        base_url=OPENAI_BASE_URL,
+        timeout=_timeout(),
+        max_retries=LLM_MAX_RETRIES,
+        http_client=get_http_client(),
+    ))
+
+
+def get_async_openai_client():
+    """Współdzielony klient AsyncOpenAI – dla endpointów asynchronicznych."""
+    from openai import AsyncOpenAI
+    return _shared("openai_async", lambda: AsyncOpenAI(
+        api_key=OPENAI_API_KEY,
+        base_url=OPENAI_BASE_URL,
+        timeout=_timeout(),
+        max_retries=LLM_MAX_RETRIES,
+        http_client=get_async_http_client(),
+    ))
+
+
+def get_chat_client():
+    """Klient do chat.completions: lokalny deterministyczny (MODEL_BACKEND=local) albo OpenAI."""
+    if MODEL_BACKEND == "local":
+        from local_models import LocalChatClient
+        return _shared("chat_local", LocalChatClient)
+    return get_openai_client()
+
+
+def get_async_chat_client():
+    """Asynchroniczny klient chat.completions (endpointy async): AsyncLocalChatClient albo AsyncOpenAI."""
+    if MODEL_BACKEND == "local":
+        from local_models import AsyncLocalChatClient
+        return _shared("chat_local_async", AsyncLocalChatClient)
+    return get_async_openai_client()
+
+
+def embedding_model_id(model: Optional[str] = None) -> str:
+    """Identyfikator modelu embeddingów zapisywany w manifeście indeksu (zmiana = ponowne indeksowanie)."""
+    if MODEL_BACKEND == "local":
+        from local_models import LOCAL_EMBEDDING_DIM
+        return f"local:hashing-{LOCAL_EMBEDDING_DIM}"
+    return model or EMBEDDING_MODEL
+
+
+def get_embeddings(model: Optional[str] = None):
+    """Embeddingi (embed_documents/embed_query i async aembed_*) na wspólnej puli połączeń."""
+    if MODEL_BACKEND == "local":
+        from local_models import HashingEmbeddings
+        return _shared("embeddings_local", HashingEmbeddings)
+    from langchain_openai import OpenAIEmbeddings
+    model = model or EMBEDDING_MODEL
+    return _shared(f"embeddings:{model}", lambda: OpenAIEmbeddings(
+        api_key=OPENAI_API_KEY,
+        model=model,
+        base_url=OPENAI_BASE_URL,
+        max_retries=LLM_MAX_RETRIES,
+        request_timeout=LLM_TIMEOUT_S,
+        http_client=get_http_client(),
+        http_async_client=get_async_http_client(),
+        # serwery zgodne z API (np. lokalny zamiennik) nie przyjmują list tokenów zamiast tekstu
+        check_embedding_ctx_length=OPENAI_BASE_URL is None,
+    ))
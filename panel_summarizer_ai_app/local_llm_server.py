@@ -0,0 +1,155 @@
+"""
+Lokalny zamiennik API OpenAI do testów obciążeniowych i benchmarków offline.
+
+Endpointy zgodne z klientem openai: /v1/chat/completions (także stream SSE), /v1/embeddings,
+/v1/audio/transcriptions, /v1/models. Odpowiedzi są deterministyczne (local_models.py);
+opcjonalne opóźnienia LOCAL_LLM_TTFT_MS / LOCAL_LLM_TOKEN_MS udają czas generowania.
+
+Uruchomienie:
+    python local_llm_server.py --port 8001
+    OPENAI_BASE_URL=http://127.0.0.1:8001/v1 OPENAI_API_KEY=local uvicorn main:app
+"""
+import argparse
+import asyncio
+import hashlib
+import io
+import itertools
+import json
+import os
+import time
+import wave
+from typing import Any, Dict, List, Union
+
+from fastapi import FastAPI, File, Form, UploadFile
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+
+from local_models import HashingEmbeddings, local_completion, LOCAL_LLM_TTFT_MS, LOCAL_LLM_TOKEN_MS
+
+LOCAL_TRANSCRIBE_SEGMENT_S = float(os.getenv("LOCAL_TRANSCRIBE_SEGMENT_S", "5"))
+
+app = FastAPI(title="Local LLM stand-in")
+_embeddings = HashingEmbeddings()
+_ids = itertools.count(1)
+_WORDS = ["panel", "technologia", "dane", "energia", "rynek", "państwo", "sztuczna", "inteligencja",
+          "regulacja", "edukacja", "media", "bezpieczeństwo", "innowacje", "koszty", "przyszłość"]
+
+
+class ChatIn(BaseModel):
+    model: str = "local"
+    messages: List[Dict[str, Any]]
+    stream: bool = False
+    max_tokens: int | None = None
+    max_completion_tokens: int | None = None
+    stream_options: Dict[str, Any] | None = None
+
+
+class EmbeddingsIn(BaseModel):
+    model: str = "local"
+    input: Union[str, List[str], List[int], List[List[int]]]
+
+
+def _usage(messages: List[Dict[str, Any]], text: str) -> Dict[str, int]:
+    prompt = sum(len(str(m.get("content") or "").split()) for m in messages)
+    completion = len(text.split())
+    return {"prompt_tokens": prompt, "completion_tokens": completion, "total_tokens": prompt + completion}
+
+
+def _chunk(cid: str, model: str, delta: Dict[str, Any], finish: str | None = None) -> str:
+    payload = {
+        "id": cid, "object": "chat.completion.chunk", "created": int(time.time()), "model": model,
+        "choices": [{"index": 0, "delta": delta, "finish_reason": finish}],
+    }
+    return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(data: ChatIn):
+    text = local_completion(data.messages, max_tokens=data.max_completion_tokens or data.max_tokens)
+    cid = f"chatcmpl-local-{next(_ids)}"
+    if not data.stream:
+        if LOCAL_LLM_TTFT_MS or LOCAL_LLM_TOKEN_MS:
+            await asyncio.sleep((LOCAL_LLM_TTFT_MS + LOCAL_LLM_TOKEN_MS * len(text.split())) / 1000)
+        return {
+            "id": cid, "object": "chat.completion", "created": int(time.time()), "model": data.model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+            "usage": _usage(data.messages, text),
+        }
+
+    async def _sse():
+        if LOCAL_LLM_TTFT_MS:
+            await asyncio.sleep(LOCAL_LLM_TTFT_MS / 1000)
+        yield _chunk(cid, data.model, {"role": "assistant", "content": ""})
+        for i, word in enumerate(text.split(" ")):
+            if LOCAL_LLM_TOKEN_MS:
+                await asyncio.sleep(LOCAL_LLM_TOKEN_MS / 1000)
+            yield _chunk(cid, data.model, {"content": word if i == 0 else " " + word})
+        yield _chunk(cid, data.model, {}, finish="stop")
+        if (data.stream_options or {}).get("include_usage"):
+            usage = {"id": cid, "object": "chat.completion.chunk", "created": int(time.time()),
+                     "model": data.model, "choices": [], "usage": _usage(data.messages, text)}
+            yield f"data: {json.dumps(usage)}\n\n"
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(_sse(), media_type="text/event-stream")
+
+
+@app.post("/v1/embeddings")
+def embeddings(data: EmbeddingsIn):
+    items = data.input if isinstance(data.input, list) else [data.input]
+    if items and isinstance(items[0], int):
+        items = [items]
+    # listy tokenów (tryb check_embedding_ctx_length) – hashujemy ich zapis tekstowy
+    texts = [t if isinstance(t, str) else " ".join(map(str, t)) for t in items]
+    vecs = _embeddings.embed_documents(texts)
+    tokens = sum(len(t.split()) for t in texts)
+    return {
+        "object": "list",
+        "model": data.model,
+        "data": [{"object": "embedding", "index": i, "embedding": v} for i, v in enumerate(vecs)],
+        "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+    }
+
+
+def _audio_duration(raw: bytes) -> float:
+    try:
+        with wave.open(io.BytesIO(raw)) as w:
+            return w.getnframes() / float(w.getframerate() or 16000)
+    except (wave.Error, EOFError):
+        return len(raw) / 32000.0  # przybliżenie: 16 kHz, mono, 16 bit
+
+
+@app.post("/v1/audio/transcriptions")
+async def transcriptions(file: UploadFile = File(...), model: str = Form("whisper-1"),
+                         response_format: str = Form("json")):
+    raw = await file.read()
+    duration = _audio_duration(raw)
+    seed = hashlib.md5(raw[:65536]).digest()
+    segments = []
+    t, i = 0.0, 0
+    while t < duration:
+        end = min(duration, t + LOCAL_TRANSCRIBE_SEGMENT_S)
+        words = [_WORDS[(seed[(i + k) % len(seed)] + i) % len(_WORDS)] for k in range(6)]
+        segments.append({"id": i, "start": round(t, 2), "end": round(end, 2),
+                         "text": f" Fragment {i + 1}: " + " ".join(words) + "."})
+        t, i = end, i + 1
+    text = "".join(s["text"] for s in segments).strip()
+    if response_format == "verbose_json":
+        return {"task": "transcribe", "language": "polish", "duration": round(duration, 2),
+                "text": text, "segments": segments}
+    return {"text": text}
+
+
+@app.get("/v1/models")
+def models():
+    return {"object": "list", "data": [{"id": "local", "object": "model", "owned_by": "local"}]}
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8001)
+    args = ap.parse_args()
+    uvicorn.run(app, host=args.host, port=args.port)
@@ -0,0 +1,200 @@
+import asyncio
+import hashlib
+import json
+import math
+import os
+import re
+import time
+from types import SimpleNamespace
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Deterministyczne, lokalne zamienniki modeli (MODEL_BACKEND=local) – do benchmarków i testów offline.
+# Nie udają jakości prawdziwych modeli; mają dawać powtarzalne wyniki i realistyczny kształt danych.
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+LOCAL_EMBEDDING_DIM = 384
+# opcjonalne opóźnienia udające czas generowania (ms): do pierwszego tokenu i na każdy token
+LOCAL_LLM_TTFT_MS = float(os.getenv("LOCAL_LLM_TTFT_MS", "0"))
+LOCAL_LLM_TOKEN_MS = float(os.getenv("LOCAL_LLM_TOKEN_MS", "0"))
+
+
+def _tokens(text: str) -> List[str]:
+    return [t.lower() for t in _WORD_RE.findall(text or "") if len(t) > 2]
+
+
+def _bucket(token: str, dim: int) -> Tuple[int, float]:
+    h = hashlib.md5(token.encode("utf-8")).digest()
+    idx = int.from_bytes(h[:4], "little") % dim
+    sign = 1.0 if h[4] & 1 else -1.0
+    return idx, sign
+
+
+class HashingEmbeddings:
+    """
+    Embeddingi przez hashowanie tokenów i prefiksów (5 znaków, tolerancja fleksji) do wektora o stałym wymiarze.
+    Interfejs jak langchain OpenAIEmbeddings (embed_documents/embed_query) + encode jak SentenceTransformer.
+    """
+
+    def __init__(self, dim: int = LOCAL_EMBEDDING_DIM):
+        self.dim = dim
+
+    def _vec(self, text: str) -> List[float]:
+        v = [0.0] * self.dim
+        for tok in _tokens(text):
+            for feat in (tok, "p:" + tok[:5]):
+                idx, sign = _bucket(feat, self.dim)
+                v[idx] += sign
+        norm = math.sqrt(sum(x * x for x in v)) or 1.0
+        return [x / norm for x in v]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._vec(t) for t in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._vec(text)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embed_documents(texts)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return self._vec(text)
+
+    def encode(self, texts: Sequence[str], batch_size: Optional[int] = None, normalize_embeddings: bool = True, **_):
+        return np.asarray(self.embed_documents(list(texts)), dtype=np.float32)
+
+
+class LocalCrossEncoder:
+    """Zamiennik CrossEncoder.predict: pokrycie tokenów zapytania przez tekst (prefiksy 5 znaków)."""
+
+    def __init__(self, model_name: str = "local"):
+        self.model_name = model_name
+
+    @staticmethod
+    def _score(a: str, b: str) -> float:
+        qa = {t[:5] for t in _tokens(a)}
+        if not qa:
+            return 0.0
+        tb = {t[:5] for t in _tokens(b)}
+        return len(qa & tb) / len(qa)
+
+    def predict(self, pairs: Iterable[Tuple[str, str]], batch_size: int = 32, **_) -> np.ndarray:
+        return np.asarray([self._score(a, b) for a, b in pairs], dtype=np.float32)
+
+
+def _split_sentences(text: str) -> List[str]:
+    return [p.strip() for p in re.split(r"(?<=[\.\?\!])\s+", text or "") if p.strip()]
+
+
+def local_completion(messages: List[Dict[str, str]], max_tokens: Optional[int] = None) -> str:
+    """
+    Deterministyczna "odpowiedź" LLM: ekstrakcja zdań z treści użytkownika najlepiej pokrywających pytanie
+    (QA), pierwsze zdania każdego fragmentu (streszczenie) albo JSON z pytaniami (parser pytań).
+    """
+    system = " ".join(m.get("content", "") for m in messages if m.get("role") == "system")
+    user = "\n".join(m.get("content", "") for m in messages if m.get("role") == "user")
+    limit_words = max(16, int((max_tokens or 400) * 0.75))
+
+    if "JSON" in system:
+        raw = user.split("\n\n")[0].split("\n", 1)[-1]
+        qs = [q.strip() + "?" for q in raw.split("?") if q.strip()]
+        return json.dumps({"questions": qs or [raw.strip()]}, ensure_ascii=False)
+
+    m = re.search(r"PYTANIE:\s*(.+)", user)
+    if m:
+        question = m.group(1).strip()
+        ctx = user[: m.start()]
+        scorer = LocalCrossEncoder()
+        sents = [s for s in _split_sentences(ctx) if not s.startswith("[CTX")]
+        ranked = sorted(sents, key=lambda s: scorer._score(question, s), reverse=True)
+        best = [s for s in ranked[:3] if scorer._score(question, s) > 0]
+        if not best:
+            return "Brak danych w dostarczonym kontekście."
+        return " ".join(best)
+
+    # streszczenie: po dwa pierwsze zdania z kolejnych akapitów, do limitu słów
+    out: List[str] = []
+    for para in [p for p in user.split("\n") if p.strip()]:
+        out.extend(_split_sentences(para)[:2])
+        if sum(len(s.split()) for s in out) >= limit_words:
+            break
+    words = " ".join(out).split()
+    return " ".join(words[:limit_words])
+
+
+def _chunk(delta: str, model: str) -> Any:
+    return SimpleNamespace(model=model, choices=[SimpleNamespace(index=0, delta=SimpleNamespace(content=delta))])
+
+
+def _usage(messages: List[Dict[str, str]], text: str) -> Any:
+    return SimpleNamespace(
+        prompt_tokens=sum(len(m.get("content", "").split()) for m in messages),
+        completion_tokens=len(text.split()),
+    )
+
+
+def _completion(text: str, model: str, messages: List[Dict[str, str]]) -> Any:
+    return SimpleNamespace(
+        model=model,
+        usage=_usage(messages, text),
+        choices=[SimpleNamespace(index=0, message=SimpleNamespace(role="assistant", content=text))],
+    )
+
+
+def _stream_chunks(text: str, model: str) -> Iterable[Any]:
+    if LOCAL_LLM_TTFT_MS:
+        time.sleep(LOCAL_LLM_TTFT_MS / 1000)
+    for i, word in enumerate(text.split(" ")):
+        if LOCAL_LLM_TOKEN_MS:
+            time.sleep(LOCAL_LLM_TOKEN_MS / 1000)
+        yield _chunk(word if i == 0 else " " + word, model)
+
+
+async def _astream_chunks(text: str, model: str) -> AsyncIterator[Any]:
+    if LOCAL_LLM_TTFT_MS:
+        await asyncio.sleep(LOCAL_LLM_TTFT_MS / 1000)
+    for i, word in enumerate(text.split(" ")):
+        if LOCAL_LLM_TOKEN_MS:
+            await asyncio.sleep(LOCAL_LLM_TOKEN_MS / 1000)
+        yield _chunk(word if i == 0 else " " + word, model)
+
+
+def _generation_delay_s(text: str) -> float:
+    return (LOCAL_LLM_TTFT_MS + LOCAL_LLM_TOKEN_MS * len(text.split())) / 1000
+
+
+class _LocalCompletions:
+    def create(self, model: str, messages: List[Dict[str, str]], stream: bool = False,
+               max_tokens: Optional[int] = None, max_completion_tokens: Optional[int] = None, **_):
+        text = local_completion(messages, max_tokens=max_completion_tokens or max_tokens)
+        if stream:
+            return _stream_chunks(text, model)
+        if LOCAL_LLM_TTFT_MS or LOCAL_LLM_TOKEN_MS:
+            time.sleep(_generation_delay_s(text))
+        return _completion(text, model, messages)
+
+
+class _AsyncLocalCompletions:
+    async def create(self, model: str, messages: List[Dict[str, str]], stream: bool = False,
+                     max_tokens: Optional[int] = None, max_completion_tokens: Optional[int] = None, **_):
+        text = local_completion(messages, max_tokens=max_completion_tokens or max_tokens)
+        if stream:
+            return _astream_chunks(text, model)
+        if LOCAL_LLM_TTFT_MS or LOCAL_LLM_TOKEN_MS:
+            await asyncio.sleep(_generation_delay_s(text))
+        return _completion(text, model, messages)
+
+
+class LocalChatClient:
+    """Minimalny zamiennik klienta OpenAI: client.chat.completions.create(...) (stream i bez streamu)."""
+
+    def __init__(self):
+        self.chat = SimpleNamespace(completions=_LocalCompletions())
+
+
+class AsyncLocalChatClient:
+    """Zamiennik AsyncOpenAI: await client.chat.completions.create(...); stream jako async iterator."""
+
+    def __init__(self):
+        self.chat = SimpleNamespace(completions=_AsyncLocalCompletions())
@@ -0,0 +1,68 @@
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import time
+
+# Logowanie strukturalne: jedna linia JSON na wpis (LOG_FORMAT=json, domyślnie) albo czytelny tekst
+# (LOG_FORMAT=text). Przedrostek komunikatu w stylu "[PROCESS] ..." trafia do pola "tag".
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json").lower()
+
+_TAG_RE = re.compile(r"^\[([A-Z_]+)\](?:\[([^\]]+)\])?\s*")
+_STD_ATTRS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+_configured = False
+_lock = threading.Lock()
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        msg = record.getMessage()
+        out = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(record.created)) + f".{int(record.msecs):03d}",
+            "level": record.levelname,
+            "logger": record.name,
+        }
+        m = _TAG_RE.match(msg)
+        if m:
+            out["tag"] = m.group(1)
+            if m.group(2):
+                out["subtag"] = m.group(2)
+            msg = msg[m.end():]
+        out["msg"] = msg
+        # korelacja z /traces/{id}: id śladu bieżącego żądania (tracing.py, jeśli załadowany)
+        tracing = sys.modules.get("tracing")
+        trace_id = tracing.current_trace_id() if tracing is not None else None
+        if trace_id:
+            out["trace_id"] = trace_id
+        # pola przekazane przez extra={...}
+        for key, value in record.__dict__.items():
+            if key not in _STD_ATTRS and not key.startswith("_"):
+                out[key] = value
+        if record.exc_info:
+            out["exc"] = self.formatException(record.exc_info)
+        return json.dumps(out, ensure_ascii=False, default=str)
+
+
+def setup_logging(level: str = LOG_LEVEL, fmt: str = LOG_FORMAT):
+    global _configured
+    with _lock:
+        if _configured:
+            return
+        handler = logging.StreamHandler(sys.stdout)
+        if fmt == "json":
+            handler.setFormatter(JsonFormatter())
+        else:
+            handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s %(message)s"))
+        root = logging.getLogger("panel")
+        root.handlers[:] = [handler]
+        root.setLevel(level)
+        root.propagate = False
+        _configured = True
+
+
+def get_logger(name: str) -> logging.Logger:
+    setup_logging()
+    return logging.getLogger(f"panel.{name}")
@@ -1,225 +1,603 @@
+import asyncio
+import hashlib
 import json
 import os
-import traceback
-from typing import List, Dict, Any, Optional
+from typing import AsyncIterator, Iterable, List, Dict, Any, Optional
 from pathlib import Path
-from fastapi import FastAPI
-from fastapi.responses import StreamingResponse
+import time
+import uuid
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
 from pydantic import BaseModel
 
-from api_utils import build_contexts_for_ask
-from evaluator import evaluate_answer_crossencoder
-from yt_download import download_audio_from_youtube
-from transcribe import transcribe_api
-from chunking import chunk_transcript_json
-from vectors_repository import get_collection, store_chunks, query_db
-from summarizer import summarize, answer
+from eval_queue import submit_evaluation, evaluation_future, EVAL_WAIT_TIMEOUT
+from vectors_repository import aembed_question, aembed_questions, index_version, get_manifest
+from answer_cache import lookup as lookup_answer, store as store_answer, replay as replay_answer, answer_cache_stats
+from summarizer import summarize_async, answer_async, split_questions_async, pack_answer_contexts
 from api_doc import documentation
+from summary_cache import cache_stats
+from summary_store import load_summary, save_summary, pending_summary
+from summarizer import PROGRESS_MARKER
 from yt_utils import extract_video_id 
-from api_utils import resolve_text_for_summarize, build_contexts_for_ask
+from api_utils import resolve_text_for_summarize, abuild_contexts_for_ask, abuild_contexts_for_ask_batch, merge_contexts
+from async_utils import run_cpu, run_io, wait_future
+from ingest import ingest_youtube, COLLECTION_NAME
+from bulk_ingest import run_bulk, bulk_status, BULK_MAX_VIDEOS, BULK_JOB_WORKERS
+from jobs import register, submit as submit_job, get_job, wait_job, job_stats, JobQueueFull, ACTIVE_STATUSES
+from sessions import create_session, update_session, get_session, session_stats
+from logging_config import get_logger
+from metrics import HTTP_DURATION, CONTENT_TYPE_LATEST, metrics_payload
+from tracing import TraceMiddleware, current_span, current_trace_id, get_trace, recent_traces, span, waterfall
+
+logger = get_logger("main")
 
 os.environ.setdefault("PYANNOTE_AUDIO_DISABLE_TORCHCODEC", "1")
 
 app = FastAPI()
 
-# Bufory globalne
-LAST_USED_CONTEXTS: List[Dict[str, Any]] = []
-LAST_ASK_ANSWER: str = ""  # pełna odpowiedź z /ask_stream
-LAST_ASK_EVAL_CE: dict = {}
+@app.middleware("http")
+async def _http_metrics(request: Request, call_next):
+    # czas do odpowiedzi (dla streamów – do nagłówków; pełny czas strumienia w metrykach etapów/LLM)
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        route = request.scope.get("route")
+        path = getattr(route, "path", "unmatched")
+        HTTP_DURATION.labels(method=request.method, path=path, status=str(status)).observe(time.perf_counter() - started)
+
+# ślad na żądanie (X-Trace-Id, /traces/{id}); dodany po middleware metryk – obejmuje je z zewnątrz
+app.add_middleware(TraceMiddleware)
 
 APP_DIR = Path(__file__).resolve().parent 
 from config import DATA_DIR
 DATA_DIR_PATH = Path(DATA_DIR)
 TRANSCRIPTS_DIR = DATA_DIR_PATH / "transcripts"
-COLLECTION_NAME = "panel"
 
-# budowanie modeli ewaluacyjnych cross-encoder
-from evaluator import _get_ce
-relevancy_model = os.getenv("RELEVANCY_CE_MODEL", "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1")
-nli_model = os.getenv("NLI_CE_MODEL", "cross-encoder/nli-deberta-v3-base")
-_get_ce(relevancy_model)
-_get_ce(nli_model)
+# uvicorn --workers N (WEB_CONCURRENCY): stan i indeks muszą być współdzielone między procesami
+def _check_multiworker():
+    workers = int(os.getenv("WEB_CONCURRENCY", "1") or 1)
+    if workers <= 1:
+        return
+    from shared_state import SHARED_STATE
+    from vectors_repository import VECTOR_BACKEND, CHROMA_MODE
+    if not SHARED_STATE:
+        logger.warning(f"[WORKERS] {workers} workers with STATE_BACKEND=memory – sessions and caches are per process")
+    if VECTOR_BACKEND == "chroma" and CHROMA_MODE != "http":
+        logger.warning(f"[WORKERS] {workers} workers with CHROMA_MODE={CHROMA_MODE} – use CHROMA_MODE=http or VECTOR_BACKEND=flat")
+
+_check_multiworker()
+
+# budowanie modeli ewaluacyjnych cross-encoder przy starcie workera (te same nazwy co w evaluatorze –
+# jedna kopia na proces w model_manager; przy N workerach modele ładowane są N razy, po jednym na proces)
+from evaluator import _get_ce, RELEVANCY_MODEL, NLI_MODEL
+from model_manager import get_model_manager
+_get_ce(RELEVANCY_MODEL)
+_get_ce(NLI_MODEL)
 
 class YouTubeIn(BaseModel):
     url: str
+    precompute_summary: bool = False  # po chunkingu zleć podsumowanie w tle
+    summary_max_tokens: int = 2000
+    force_reindex: bool = False  # embeduj i zapisz chunki ponownie mimo zgodnego manifestu indeksu
+    wait: bool = False  # czekaj na wynik zadania (zgodność ze starymi klientami)
+
+class BulkIn(BaseModel):
+    urls: List[str]  # filmy, playlisty (list=...), kanały (@nazwa, /channel/...) – mieszane
+    precompute_summary: bool = False
+    summary_max_tokens: int = 2000
+    force_reindex: bool = False
+    max_videos: Optional[int] = None  # limit filmów w zadaniu (maks. BULK_MAX_VIDEOS)
+    wait: bool = False
 
 class AskIn(BaseModel):
     question: str
     top_k: int = 5
+    video_id: Optional[str] = None  # zawęża retrieval (i zakres cache odpowiedzi) do jednego filmu
+    session_id: Optional[str] = None  # /ask_eval_ce: sesja z /ask_stream lub /ask_ndjson
+    include_metrics: bool = True  # /ask_ndjson: czekaj na ewaluację CE i wyślij ją w strumieniu
+
+class AskBatchIn(BaseModel):
+    questions: List[str]
+    top_k: int = 5
+    video_id: Optional[str] = None
+    use_cache: bool = True  # odpowiedzi z cache dla prawie identycznych pytań (jak w /ask_ndjson)
+    include_contexts: bool = False  # konteksty w każdym zdarzeniu result (domyślnie tylko w sesji)
 
 class SummarizeIn(BaseModel):
     override_text: Optional[str] = None
     video_id: Optional[str] = None
     max_tokens: int = 800
+    refresh: bool = False  # wymuś ponowne wygenerowanie zamiast zapisanego podsumowania
+    progress: bool = False  # linie [POSTĘP] map-reduce w strumieniu przed właściwym podsumowaniem
+
+# ingest filmu jako zadanie w tle (jobs.py): single-flight po video_id, ograniczona pula workerów
+register("ingest_youtube", lambda params, progress: ingest_youtube(**params, progress=progress))
+# ingest wielu filmów (bulk_ingest.py): potok download -> transcribe -> index z osobną współbieżnością etapów
+register("ingest_bulk", lambda params, progress: run_bulk(**params, progress=progress), workers=BULK_JOB_WORKERS)
 
-def _existing_paths_for_id(video_id: str):
-    transcripts_dir = Path(DATA_DIR) / "transcripts"
-    txt = transcripts_dir / f"{video_id}.txt"
-    jsn = transcripts_dir / f"{video_id}.json"
-    chunks = transcripts_dir / f"{video_id}_chunks.json"
-    return txt, jsn, chunks
+def _job_view(job: Dict[str, Any]) -> Dict[str, Any]:
+    view = {k: job.get(k) for k in ("id", "kind", "key", "status", "stage", "error",
+                                    "created_at", "started_at", "finished_at")}
+    view["trace_id"] = job.get("id")  # ślad zadania: /traces/{id}
+    return view
 
 @app.post("/process_youtube")
 def process_youtube(data: YouTubeIn):
-    url = data.url
-    print(f"[PROCESS] /process_youtube called. url={url}")
-
+    """
+    Zgłasza ingest filmu jako zadanie w tle i od razu zwraca job_id (status: /jobs/{id}).
+    To samo video_id w trakcie przetwarzania dostaje istniejące zadanie (deduplicated=true).
+    wait=true zachowuje dawne zachowanie: odpowiedź dopiero z wynikiem.
+    """
+    logger.info(f"[PROCESS] /process_youtube called. url={data.url} wait={data.wait}")
+    vid = extract_video_id(data.url)
+    if not vid:
+        msg = "Nie można wyodrębnić video_id z URL. Podaj URL w formacie YouTube."
+        logger.error(f"[ERROR] {msg}")
+        return {"error": msg}
+
+    params = {"url": data.url, "precompute_summary": data.precompute_summary,
+              "summary_max_tokens": data.summary_max_tokens, "force_reindex": data.force_reindex}
     try:
-        print("[PROCESS] Extracting video_id...")
-        vid = extract_video_id(url)
-        print(f"[PROCESS] video_id={vid}")
-        if not vid:
-            msg = "Nie można wyodrębnić video_id z URL. Podaj URL w formacie YouTube."
-            print(f"[ERROR] {msg}")
-            return {"error": msg}
-
-        transcript_txt_path, transcript_json_path, chunks_json_path = _existing_paths_for_id(vid)
-        print(f"[PROCESS] Paths -> TXT={transcript_txt_path} JSON={transcript_json_path} CHUNKS={chunks_json_path}")
-
-        # Warunek użycia istniejących plików: transkrypcja JSON i chanki muszą istnieć
-        if transcript_txt_path.exists() and transcript_json_path.exists() and chunks_json_path.exists():
-            print("[PROCESS] Existing transcript JSON and chunks found. Reusing them...")
-            print("[PROCESS] Loading chunks...")
-            chunks = json.loads(Path(chunks_json_path).read_text(encoding="utf-8"))
-            print(f"[PROCESS] Loaded {len(chunks)} chunks.")
-            print(f"[PROCESS] Indexing chunks into collection '{COLLECTION_NAME}'...")
-            col = get_collection(COLLECTION_NAME)
-            print(f"[PROCESS] Storing chunks into collection '{COLLECTION_NAME}'...")
-            store_chunks(col, chunks)
-            print("[PROCESS] Indexing done.")
-
-            return {
-                "mode": "reuse_existing",
-                "video_id": vid,
-                "transcript_txt": str(transcript_txt_path) if transcript_txt_path.exists() else None,
-                "transcript_json": str(transcript_json_path),
-                "chunks_json": str(chunks_json_path),
-                "indexed_chunks": len(chunks)
-            }
-
-        # Brak kompletu plików -> pełne przetworzenie od nowa
-        print("[PROCESS] Missing transcript/chunks. Running full pipeline...")
-        print("[PROCESS] Step 1: Download audio from YouTube...")
-        audio_path = download_audio_from_youtube(url)
-        print(f"[PROCESS] Audio downloaded: {audio_path}")
-
-        print("[PROCESS] Step 2: Transcribe audio via API...")
-        transcript_txt_path = transcribe_api(audio_path)  # zwraca ścieżkę txt
-        print(f"[PROCESS] Transcription TXT: {transcript_txt_path}")
-
-        transcript_json_path = str(Path(transcript_txt_path).with_suffix(".json"))
-        print(f"[PROCESS] Expected transcription JSON: {transcript_json_path}")
-        if not Path(transcript_json_path).exists():
-            msg = "Brak pliku JSON transkryptu po transcribe_api"
-            print(f"[ERROR] {msg}")
-            return {"error": msg, "audio": audio_path, "txt": transcript_txt_path}
-
-        print("[PROCESS] Step 3: Chunk transcript JSON...")
-        chunks_json_path = chunk_transcript_json(
-            transcript_json_path,
-            chunk_min_tokens=400,
-            chunk_max_tokens=1000,
-            overlap_ratio=0.15
-        )
-        print(f"[PROCESS] Chunks JSON created: {chunks_json_path}")
-
-        print("[PROCESS] Step 4: Load chunks and index into vector DB...")
-        chunks = json.loads(Path(chunks_json_path).read_text(encoding="utf-8"))
-        print(f"[PROCESS] Loaded {len(chunks)} chunks.")
-        col = get_collection(COLLECTION_NAME)
-        store_chunks(col, chunks)
-        print(f"[PROCESS] Indexed chunks into collection '{COLLECTION_NAME}'.")
-
-        return {
-            "mode": "processed_new",
-            "video_id": vid,
-            "audio": audio_path,
-            "transcript_txt": transcript_txt_path,
-            "transcript_json": transcript_json_path,
-            "chunks_json": chunks_json_path,
-            "indexed_chunks": len(chunks)
-        }
-    except Exception as e:
-        print("[ERROR] Exception in process_youtube:")
-        print(str(e))
-        print(traceback.format_exc())
-        return {"error": f"process_youtube failed: {e}"}
+        job, deduplicated = submit_job("ingest_youtube", vid, params)
+    except JobQueueFull as e:
+        logger.warning(f"[PROCESS] {e}")
+        return JSONResponse(status_code=429, content={"error": str(e)})
+    current_span().set(job_id=job["id"], deduplicated=deduplicated)
+
+    if data.wait:
+        job = wait_job(job["id"])
+        if job["status"] == "error":
+            return {"error": f"process_youtube failed: {job['error']}", "job_id": job["id"]}
+        return {**job["result"], "job_id": job["id"], "deduplicated": deduplicated}
+    return {"job_id": job["id"], "status": job["status"], "video_id": vid, "deduplicated": deduplicated}
+
+@app.post("/process_bulk")
+def process_bulk(data: BulkIn):
+    """
+    Zgłasza ingest wielu filmów (playlisty, kanały, listy URL) jako jedno zadanie w tle. Filmy już zindeksowane
+    są pomijane. Postęp: /process_bulk/{job_id} (statusy filmów, zajętość etapów, przepustowość).
+    """
+    urls = [u.strip() for u in data.urls if u and u.strip()]
+    logger.info(f"[BULK] /process_bulk called. sources={len(urls)} wait={data.wait}")
+    if not urls:
+        return JSONResponse(status_code=422, content={"error": "Podaj co najmniej jeden URL."})
+    max_videos = min(data.max_videos or BULK_MAX_VIDEOS, BULK_MAX_VIDEOS)
+    options = {"precompute_summary": data.precompute_summary, "summary_max_tokens": data.summary_max_tokens,
+               "force_reindex": data.force_reindex, "max_videos": max_videos}
+    # klucz: te same źródła i opcje w trakcie przetwarzania dostają istniejące zadanie
+    key = hashlib.sha1(json.dumps([sorted(set(urls)), options], sort_keys=True).encode("utf-8")).hexdigest()
+    params = {"urls": urls, "bulk_id": uuid.uuid4().hex, **options}
+    try:
+        job, deduplicated = submit_job("ingest_bulk", key, params)
+    except JobQueueFull as e:
+        logger.warning(f"[BULK] {e}")
+        return JSONResponse(status_code=429, content={"error": str(e)})
+    current_span().set(job_id=job["id"], deduplicated=deduplicated)
+
+    if data.wait:
+        job = wait_job(job["id"])
+        if job["status"] == "error":
+            return {"error": f"process_bulk failed: {job['error']}", "job_id": job["id"]}
+        return {**job["result"], "job_id": job["id"], "deduplicated": deduplicated}
+    return {"job_id": job["id"], "status": job["status"], "sources": len(urls), "deduplicated": deduplicated}
+
+@app.get("/process_bulk/{job_id}")
+def process_bulk_status(job_id: str):
+    """Stan zadania bulk: na żywo (gdy działa w tym procesie) albo raport końcowy z tabeli zadań."""
+    job = get_job(job_id)
+    if job is None or job["kind"] != "ingest_bulk":
+        return JSONResponse(status_code=404, content={"error": f"Nie znaleziono zadania bulk {job_id}"})
+    view = _job_view(job)
+    if job["status"] == "done":
+        return {**view, **job["result"]}
+    live = bulk_status((job.get("params") or {}).get("bulk_id", ""))
+    return {**view, **(live or {})}
+
+@app.get("/jobs/{job_id}")
+def job_status(job_id: str):
+    job = get_job(job_id)
+    if job is None:
+        return JSONResponse(status_code=404, content={"error": f"Nie znaleziono zadania {job_id}"})
+    return _job_view(job)
+
+@app.get("/jobs/{job_id}/result")
+def job_result(job_id: str):
+    """Wynik zadania: 202 gdy jeszcze trwa, 500 z błędem, 200 z wynikiem po zakończeniu."""
+    job = get_job(job_id)
+    if job is None:
+        return JSONResponse(status_code=404, content={"error": f"Nie znaleziono zadania {job_id}"})
+    if job["status"] in ACTIVE_STATUSES:
+        return JSONResponse(status_code=202, content=_job_view(job))
+    if job["status"] == "error":
+        return JSONResponse(status_code=500, content={"error": job["error"], "job_id": job_id})
+    return {**job["result"], "job_id": job_id}
 
 
 @app.post("/summarize_stream")
-def summarize_stream(data: "SummarizeIn"):
+async def summarize_stream(data: "SummarizeIn"):
 
-    print(f"[STREAM] /summarize video_id={data.video_id} override={bool(data.override_text)} max_tokens={data.max_tokens}")
+    logger.info(f"[STREAM] /summarize video_id={data.video_id} override={bool(data.override_text)} max_tokens={data.max_tokens}")
 
-    def generator():
+    max_tokens = int(data.max_tokens or 2000) #dla bezpieczenstwa
+    use_store = bool(data.video_id) and not data.override_text
+
+    async def generator():
         try:
-            text = resolve_text_for_summarize(data)
-            for delta in summarize(text, max_tokens=int(data.max_tokens or 2000)): #dla bezpieczenstwa
+            if use_store and not data.refresh:
+                # podsumowanie przygotowane w tle: gotowe albo w trakcie liczenia z tym samym max_tokens
+                job = pending_summary(data.video_id)
+                if job is not None and job[1] == max_tokens:
+                    if data.progress:
+                        yield f"{PROGRESS_MARKER} podsumowanie jest przygotowywane w tle, czekam...\n"
+                    try:
+                        await wait_future(job[0])
+                    except Exception as e:
+                        logger.error(f"[STREAM] background summary failed, regenerating: {e}")
+                stored = await run_cpu(load_summary, data.video_id)
+                if stored and stored.get("max_tokens") == max_tokens:
+                    logger.info(f"[STREAM] serving stored summary video_id={data.video_id} source={stored.get('source')}")
+                    yield stored["summary"]
+                    return
+
+            text = await run_cpu(resolve_text_for_summarize, data)
+            parts: List[str] = []
+            async for delta in summarize_async(text, max_tokens=max_tokens, progress=data.progress):
                 if delta:
+                    # właściwe podsumowanie zaczyna się po znacznikach postępu map-reduce
+                    if parts or (delta.strip() and not delta.startswith(PROGRESS_MARKER)):
+                        parts.append(delta)
                     yield delta
+            if use_store and parts:
+                await run_cpu(save_summary, data.video_id, "".join(parts), max_tokens, source="on_demand")
         except Exception as e:
-            print("[ERROR] summarize_stream failed:")
-            print(traceback.format_exc())
+            logger.exception("[ERROR] summarize_stream failed:")
             yield f"\n\n[ERROR] {e}"
 
     return StreamingResponse(generator(), media_type="text/plain; charset=utf-8")
 
+async def _ask_events(data: AskIn, session_id: str) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Zdarzenia odpowiedzi dla jednej sesji: contexts -> delta... -> answer_done.
+    Konteksty i odpowiedź zapisywane są w sesji; ewaluację CE zlecamy w tle.
+    Embeddingi i LLM przez klientów async, retrieval z rerankingiem w puli CPU (async_utils).
+    """
+    started = time.perf_counter()
+    where = {"video_id": data.video_id} if data.video_id else None
+    q_vec = await aembed_question(data.question)
+    version = await run_io(index_version, COLLECTION_NAME, data.video_id)
+    with span("answer_cache_lookup") as sp:
+        cached = await run_io(lookup_answer, COLLECTION_NAME, data.video_id, q_vec, version, data.top_k)
+        sp.set(hit=cached is not None)
+    first_at = None
+    chunks: List[str] = []
+    if cached is not None:
+        # prawie to samo pytanie przy tej samej wersji indeksu – odtwarzamy zapisaną odpowiedź
+        logger.info(f"[ASK] answer cache hit sim={cached['similarity']:.3f} cached_question={cached['question']!r}")
+        contexts = cached["contexts"]
+        await run_io(update_session, session_id, contexts=contexts, status="answering", cached=True)
+        yield {"type": "contexts", "contexts": contexts, "cached": True,
+               "similarity": round(cached["similarity"], 4)}
+        deltas = _aiter(replay_answer(cached["answer"]))
+    else:
+        # pod-pytania: osobny retrieval dla każdego (wsadowo), odpowiedzi generowane współbieżnie;
+        # konteksty pakowane raz tutaj – zdarzenie, sesja, cache i ewaluacja dostają to, co widzi model
+        sub_questions = await split_questions_async(data.question)
+        per_question = None
+        if len(sub_questions) > 1:
+            per_question = await abuild_contexts_for_ask_batch(sub_questions, data.top_k, COLLECTION_NAME, where=where)
+            per_question = await run_cpu(lambda pq: [pack_answer_contexts(c) for c in pq], per_question)
+            contexts = merge_contexts(per_question)
+        else:
+            contexts = await abuild_contexts_for_ask(data.question, data.top_k, COLLECTION_NAME, where=where, q_vec=q_vec)
+            contexts = await run_cpu(pack_answer_contexts, contexts)
+        await run_io(update_session, session_id, contexts=contexts, status="answering", cached=False)
+        yield {"type": "contexts", "contexts": contexts, "cached": False, "sub_questions": sub_questions}
+        deltas = answer_async(contexts, data.question, top_k=len(contexts), packed=True,
+                              sub_questions=sub_questions or None, contexts_per_question=per_question)
+    retrieval_s = time.perf_counter() - started
+    async for delta in deltas:
+        if delta:
+            if first_at is None:
+                first_at = time.perf_counter()
+            chunks.append(delta)
+            yield {"type": "delta", "text": delta}
+    answer_txt = "".join(chunks)
+    if cached is None:
+        await run_io(store_answer, COLLECTION_NAME, data.video_id, data.question, q_vec, version, answer_txt,
+                     contexts, data.top_k)
+    # zapisz pełną odpowiedź po zakończeniu streamu i zleć ewaluację CE w tle
+    await run_io(update_session, session_id, answer=answer_txt, status="answered")
+    submit_evaluation(data.question, answer_txt, contexts)
+    yield {"type": "answer_done", "timings": {
+        "retrieval_s": round(retrieval_s, 4),
+        "ttft_s": round(first_at - started, 4) if first_at is not None else None,
+        "total_s": round(time.perf_counter() - started, 4),
+    }}
+
+
+async def _aiter(items: Iterable[str]) -> AsyncIterator[str]:
+    for item in items:
+        yield item
+
+
+async def _evaluate_session(session: Dict[str, Any]) -> Dict[str, Any]:
+    fut = evaluation_future(session["question"], session["answer"], session["contexts"])
+    with span("evaluate_ce_wait"):
+        metrics = await wait_future(fut, timeout=EVAL_WAIT_TIMEOUT)
+    await run_io(update_session, session["session_id"], metrics_ce=metrics, status="done")
+    return metrics
+
+
 @app.post("/ask_stream")
-def ask_stream(data: AskIn):
-    def generator():
-        import traceback
-        global LAST_USED_CONTEXTS, LAST_ASK_ANSWER
-        LAST_USED_CONTEXTS = []
-        LAST_ASK_ANSWER = ""
+async def ask_stream(data: AskIn):
+    """Odpowiedź jako czysty tekst; session_id w nagłówku X-Session-Id (konteksty: /sessions/{id})."""
+    session_id = await run_io(create_session, data.question, video_id=data.video_id, top_k=data.top_k,
+                              trace_id=current_trace_id())
+
+    async def generator():
         try:
-            contexts = build_contexts_for_ask(data.question, data.top_k)
-            LAST_USED_CONTEXTS = contexts
-            chunks: List[str] = []
-            for delta in answer(contexts, data.question, top_k=len(contexts)):
-                if delta:
-                    chunks.append(delta)
-                    yield delta
-            # zapisz pełną odpowiedź po zakończeniu streamu
-            LAST_ASK_ANSWER = "".join(chunks)
+            async for event in _ask_events(data, session_id):
+                if event["type"] == "delta":
+                    yield event["text"]
         except Exception as e:
-            print("[ERROR] ask_stream failed:")
-            print(traceback.format_exc())
+            logger.exception("[ERROR] ask_stream failed:")
+            await run_io(update_session, session_id, status="error", error=str(e))
             yield f"\n\n[ERROR] {e}"
-    return StreamingResponse(generator(), media_type="text/plain; charset=utf-8")
+    return StreamingResponse(generator(), media_type="text/plain; charset=utf-8",
+                             headers={"X-Session-Id": session_id})
 
-@app.get("/used_contexts")
-def used_contexts():
+@app.post("/ask_ndjson")
+async def ask_ndjson(data: AskIn):
+    """
+    Jeden strumień NDJSON na pytanie: session -> contexts -> delta... -> answer_done -> metrics -> done
+    (przy błędzie: error). Zastępuje sekwencję /ask_stream, /used_contexts, /ask_eval_ce.
+    """
+    session_id = await run_io(create_session, data.question, video_id=data.video_id, top_k=data.top_k,
+                              trace_id=current_trace_id())
+
+    def line(event: Dict[str, Any]) -> str:
+        return json.dumps(event, ensure_ascii=False, default=str) + "\n"
+
+    async def generator():
+        yield line({"type": "session", "session_id": session_id, "question": data.question,
+                    "trace_id": current_trace_id()})
+        try:
+            async for event in _ask_events(data, session_id):
+                yield line(event)
+            if data.include_metrics:
+                metrics = await _evaluate_session(await run_io(get_session, session_id))
+                yield line({"type": "metrics", "metrics_ce": metrics})
+            yield line({"type": "done", "session_id": session_id})
+        except Exception as e:
+            logger.exception("[ERROR] ask_ndjson failed:")
+            await run_io(update_session, session_id, status="error", error=str(e))
+            yield line({"type": "error", "error": str(e), "session_id": session_id})
+    return StreamingResponse(generator(), media_type="application/x-ndjson",
+                             headers={"X-Session-Id": session_id})
+
+# /ask_batch: wiele pytań naraz (np. raport offline) – wspólne embeddingi, retrieval i reranking wsadowo,
+# generowanie odpowiedzi z ograniczoną współbieżnością
+ASK_BATCH_MAX_QUESTIONS = int(os.getenv("ASK_BATCH_MAX_QUESTIONS", "100"))
+ASK_BATCH_CONCURRENCY = int(os.getenv("ASK_BATCH_CONCURRENCY", "8"))
+
+async def _answer_text(contexts: List[Dict[str, Any]], question: str) -> str:
+    # pytanie z wsadu traktujemy jako jedno (bez podziału na pod-pytania)
+    parts = [d async for d in answer_async(contexts, question, top_k=len(contexts), sub_questions=[question],
+                                           packed=True)]
+    return "".join(parts)
+
+async def _ask_batch_events(data: AskBatchIn, questions: List[str], positions: List[int]) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Zdarzenia wsadu: batch -> retrieval -> result/error (w kolejności ukończenia) -> done.
+    Jedno wywołanie embeddingów dla wszystkich pytań, jedno zapytanie wektorowe i jeden przebieg
+    cross-encodera dla par (pytanie, kandydat) wszystkich pytań bez trafienia w cache odpowiedzi.
+    Powtórzone pytania (po normalizacji) liczone są raz; index w zdarzeniach = pozycja w data.questions.
+    """
+    started = time.perf_counter()
+    where = {"video_id": data.video_id} if data.video_id else None
+    yield {"type": "batch", "count": len(questions), "trace_id": current_trace_id()}
+
+    # duplikaty wskazują na pierwsze wystąpienie; retrieval i generowanie tylko dla unikalnych
+    first: Dict[str, int] = {}
+    dup_of = {i: first.setdefault(" ".join(q.lower().split()), i) for i, q in enumerate(questions)}
+    unique = [i for i in range(len(questions)) if dup_of[i] == i]
+    q_vecs = dict(zip(unique, await aembed_questions([questions[i] for i in unique])))
+    version = await run_io(index_version, COLLECTION_NAME, data.video_id)
+    cached: Dict[int, Dict[str, Any]] = {}
+
+    def _lookup_all() -> Dict[int, Dict[str, Any]]:
+        hits = {i: lookup_answer(COLLECTION_NAME, data.video_id, q_vecs[i], version, data.top_k) for i in unique}
+        return {i: hit for i, hit in hits.items() if hit is not None}
+
+    if data.use_cache:
+        with span("answer_cache_lookup", questions=len(questions)) as sp:
+            cached = await run_io(_lookup_all)
+            sp.set(hits=len(cached))
+    misses = [i for i in unique if i not in cached]
+    contexts: Dict[int, List[Dict[str, Any]]] = {i: hit["contexts"] for i, hit in cached.items()}
+    if misses:
+        per_question = await abuild_contexts_for_ask_batch(
+            [questions[i] for i in misses], data.top_k, COLLECTION_NAME, where=where,
+            q_vecs=[q_vecs[i] for i in misses],
+        )
+        # pakowanie przed sesją, cache i zdarzeniem – raportowane konteksty = konteksty w prompcie
+        per_question = await run_cpu(lambda pq: [pack_answer_contexts(c) for c in pq], per_question)
+        contexts.update(zip(misses, per_question))
+    for i, j in dup_of.items():
+        contexts[i] = contexts[j]
+    copies: Dict[int, List[int]] = {}
+    for i, j in dup_of.items():
+        copies.setdefault(j, []).append(i)
+    trace_id = current_trace_id()
+
+    def _create_sessions() -> Dict[int, str]:
+        return {
+            i: create_session(q, video_id=data.video_id, top_k=data.top_k, trace_id=trace_id,
+                              contexts=contexts[i], status="answering", cached=dup_of[i] in cached,
+                              batch_index=positions[i])
+            for i, q in enumerate(questions)
+        }
+
+    sessions = await run_io(_create_sessions)
+    yield {"type": "retrieval", "retrieval_s": round(time.perf_counter() - started, 4),
+           "cached": len(cached), "retrieved": len(misses), "duplicates": len(questions) - len(unique)}
+
+    def _answered(j: int, answer_txt: str):
+        for i in copies[j]:
+            update_session(sessions[i], answer=answer_txt, status="answered")
+
+    def results(j: int, answer_txt: str, answer_s: float, is_cached: bool) -> List[Dict[str, Any]]:
+        events = []
+        for i in copies[j]:
+            event = {"type": "result", "index": positions[i], "question": questions[i], "session_id": sessions[i],
+                     "answer": answer_txt, "cached": is_cached, "answer_s": round(answer_s, 4)}
+            if data.include_contexts:
+                event["contexts"] = contexts[i]
+            events.append(event)
+        return events
+
+    for j, hit in cached.items():
+        await run_io(_answered, j, hit["answer"])
+        for event in results(j, hit["answer"], 0.0, True):
+            yield event
+
+    sem = asyncio.Semaphore(max(1, ASK_BATCH_CONCURRENCY))
+
+    async def _one(i: int):
+        async with sem:
+            t0 = time.perf_counter()
+            try:
+                return i, await _answer_text(contexts[i], questions[i]), time.perf_counter() - t0, None
+            except Exception as e:
+                logger.exception(f"[ASK_BATCH] question {i} failed:")
+                return i, "", time.perf_counter() - t0, e
+
+    errors = 0
+    tasks = [asyncio.ensure_future(_one(i)) for i in misses]
     try:
-        return {"contexts": LAST_USED_CONTEXTS}
-    except Exception as e:
-        return {"error": str(e), "contexts": []}
+        for fut in asyncio.as_completed(tasks):
+            i, answer_txt, answer_s, error = await fut
+            if error is not None:
+                for k in copies[i]:
+                    errors += 1
+                    await run_io(update_session, sessions[k], status="error", error=str(error))
+                    yield {"type": "error", "index": positions[k], "question": questions[k], "session_id": sessions[k],
+                           "error": str(error)}
+                continue
+            await run_io(store_answer, COLLECTION_NAME, data.video_id, questions[i], q_vecs[i], version, answer_txt,
+                         contexts[i], data.top_k)
+            await run_io(_answered, i, answer_txt)
+            for event in results(i, answer_txt, answer_s, False):
+                yield event
+    finally:
+        # klient przerwał strumień – nie generujemy pozostałych odpowiedzi
+        for t in tasks:
+            t.cancel()
+    yield {"type": "done", "count": len(questions), "answered": len(questions) - errors, "errors": errors,
+           "cached": len(cached), "total_s": round(time.perf_counter() - started, 4)}
+
+@app.post("/ask_batch")
+async def ask_batch(data: AskBatchIn):
+    """
+    Wiele pytań w jednym żądaniu; NDJSON z odpowiedziami w kolejności ukończenia (pole index = pozycja
+    pytania). Każde pytanie ma własną sesję (/sessions/{id}, /ask_eval_ce z session_id).
+    """
+    positions = [pos for pos, q in enumerate(data.questions) if q and q.strip()]
+    questions = [data.questions[pos].strip() for pos in positions]
+    if not questions:
+        return JSONResponse(status_code=422, content={"error": "Brak pytań"})
+    if len(questions) > ASK_BATCH_MAX_QUESTIONS:
+        return JSONResponse(status_code=422, content={
+            "error": f"Za dużo pytań ({len(questions)} > {ASK_BATCH_MAX_QUESTIONS})"})
+    logger.info(f"[ASK_BATCH] questions={len(questions)} top_k={data.top_k} video_id={data.video_id}")
+
+    def line(event: Dict[str, Any]) -> str:
+        return json.dumps(event, ensure_ascii=False, default=str) + "\n"
+
+    async def generator():
+        try:
+            async for event in _ask_batch_events(data, questions, positions):
+                yield line(event)
+        except Exception as e:
+            logger.exception("[ERROR] ask_batch failed:")
+            yield line({"type": "error", "error": str(e)})
+    return StreamingResponse(generator(), media_type="application/x-ndjson")
+
+@app.get("/sessions/{session_id}")
+def session_detail(session_id: str):
+    session = get_session(session_id)
+    if session is None:
+        return JSONResponse(status_code=404, content={"error": f"Nie znaleziono sesji {session_id}"})
+    return session
+
+_SESSION_REQUIRED = {"error": "Podaj session_id (X-Session-Id z /ask_stream lub zdarzenie session z /ask_ndjson)."}
+
+@app.get("/used_contexts")
+def used_contexts(session_id: Optional[str] = None):
+    """Konteksty sesji. session_id wymagane – brak fallbacku na ostatnią sesję (mogłaby należeć do innego użytkownika)."""
+    if not session_id:
+        return JSONResponse(status_code=400, content=_SESSION_REQUIRED)
+    session = get_session(session_id)
+    if session is None:
+        return JSONResponse(status_code=404, content={"error": f"Nie znaleziono sesji {session_id}", "contexts": []})
+    return {"session_id": session["session_id"], "contexts": session["contexts"]}
 
 @app.post("/ask_eval_ce")
-def ask_eval_ce(data: AskIn):
+async def ask_eval_ce(data: AskIn):
     """
-    Ewaluacja bez LLM (cross-encoder): relevancy i faithfulness dla zapisanej odpowiedzi i kontekstów.
-    Najpierw używa LAST_ASK_ANSWER; jeśli pusty, generuje niestrumieniowo.
+    Ewaluacja bez LLM (cross-encoder): relevancy i faithfulness dla odpowiedzi i kontekstów sesji.
+    Wynik liczony jest w tle po zakończeniu odpowiedzi; tu zwracamy go z cache albo czekamy na zadanie.
+    Sesja w trakcie odpowiedzi (retrieving/answering) – 409: oceniana byłaby pusta lub niepełna odpowiedź.
     """
+    if not data.session_id:
+        return JSONResponse(status_code=400, content=_SESSION_REQUIRED)
     try:
-        print(f"[EVAL_CE] /ask_eval_ce question={data.question}")
-        contexts = LAST_USED_CONTEXTS
-        print(f"contexts: {contexts}")
-        answer_txt = LAST_ASK_ANSWER 
-        print(f"LAST_ASK_ANSWER: {answer_txt}")
-        metrics = evaluate_answer_crossencoder(data.question, answer_txt, contexts)
-        print(f"[EVAL_CE] metrics: {metrics}")
-        result = {
-            "question": data.question,
-            "answer": answer_txt,
+        logger.info(f"[EVAL_CE] /ask_eval_ce question={data.question} session_id={data.session_id}")
+        session = await run_io(get_session, data.session_id)
+        if session is None:
+            return JSONResponse(status_code=404, content={"error": f"Nie znaleziono sesji {data.session_id}",
+                                                          "question": data.question})
+        if session["status"] not in ("answered", "done"):
+            return JSONResponse(status_code=409, content={
+                "error": f"Odpowiedź sesji nie jest gotowa (status={session['status']})",
+                "session_id": session["session_id"], "status": session["status"]})
+        metrics = await _evaluate_session(session)
+        logger.info(f"[EVAL_CE] metrics: {metrics}")
+        return {
+            "session_id": session["session_id"],
+            "question": session["question"],
+            "answer": session["answer"],
             "metrics_ce": metrics,
-            "used_contexts_count": len(contexts),
+            "used_contexts_count": len(session["contexts"]),
         }
-        global LAST_ASK_EVAL_CE
-        LAST_ASK_EVAL_CE = result
-        return result
     except Exception as e:
         return {"error": str(e), "question": data.question}
 
+@app.get("/traces")
+def traces(limit: int = 20):
+    """Ostatnie ślady tego procesu (id, nazwa, czas trwania, liczba spanów)."""
+    return {"traces": recent_traces(limit)}
+
+@app.get("/traces/{trace_id}")
+def trace_detail(trace_id: str, format: str = "json"):
+    """Waterfall jednego żądania lub zadania: spany z czasem startu i trwania (format=text – sam wykres)."""
+    record = get_trace(trace_id)
+    if record is None:
+        return JSONResponse(status_code=404, content={"error": f"Nie znaleziono śladu {trace_id}"})
+    lines = waterfall(record)
+    if format == "text":
+        return PlainTextResponse("\n".join(lines) + "\n")
+    return {**record, "waterfall": lines}
+
+@app.get("/models")
+def models():
+    """Modele w pamięci, budżet, liczniki ładowań/wyrzuceń i czasy oczekiwania w kolejce inferencji."""
+    return get_model_manager().stats()
+
 @app.get("/health")
 def health():
     return {
@@ -231,8 +609,27 @@ def health():
         "transcripts_dir": str(TRANSCRIPTS_DIR),
         "transcripts_dir_exists": TRANSCRIPTS_DIR.exists(),
         "transcripts_sample": [p.name for p in list(TRANSCRIPTS_DIR.glob('*'))[:5]] if TRANSCRIPTS_DIR.exists() else [],
+        "partial_cache": cache_stats(),
+        "answer_cache": answer_cache_stats(),
+        "jobs": job_stats(),
+        "sessions": session_stats(),
+    }
+
+@app.get("/index/manifest")
+def index_manifest():
+    """Filmy zapisane w kolekcji: hash chunków, model embeddingów, liczba chunków, czas indeksowania."""
+    manifest = get_manifest(COLLECTION_NAME)
+    return {
+        "collection": COLLECTION_NAME,
+        "path": str(manifest.path) if manifest.path else None,
+        "videos": sorted(manifest.videos(), key=lambda e: e.get("indexed_at") or 0, reverse=True),
     }
 
+@app.get("/metrics")
+def metrics():
+    """Metryki w formacie tekstowym Prometheus (tokeny, TTFT, tokeny/s, czasy etapów i endpointów)."""
+    return Response(content=metrics_payload(), media_type=CONTENT_TYPE_LATEST)
+
 @app.get("/docs")
 def docs():
     return {
@@ -243,6 +640,6 @@ def docs():
 @app.get("/")
 def root():
     return {
-        "message": "API działa. Dostępne: /process_youtube, /summarize, /ask, /health, dokumentacja pod /docs",
+        "message": "API działa. Dostępne: /process_youtube, /jobs/{id}, /summarize, /ask_ndjson, /ask_batch, /sessions/{id}, /traces/{id}, /health, dokumentacja pod /docs",
     }
 
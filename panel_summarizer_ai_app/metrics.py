@@ -0,0 +1,207 @@
+import functools
+import inspect
+import time
+from typing import Any, AsyncIterable, AsyncIterator, Callable, Iterable, Iterator, List, Optional
+
+from tracing import current_span, traced
+
+# Metryki Prometheus (tekst pod /metrics): tokeny, TTFT, tokeny/s i czasy etapów.
+# Bez prometheus_client metryki są no-op, a /metrics zwraca tylko komentarz.
+try:
+    from prometheus_client import CONTENT_TYPE_LATEST, Counter, Histogram, generate_latest
+    PROMETHEUS_AVAILABLE = True
+except ImportError:
+    PROMETHEUS_AVAILABLE = False
+    CONTENT_TYPE_LATEST = "text/plain; version=0.0.4; charset=utf-8"
+
+    class _Noop:
+        def __init__(self, *args, **kwargs):
+            pass
+
+        def labels(self, *args, **kwargs):
+            return self
+
+        def observe(self, *args, **kwargs):
+            pass
+
+        def inc(self, *args, **kwargs):
+            pass
+
+    Counter = Histogram = _Noop
+
+    def generate_latest() -> bytes:
+        return b"# prometheus_client not installed\n"
+
+_TOKEN_BUCKETS = (16, 64, 256, 1024, 4096, 16384, 65536)
+_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 1800)
+
+LLM_PROMPT_TOKENS = Histogram("llm_prompt_tokens", "Tokeny promptu na wywołanie LLM",
+                              ["operation"], buckets=_TOKEN_BUCKETS)
+LLM_COMPLETION_TOKENS = Histogram("llm_completion_tokens", "Tokeny odpowiedzi na wywołanie LLM",
+                                  ["operation"], buckets=_TOKEN_BUCKETS)
+LLM_TOKENS = Counter("llm_tokens", "Suma tokenów LLM", ["operation", "kind"])
+LLM_TTFT = Histogram("llm_time_to_first_token_seconds", "Czas do pierwszego tokenu (stream)",
+                     ["operation"], buckets=(0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 30))
+LLM_TOKENS_PER_SECOND = Histogram("llm_tokens_per_second", "Tempo generowania tokenów odpowiedzi",
+                                  ["operation"], buckets=(1, 5, 10, 20, 50, 100, 200, 500, 1000))
+LLM_DURATION = Histogram("llm_request_duration_seconds", "Czas wywołania LLM (do ostatniego tokenu)",
+                         ["operation"], buckets=_LATENCY_BUCKETS)
+STAGE_DURATION = Histogram("stage_duration_seconds", "Czas etapów przetwarzania",
+                           ["stage"], buckets=_LATENCY_BUCKETS)
+HTTP_DURATION = Histogram("http_request_duration_seconds", "Czas do odpowiedzi (nagłówków) per endpoint",
+                          ["method", "path", "status"], buckets=_LATENCY_BUCKETS)
+
+
+def observe_stage(stage: str, seconds: float):
+    STAGE_DURATION.labels(stage=stage).observe(seconds)
+
+
+def _timed_gen(gen: Iterator[Any], stage: str, started: float):
+    try:
+        return (yield from gen)
+    finally:
+        observe_stage(stage, time.perf_counter() - started)
+
+
+async def _atimed_gen(gen: AsyncIterator[Any], stage: str, started: float):
+    try:
+        async for item in gen:
+            yield item
+    finally:
+        observe_stage(stage, time.perf_counter() - started)
+
+
+async def _atimed_coro(coro, stage: str, started: float):
+    try:
+        return await coro
+    finally:
+        observe_stage(stage, time.perf_counter() - started)
+
+
+def timed(stage: str) -> Callable:
+    """
+    Dekorator: czas wywołania -> stage_duration_seconds{stage}. Jeśli funkcja zwraca generator
+    (strumień, także async) albo korutynę, czas liczony jest do jego wyczerpania lub zamknięcia.
+    W aktywnym śladzie (tracing.py) etap jest też spanem o tej samej nazwie.
+    """
+    def deco(fn: Callable) -> Callable:
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                result = fn(*args, **kwargs)
+            except BaseException:
+                observe_stage(stage, time.perf_counter() - started)
+                raise
+            if inspect.isgenerator(result):
+                return _timed_gen(result, stage, started)
+            if inspect.isasyncgen(result):
+                return _atimed_gen(result, stage, started)
+            if inspect.iscoroutine(result):
+                return _atimed_coro(result, stage, started)
+            observe_stage(stage, time.perf_counter() - started)
+            return result
+        return traced(stage)(wrapper)
+    return deco
+
+
+def record_llm_call(operation: str, started: float, prompt_tokens: int, completion_tokens: int,
+                    first_token_at: Optional[float] = None):
+    ended = time.perf_counter()
+    LLM_DURATION.labels(operation=operation).observe(ended - started)
+    LLM_PROMPT_TOKENS.labels(operation=operation).observe(prompt_tokens)
+    LLM_COMPLETION_TOKENS.labels(operation=operation).observe(completion_tokens)
+    LLM_TOKENS.labels(operation=operation, kind="prompt").inc(prompt_tokens)
+    LLM_TOKENS.labels(operation=operation, kind="completion").inc(completion_tokens)
+    gen_start = first_token_at if first_token_at is not None else started
+    if first_token_at is not None:
+        LLM_TTFT.labels(operation=operation).observe(first_token_at - started)
+    if completion_tokens and ended > gen_start:
+        LLM_TOKENS_PER_SECOND.labels(operation=operation).observe(completion_tokens / (ended - gen_start))
+
+
+def _usage_tokens(usage: Any, key: str) -> Optional[int]:
+    value = getattr(usage, key, None) if usage is not None else None
+    return int(value) if value is not None else None
+
+
+def record_completion(operation: str, response: Any, started: float, prompt_tokens: int = 0,
+                      count_tokens: Optional[Callable[[str], int]] = None):
+    """Wywołanie bez streamu: tokeny z usage odpowiedzi, w razie braku – szacunek."""
+    usage = getattr(response, "usage", None)
+    completion = _usage_tokens(usage, "completion_tokens")
+    if completion is None and count_tokens is not None:
+        try:
+            completion = count_tokens(response.choices[0].message.content or "")
+        except Exception:
+            completion = 0
+    prompt = _usage_tokens(usage, "prompt_tokens") or prompt_tokens
+    record_llm_call(operation, started, prompt, completion or 0)
+    current_span().set(prompt_tokens=prompt, completion_tokens=completion or 0)
+
+
+def _chunk_delta(chunk: Any) -> Optional[str]:
+    try:
+        return chunk.choices[0].delta.content
+    except Exception:
+        return None
+
+
+def _finish_stream(operation: str, started: float, usage: Any, parts: List[str], first_at: Optional[float],
+                   prompt_tokens: int, count_tokens: Optional[Callable[[str], int]], span: Any):
+    completion = _usage_tokens(usage, "completion_tokens")
+    if completion is None:
+        text = "".join(parts)
+        completion = count_tokens(text) if (count_tokens and text) else len(parts)
+    prompt = _usage_tokens(usage, "prompt_tokens") or prompt_tokens
+    record_llm_call(operation, started, prompt, completion, first_token_at=first_at)
+    span.set(prompt_tokens=prompt, completion_tokens=completion)
+
+
+def track_stream(operation: str, chunks: Iterable[Any], started: float, prompt_tokens: int = 0,
+                 count_tokens: Optional[Callable[[str], int]] = None) -> Iterator[str]:
+    """
+    Przepuszcza treść delt ze strumienia chat.completions i po jego zakończeniu zapisuje TTFT,
+    tokeny (usage z ostatniego chunku przy stream_options.include_usage, inaczej szacunek) i tokeny/s.
+    """
+    first_at: Optional[float] = None
+    usage = None
+    parts: List[str] = []
+    span = current_span()  # span wywołania LLM (zamknięcie strumienia może nastąpić poza jego kontekstem)
+    try:
+        for chunk in chunks:
+            usage = getattr(chunk, "usage", None) or usage
+            delta = _chunk_delta(chunk)
+            if delta:
+                if first_at is None:
+                    first_at = time.perf_counter()
+                    span.event("first_token")
+                parts.append(delta)
+                yield delta
+    finally:
+        _finish_stream(operation, started, usage, parts, first_at, prompt_tokens, count_tokens, span)
+
+
+async def atrack_stream(operation: str, chunks: AsyncIterable[Any], started: float, prompt_tokens: int = 0,
+                        count_tokens: Optional[Callable[[str], int]] = None) -> AsyncIterator[str]:
+    """Jak track_stream, dla strumienia z klienta async."""
+    first_at: Optional[float] = None
+    usage = None
+    parts: List[str] = []
+    span = current_span()  # span wywołania LLM (zamknięcie strumienia może nastąpić poza jego kontekstem)
+    try:
+        async for chunk in chunks:
+            usage = getattr(chunk, "usage", None) or usage
+            delta = _chunk_delta(chunk)
+            if delta:
+                if first_at is None:
+                    first_at = time.perf_counter()
+                    span.event("first_token")
+                parts.append(delta)
+                yield delta
+    finally:
+        _finish_stream(operation, started, usage, parts, first_at, prompt_tokens, count_tokens, span)
+
+
+def metrics_payload() -> bytes:
+    return generate_latest()
@@ -0,0 +1,283 @@
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+from typing import Any, Dict, Optional, Tuple
+
+from config import MODEL_BACKEND
+from logging_config import get_logger
+
+logger = get_logger(__name__)
+
+# Wspólny menedżer modeli (cross-encodery, bi-encodery) dla evaluatora i rerankingu:
+# - budżet pamięci z wyrzucaniem najdawniej używanych modeli (LRU),
+# - ładowanie single-flight (równoległe żądania tego samego modelu czekają na jedno ładowanie),
+# - kolejka inferencji per model z własnymi wątkami roboczymi,
+# - liczba wątków torch (MODEL_DEFAULT_THREADS) – torch.set_num_threads jest ustawieniem całego procesu,
+#   więc jedna wartość dla wszystkich modeli (izolacja per model wymagałaby osobnych procesów),
+# - statystyki: modele w pamięci, rozmiary, czasy oczekiwania w kolejce.
+
+MODEL_MEMORY_BUDGET_MB = float(os.getenv("MODEL_MEMORY_BUDGET_MB", "4096"))
+MODEL_DEFAULT_THREADS = int(os.getenv("MODEL_DEFAULT_THREADS", "0"))  # 0 = ustawienie domyślne torch
+MODEL_INFERENCE_WORKERS = int(os.getenv("MODEL_INFERENCE_WORKERS", "1"))
+
+KIND_CROSS_ENCODER = "cross_encoder"
+KIND_BI_ENCODER = "bi_encoder"
+
+
+def _load_model(kind: str, name: str):
+    if MODEL_BACKEND == "local":
+        from local_models import HashingEmbeddings, LocalCrossEncoder
+        return LocalCrossEncoder(name) if kind == KIND_CROSS_ENCODER else HashingEmbeddings()
+    if kind == KIND_CROSS_ENCODER:
+        from sentence_transformers import CrossEncoder
+        return CrossEncoder(name)
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(name)
+
+
+def _model_size_mb(model: Any) -> float:
+    module = getattr(model, "model", model)
+    try:
+        total = sum(p.numel() * p.element_size() for p in module.parameters())
+        total += sum(b.numel() * b.element_size() for b in module.buffers())
+        return total / (1024 * 1024)
+    except Exception:
+        return 0.0
+
+
+class _Entry:
+    def __init__(self, kind: str, name: str, model: Any, size_mb: float):
+        self.kind = kind
+        self.name = name
+        self.model = model
+        self.size_mb = size_mb
+        self.jobs: "queue.Queue[Optional[Tuple]]" = queue.Queue()
+        self.inflight = 0
+        self.calls = 0
+        self.wait_ms: deque = deque(maxlen=500)
+        self.infer_ms: deque = deque(maxlen=500)
+        self.loaded_at = time.time()
+        self.last_used = time.time()
+        self.workers = []
+
+
+class ManagedModel:
+    """
+    Uchwyt do modelu z menedżera. predict/encode trafiają do kolejki inferencji modelu;
+    jeśli model został wyrzucony z pamięci, zostanie ponownie załadowany przy kolejnym wywołaniu.
+    """
+
+    def __init__(self, manager: "ModelManager", kind: str, name: str):
+        self._manager = manager
+        self.kind = kind
+        self.name = name
+
+    def predict(self, *args, **kwargs):
+        return self._manager.run(self.kind, self.name, "predict", args, kwargs)
+
+    def encode(self, *args, **kwargs):
+        return self._manager.run(self.kind, self.name, "encode", args, kwargs)
+
+
+class ModelManager:
+    def __init__(self, memory_budget_mb: float = MODEL_MEMORY_BUDGET_MB,
+                 threads: int = MODEL_DEFAULT_THREADS,
+                 inference_workers: int = MODEL_INFERENCE_WORKERS):
+        self.memory_budget_mb = memory_budget_mb
+        self.threads = threads
+        self._threads_applied = False
+        self.inference_workers = max(1, inference_workers)
+        self._lock = threading.Lock()
+        self._models: "OrderedDict[Tuple[str, str], _Entry]" = OrderedDict()
+        self._loading: Dict[Tuple[str, str], Future] = {}
+        self._counters = {"loads": 0, "load_failures": 0, "hits": 0, "evictions": 0, "single_flight_waits": 0}
+
+    # --- ładowanie ---
+
+    def get(self, name: str, kind: str = KIND_CROSS_ENCODER, load: bool = True) -> Optional[ManagedModel]:
+        """Zwraca uchwyt do modelu; przy load=True ładuje od razu (None, jeśli ładowanie się nie powiodło)."""
+        if load:
+            try:
+                self._ensure(kind, name)
+            except Exception as e:
+                logger.error(f"[MODELS] Load failed for {kind}:{name}: {e}")
+                return None
+        return ManagedModel(self, kind, name)
+
+    def _ensure(self, kind: str, name: str) -> _Entry:
+        key = (kind, name)
+        with self._lock:
+            entry = self._models.get(key)
+            if entry is not None:
+                self._models.move_to_end(key)
+                self._counters["hits"] += 1
+                return entry
+            fut = self._loading.get(key)
+            owner = fut is None
+            if owner:
+                fut = Future()
+                self._loading[key] = fut
+            else:
+                self._counters["single_flight_waits"] += 1
+        if not owner:
+            return fut.result()
+
+        try:
+            t0 = time.perf_counter()
+            self._apply_threads()
+            model = _load_model(kind, name)
+            size_mb = _model_size_mb(model)
+            entry = _Entry(kind, name, model, size_mb)
+            self._start_workers(entry)
+            with self._lock:
+                self._models[key] = entry
+                self._counters["loads"] += 1
+                self._loading.pop(key, None)
+                evicted = self._evict_over_budget(keep=key)
+            logger.info(f"[MODELS] Loaded {kind}:{name} size={size_mb:.1f}MB "
+                  f"in {time.perf_counter() - t0:.2f}s")
+            for e in evicted:
+                self._stop_workers(e)
+            fut.set_result(entry)
+            return entry
+        except BaseException as e:
+            with self._lock:
+                self._counters["load_failures"] += 1
+                self._loading.pop(key, None)
+            fut.set_exception(e)
+            raise
+
+    def _resident_mb(self) -> float:
+        return sum(e.size_mb for e in self._models.values())
+
+    def _evict_over_budget(self, keep: Tuple[str, str]) -> list:
+        # wywoływane pod self._lock; pomija modele z trwającą inferencją
+        evicted = []
+        for key in list(self._models.keys()):
+            if self._resident_mb() <= self.memory_budget_mb:
+                break
+            entry = self._models[key]
+            if key == keep or entry.inflight > 0:
+                continue
+            del self._models[key]
+            self._counters["evictions"] += 1
+            evicted.append(entry)
+            logger.info(f"[MODELS] Evicted {entry.kind}:{entry.name} size={entry.size_mb:.1f}MB "
+                  f"(budget={self.memory_budget_mb:.0f}MB)")
+        return evicted
+
+    # --- kolejka inferencji ---
+
+    def _start_workers(self, entry: _Entry):
+        for i in range(self.inference_workers):
+            t = threading.Thread(target=self._worker, args=(entry,), daemon=True,
+                                 name=f"model-{entry.name.split('/')[-1]}-{i}")
+            entry.workers.append(t)
+            t.start()
+
+    def _stop_workers(self, entry: _Entry):
+        for _ in entry.workers:
+            entry.jobs.put(None)
+        entry.model = None
+        try:
+            import torch
+            if torch.cuda.is_available():
+                torch.cuda.empty_cache()
+        except Exception:
+            pass
+
+    def _apply_threads(self):
+        # globalna pula wątków torch (intra-op) – ustawiana raz, przed pierwszym ładowaniem modelu
+        if self._threads_applied or self.threads <= 0:
+            return
+        self._threads_applied = True
+        try:
+            import torch
+            torch.set_num_threads(self.threads)
+        except Exception:
+            pass
+
+    @staticmethod
+    def _worker(entry: _Entry):
+        while True:
+            job = entry.jobs.get()
+            if job is None:
+                break
+            fut, method, args, kwargs, enqueued = job
+            started = time.perf_counter()
+            entry.wait_ms.append((started - enqueued) * 1000)
+            try:
+                fut.set_result(getattr(entry.model, method)(*args, **kwargs))
+            except BaseException as e:
+                fut.set_exception(e)
+            finally:
+                entry.infer_ms.append((time.perf_counter() - started) * 1000)
+
+    def run(self, kind: str, name: str, method: str, args: tuple, kwargs: dict):
+        while True:
+            entry = self._ensure(kind, name)
+            with self._lock:
+                # model mógł zostać wyrzucony między _ensure a rezerwacją – wtedy ładujemy ponownie
+                if self._models.get((kind, name)) is not entry:
+                    continue
+                entry.inflight += 1
+                entry.calls += 1
+                entry.last_used = time.time()
+                break
+        fut: Future = Future()
+        try:
+            entry.jobs.put((fut, method, args, kwargs, time.perf_counter()))
+            return fut.result()
+        finally:
+            with self._lock:
+                entry.inflight -= 1
+
+    # --- statystyki ---
+
+    def stats(self) -> Dict[str, Any]:
+        def _summary(values) -> Dict[str, float]:
+            vals = sorted(values)
+            if not vals:
+                return {"avg": 0.0, "p95": 0.0, "max": 0.0}
+            return {
+                "avg": round(sum(vals) / len(vals), 3),
+                "p95": round(vals[min(len(vals) - 1, int(0.95 * (len(vals) - 1)))], 3),
+                "max": round(vals[-1], 3),
+            }
+
+        with self._lock:
+            models = [{
+                "kind": e.kind,
+                "name": e.name,
+                "size_mb": round(e.size_mb, 1),
+                "queue_depth": e.jobs.qsize(),
+                "inflight": e.inflight,
+                "calls": e.calls,
+                "queue_wait_ms": _summary(e.wait_ms),
+                "inference_ms": _summary(e.infer_ms),
+                "loaded_at": e.loaded_at,
+                "last_used": e.last_used,
+            } for e in self._models.values()]
+            return {
+                "memory_budget_mb": self.memory_budget_mb,
+                "resident_mb": round(self._resident_mb(), 1),
+                "torch_threads": self.threads or "default",
+                "loading": [f"{k}:{n}" for k, n in self._loading],
+                "counters": dict(self._counters),
+                "models": models,
+            }
+
+
+_manager: Optional[ModelManager] = None
+_manager_lock = threading.Lock()
+
+
+def get_model_manager() -> ModelManager:
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = ModelManager()
+        return _manager
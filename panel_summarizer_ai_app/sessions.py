@@ -0,0 +1,79 @@
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from shared_state import SHARED_STATE, kv_count, kv_get, kv_prune, kv_set, kv_update
+
+# Sesje odpowiedzi: każde wywołanie /ask_* dostaje własne session_id, pod którym zapisywane są
+# pytanie, użyte konteksty, odpowiedź i metryki CE (zamiast globalnych LAST_* nadpisywanych
+# przez równoległych użytkowników). Pamięć LRU z limitem wpisów i czasem życia; przy STATE_BACKEND=sqlite
+# sesje są w bazie współdzielonej przez workery (odpowiedź z jednego workera, /sessions/{id} z innego).
+SESSION_MAX_ENTRIES = int(os.getenv("SESSION_MAX_ENTRIES", "500"))
+SESSION_TTL_S = float(os.getenv("SESSION_TTL_S", "3600"))
+
+_lock = threading.Lock()
+_sessions: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+
+
+def _evict(now: float):
+    while _sessions:
+        sid, s = next(iter(_sessions.items()))
+        if len(_sessions) > SESSION_MAX_ENTRIES or now - s["updated_at"] > SESSION_TTL_S:
+            _sessions.popitem(last=False)
+        else:
+            break
+
+
+def create_session(question: str, **fields: Any) -> str:
+    sid = uuid.uuid4().hex
+    now = time.time()
+    session = {
+        "session_id": sid, "question": question, "status": "retrieving",
+        "contexts": [], "answer": "", "metrics_ce": None, "error": None,
+        "created_at": now, "updated_at": now, **fields,
+    }
+    if SHARED_STATE:
+        kv_set("session", sid, session, ttl_s=SESSION_TTL_S)
+        kv_prune("session", SESSION_MAX_ENTRIES)
+        return sid
+    with _lock:
+        _sessions[sid] = session
+        _evict(now)
+    return sid
+
+
+def update_session(session_id: str, **fields: Any):
+    if SHARED_STATE:
+        kv_update("session", session_id, {**fields, "updated_at": time.time()}, ttl_s=SESSION_TTL_S)
+        return
+    with _lock:
+        s = _sessions.get(session_id)
+        if s is None:
+            return
+        s.update(fields)
+        s["updated_at"] = time.time()
+        _sessions.move_to_end(session_id)
+
+
+def get_session(session_id: Optional[str]) -> Optional[Dict[str, Any]]:
+    """Kopia sesji albo None. Bez "ostatniej sesji" – przy wielu użytkownikach byłaby to sesja kogoś innego."""
+    if not session_id:
+        return None
+    if SHARED_STATE:
+        return kv_get("session", session_id)
+    with _lock:
+        s = _sessions.get(session_id)
+        return dict(s) if s is not None else None
+
+
+def session_stats() -> Dict[str, Any]:
+    if SHARED_STATE:
+        count = kv_count("session")
+    else:
+        with _lock:
+            count = len(_sessions)
+    return {"sessions": count, "max_entries": SESSION_MAX_ENTRIES, "ttl_s": SESSION_TTL_S,
+            "backend": "sqlite" if SHARED_STATE else "memory"}
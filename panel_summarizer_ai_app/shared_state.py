@@ -0,0 +1,115 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from config import DATA_DIR
+
+# Stan współdzielony między workerami (uvicorn --workers N): sesje, cache odpowiedzi i wersje indeksu.
+# STATE_BACKEND=memory (domyślnie) – słowniki w procesie; STATE_BACKEND=sqlite – lokalna baza SQLite (WAL)
+# w STATE_DB, wspólna dla wszystkich procesów na tej maszynie.
+STATE_BACKEND = os.getenv("STATE_BACKEND", "memory").lower()
+STATE_DB = Path(os.getenv("STATE_DB") or Path(DATA_DIR) / "state.sqlite")
+SHARED_STATE = STATE_BACKEND == "sqlite"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS kv (
+    ns TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT,
+    updated_at REAL,
+    expires_at REAL,
+    PRIMARY KEY (ns, key)
+);
+CREATE INDEX IF NOT EXISTS kv_ns_updated ON kv (ns, updated_at);
+"""
+
+_local = threading.local()
+_init_lock = threading.Lock()
+_schemas = [_SCHEMA]
+_initialized = False
+
+
+def register_schema(sql: str):
+    """Dodatkowe tabele modułów (np. cache odpowiedzi); tworzone przy pierwszym połączeniu."""
+    global _initialized
+    with _init_lock:
+        _schemas.append(sql)
+        _initialized = False
+
+
+def connect() -> sqlite3.Connection:
+    """Połączenie per wątek (autocommit, WAL); transakcje jawnie przez BEGIN IMMEDIATE."""
+    global _initialized
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        STATE_DB.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(str(STATE_DB), timeout=30, isolation_level=None, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        _local.conn = conn
+    with _init_lock:
+        if not _initialized:
+            for sql in _schemas:
+                conn.executescript(sql)
+            _initialized = True
+    return conn
+
+
+def kv_get(ns: str, key: str) -> Optional[Any]:
+    row = connect().execute(
+        "SELECT value, expires_at FROM kv WHERE ns=? AND key=?", (ns, key)
+    ).fetchone()
+    if row is None or (row["expires_at"] is not None and row["expires_at"] < time.time()):
+        return None
+    return json.loads(row["value"])
+
+
+def kv_set(ns: str, key: str, value: Any, ttl_s: Optional[float] = None):
+    now = time.time()
+    connect().execute(
+        "INSERT OR REPLACE INTO kv (ns, key, value, updated_at, expires_at) VALUES (?, ?, ?, ?, ?)",
+        (ns, key, json.dumps(value, ensure_ascii=False, default=str), now, now + ttl_s if ttl_s else None),
+    )
+
+
+def kv_update(ns: str, key: str, fields: Dict[str, Any], ttl_s: Optional[float] = None) -> bool:
+    """Atomowe scalenie pól słownika zapisanego pod kluczem; False, gdy klucza nie ma."""
+    conn = connect()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        row = conn.execute("SELECT value FROM kv WHERE ns=? AND key=?", (ns, key)).fetchone()
+        if row is None:
+            conn.execute("COMMIT")
+            return False
+        value = {**json.loads(row["value"]), **fields}
+        now = time.time()
+        conn.execute(
+            "UPDATE kv SET value=?, updated_at=?, expires_at=? WHERE ns=? AND key=?",
+            (json.dumps(value, ensure_ascii=False, default=str), now, now + ttl_s if ttl_s else None, ns, key),
+        )
+        conn.execute("COMMIT")
+        return True
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+
+
+def kv_count(ns: str) -> int:
+    return connect().execute("SELECT COUNT(*) FROM kv WHERE ns=?", (ns,)).fetchone()[0]
+
+
+def kv_prune(ns: str, max_entries: Optional[int] = None):
+    """Usuwa wygasłe wpisy i – powyżej max_entries – najdawniej aktualizowane."""
+    conn = connect()
+    conn.execute("DELETE FROM kv WHERE ns=? AND expires_at IS NOT NULL AND expires_at < ?", (ns, time.time()))
+    if max_entries is not None:
+        conn.execute(
+            "DELETE FROM kv WHERE ns=? AND key IN ("
+            "SELECT key FROM kv WHERE ns=? ORDER BY updated_at DESC LIMIT -1 OFFSET ?)",
+            (ns, ns, max_entries),
+        )
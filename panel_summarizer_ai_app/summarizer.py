@@ -1,10 +1,29 @@
-from typing import Optional, List, Dict, Any
-from openai import OpenAI
-from config import OPENAI_API_KEY
+from typing import Optional, List, Dict, Any, AsyncIterator
+from llm_client import get_chat_client, get_async_chat_client
+import asyncio
 import os
+import math
 import json as _json
+import queue
+import re as _re
+import threading
+import time
+from bisect import bisect_right
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from summary_cache import partial_key, get_partial, put_partial
+from context_packer import pack_contexts
+from metrics import timed, track_stream, atrack_stream, record_completion
+from async_utils import run_cpu
+from tracing import traced, current_span, in_context
+from logging_config import get_logger
 
-client = OpenAI(api_key=OPENAI_API_KEY)
+logger = get_logger(__name__)
+
+# wspólny klient (pula połączeń, timeouty, retry) – LocalChatClient przy MODEL_BACKEND=local
+client = get_chat_client()
+# klient async dla endpointów async (summarize_async, answer_async) – strumień nie blokuje wątku
+aclient = get_async_chat_client()
 
 # Prompty do podsumowania
 SUMMARY_PROMPT_SYSTEM = (
@@ -44,68 +63,133 @@ ANSWER_PROMPT_USER_TEMPLATE = (
 SUMMARIZE_MODEL =  "gpt-4.1"
 SUMMARIZE_INPUT_TOKEN_BUDGET = 16000
 PARTIAL_MAX_TOKENS = 8000
+SUMMARIZE_MAP_CONCURRENCY = int(os.getenv("SUMMARIZE_MAP_CONCURRENCY", "4"))
+SUMMARIZE_MAX_REDUCE_LEVELS = int(os.getenv("SUMMARIZE_MAX_REDUCE_LEVELS", "3"))
+PROGRESS_MARKER = "[POSTĘP]"  # linie postępu map-reduce – tylko na żądanie (progress=True)
 
-def _estimate_tokens(text: str) -> int:
+@lru_cache(maxsize=1)
+def _get_encoder():
+    # enkoder tworzony raz na proces; None (także zapamiętane) -> szacowanie po znakach
     try:
         import tiktoken
         try:
-            enc = tiktoken.encoding_for_model(SUMMARIZE_MODEL)
+            return tiktoken.encoding_for_model(SUMMARIZE_MODEL)
         except Exception:
-            enc = tiktoken.get_encoding("cl100k_base")
-        return len(enc.encode(text))
-    except Exception:
+            return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        logger.warning(f"[SUMMARIZE] tiktoken unavailable, using char estimate: {e}")
+        return None
+
+def _estimate_tokens(text: str) -> int:
+    enc = _get_encoder()
+    if enc is None:
         return max(1, len(text) // 4)
+    return len(enc.encode(text, disallowed_special=()))
+
+def _token_char_offsets(text: str) -> List[int]:
+    """Pozycja znakowa początku każdego tokenu (jedno kodowanie całego tekstu)."""
+    enc = _get_encoder()
+    if enc is None:
+        return list(range(0, len(text), 4))
+    _, offsets = enc.decode_with_offsets(enc.encode(text, disallowed_special=()))
+    return offsets
+
+def _greedy_cuts(bounds: List[int], total: int, cap: int) -> List[int]:
+    # cięcia (indeksy tokenów) na ostatniej granicy linii mieszczącej się w cap; linia dłuższa niż cap -> cięcie w linii
+    cuts = [0]
+    start = 0
+    while total - start > cap:
+        i = bisect_right(bounds, start + cap) - 1
+        nxt = bounds[i] if i >= 0 and bounds[i] > start else start + cap
+        cuts.append(nxt)
+        start = nxt
+    cuts.append(total)
+    return cuts
 
 def _split_text_by_tokens_optimal(text: str, token_budget: int) -> List[str]:
-    total = _estimate_tokens(text)
+    """
+    Dzieli tekst na minimalną liczbę części <= token_budget, tnąc na granicach linii transkryptu.
+    Tekst kodowany jest raz; granice linii mapowane na indeksy tokenów (sumy prefiksowe), a najmniejszy
+    limit części dający tę samą liczbę części szukany binarnie – części są możliwie równe.
+    """
+    offsets = _token_char_offsets(text)
+    total = len(offsets)
     if total <= token_budget:
         return [text]
 
-    import math
-    n_parts = max(2, math.ceil(total / token_budget))
-    paragraphs = text.split("\n\n")
-    if len(paragraphs) <= n_parts:
-        step = math.ceil(len(text) / n_parts)
-        return [text[i:i+step] for i in range(0, len(text), step)]
-
-    target_tokens = math.ceil(total / n_parts)
-    parts: List[str] = []
-    acc: List[str] = []
-    acc_tokens = 0
-    for para in paragraphs:
-        para_tokens = _estimate_tokens(para)
-        if acc and (acc_tokens + para_tokens) > target_tokens and len(parts) < (n_parts - 1):
-            parts.append("\n\n".join(acc))
-            acc, acc_tokens = [], 0
-        acc.append(para)
-        acc_tokens += para_tokens
-    if acc:
-        parts.append("\n\n".join(acc))
-
-    while len(parts) > n_parts:
-        parts[-2] = parts[-2] + "\n\n" + parts[-1]
-        parts.pop()
-
-    fixed: List[str] = []
-    for p in parts:
-        if _estimate_tokens(p) <= token_budget:
-            fixed.append(p)
+    # indeks pierwszego tokenu każdej linii (poza pierwszą)
+    bounds: List[int] = []
+    bound_chars: Dict[int, int] = {}
+    t = 0
+    pos = text.find("\n")
+    while pos != -1:
+        line_start = pos + 1
+        while t < total and offsets[t] < line_start:
+            t += 1
+        if t >= total:
+            break
+        if not bounds or bounds[-1] != t:
+            bounds.append(t)
+            bound_chars[t] = line_start
+        pos = text.find("\n", line_start)
+
+    cuts = _greedy_cuts(bounds, total, token_budget)
+    n_parts = len(cuts) - 1
+    lo, hi = math.ceil(total / n_parts), token_budget
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if len(_greedy_cuts(bounds, total, mid)) - 1 <= n_parts:
+            hi = mid
         else:
-            t = _estimate_tokens(p)
-            sub_n = math.ceil(t / token_budget)
-            step = math.ceil(len(p) / sub_n)
-            fixed.extend([p[i:i+step] for i in range(0, len(p), step)])
-    return fixed
+            lo = mid + 1
+    cuts = _greedy_cuts(bounds, total, lo)
+
+    def _char(tok: int) -> int:
+        if tok >= total:
+            return len(text)
+        return bound_chars.get(tok, offsets[tok])
+
+    parts = [text[_char(a):_char(b)].strip("\n") for a, b in zip(cuts, cuts[1:])]
+    return [p for p in parts if p.strip()]
+
+# Prompty streszczeń cząstkowych; zmiana treści wymaga podbicia PARTIAL_PROMPT_VERSION (klucz cache)
+PARTIAL_PROMPT_SYSTEM = "Jesteś asystentem, który wiernie i zwięźle streszcza dany fragment, zachowując kluczowe fakty."
+PARTIAL_PROMPT_USER_TEMPLATE = "Streć możliwie dokładnie (bez dodawania nowych informacji) poniższy fragment:\n\n---\n{fragment}\n---"
+PARTIAL_PROMPT_VERSION = "v1"
+
+def _messages_tokens(messages: List[Dict[str, str]]) -> int:
+    return sum(_estimate_tokens(m.get("content") or "") for m in messages)
 
+@traced("llm_stream")
+def _stream_chat(operation: str, model: str, messages: List[Dict[str, str]], **kwargs):
+    """Strumień delt z chat.completions z metrykami (TTFT, tokeny, tokeny/s) pod etykietą operation."""
+    current_span().set(operation=operation, model=model)
+    started = time.perf_counter()
+    stream_resp = client.chat.completions.create(
+        model=model,
+        messages=messages,
+        stream=True,
+        stream_options={"include_usage": True},
+        **kwargs
+    )
+    yield from track_stream(operation, stream_resp, started,
+                            prompt_tokens=_messages_tokens(messages), count_tokens=_estimate_tokens)
+
+@traced("llm_call")
 def _summarize_fragment(fragment: str) -> str:
-    system = "Jesteś asystentem, który wiernie i zwięźle streszcza dany fragment, zachowując kluczowe fakty."
-    user = f"Streć możliwie dokładnie (bez dodawania nowych informacji) poniższy fragment:\n\n---\n{fragment}\n---"
+    current_span().set(operation="summarize_partial", model=SUMMARIZE_MODEL)
+    system = PARTIAL_PROMPT_SYSTEM
+    user = PARTIAL_PROMPT_USER_TEMPLATE.format(fragment=fragment)
+    messages = [{"role": "system", "content": system}, {"role": "user", "content": user}]
+    started = time.perf_counter()
     r = client.chat.completions.create(
         model=SUMMARIZE_MODEL,
-        messages=[{"role": "system", "content": system}, {"role": "user", "content": user}],
+        messages=messages,
         temperature=0.2,
         max_tokens=PARTIAL_MAX_TOKENS 
     )
+    record_completion("summarize_partial", r, started, prompt_tokens=_messages_tokens(messages),
+                      count_tokens=_estimate_tokens)
     return r.choices[0].message.content or ""
 
 def _format_context_blocks(context_list: List[Dict[str, Any]]) -> str:
@@ -137,151 +221,548 @@ def _normalize_contexts(contexts_or_results: Any) -> List[Dict[str, Any]]:
         return contexts_or_results
     return []
 
-def summarize(text: str, max_tokens: int = 800):
+def pack_answer_contexts(contexts: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Konteksty w postaci, w jakiej trafiają do promptu odpowiedzi (pack_contexts, tokeny modelu)."""
+    return pack_contexts(_normalize_contexts(contexts), count_tokens=_estimate_tokens)
+
+@timed("summarize")
+def summarize(text: str, max_tokens: int = 800, progress: bool = False):
     # krótkie wejście – pojedyncze zapytanie
     if _estimate_tokens(text) <= SUMMARIZE_INPUT_TOKEN_BUDGET:
         user_content = SUMMARY_PROMPT_USER_TEMPLATE.format(panel_text=text)
 
         def _gen_short():
-            stream_resp = client.chat.completions.create(
-                model=SUMMARIZE_MODEL,
-                messages=[
+            yield from _stream_chat(
+                "summarize",
+                SUMMARIZE_MODEL,
+                [
                     {"role": "system", "content": SUMMARY_PROMPT_SYSTEM},
                     {"role": "user", "content": user_content}
                 ],
                 temperature=0.2,
-                max_tokens=max_tokens,  # <-- zamiast max_tokens
-                stream=True
+                max_tokens=max_tokens,
             )
-            for chunk in stream_resp:
-                try:
-                    delta = chunk.choices[0].delta.content  # type: ignore[attr-defined]
-                except Exception:
-                    delta = None
-                if delta:
-                    yield delta
         return _gen_short()
 
-    # długie wejście – map-reduce i finalne podsumowanie
-    parts = _split_text_by_tokens_optimal(text, SUMMARIZE_INPUT_TOKEN_BUDGET)
-    partial_summaries: List[str] = []
-    for idx, frag in enumerate(parts, start=1):
-        ps = _summarize_fragment(frag)
-        partial_summaries.append(f"[CZĘŚĆ {idx}] {ps}")
+    # długie wejście – map-reduce (równoległy map, postęp w strumieniu) i finalne podsumowanie
+    def _gen_long():
+        parts = _split_text_by_tokens_optimal(text, SUMMARIZE_INPUT_TOKEN_BUDGET)
+        partial_summaries = yield from _map_fragments(parts, level=1, progress=progress)
+        yield from _reduce_stream(partial_summaries, max_tokens, progress=progress)
+    return _gen_long()
+
+def _reduce_stream(partial_summaries: List[str], max_tokens: int, progress: bool = False):
+    combined = "\n\n".join(f"[CZĘŚĆ {idx}] {ps}" for idx, ps in enumerate(partial_summaries, start=1))
+
+    # redukcja hierarchiczna: streszczenia cząstkowe same nie mieszczą się w budżecie
+    level = 1
+    while _estimate_tokens(combined) > SUMMARIZE_INPUT_TOKEN_BUDGET and level < SUMMARIZE_MAX_REDUCE_LEVELS:
+        level += 1
+        parts = _split_text_by_tokens_optimal(combined, SUMMARIZE_INPUT_TOKEN_BUDGET)
+        partial_summaries = yield from _map_fragments(parts, level=level, progress=progress)
+        combined = "\n\n".join(f"[CZĘŚĆ {idx}] {ps}" for idx, ps in enumerate(partial_summaries, start=1))
 
-    combined = "\n\n".join(partial_summaries)
     user_content = SUMMARY_PROMPT_USER_TEMPLATE.format(panel_text=combined)
+    yield from _stream_chat(
+        "summarize_reduce",
+        SUMMARIZE_MODEL,
+        [
+            {"role": "system", "content": SUMMARY_PROMPT_SYSTEM},
+            {"role": "user", "content": user_content}
+        ],
+        temperature=0.2,
+        max_tokens=max_tokens,
+    )
 
-    def _gen_long():
-        stream_resp = client.chat.completions.create(
-            model=SUMMARIZE_MODEL,
-            messages=[
-                {"role": "system", "content": SUMMARY_PROMPT_SYSTEM},
-                {"role": "user", "content": user_content}
-            ],
-            temperature=0.2,
-            max_tokens=max_tokens,  # <-- zamiast max_tokens
-            stream=True
-        )
-        for chunk in stream_resp:
-            try:
-                delta = chunk.choices[0].delta.content  # type: ignore[attr-defined]
-            except Exception:
-                delta = None
-            if delta:
-                yield delta
-    return _gen_long()
+def _drain(gen) -> Any:
+    # wykonuje generator do końca i zwraca jego wartość return
+    while True:
+        try:
+            next(gen)
+        except StopIteration as stop:
+            return stop.value
 
-def _parse_questions_llm(raw: str, model: str = "gpt-4.1") -> List[str]:
+def _group_chunks(chunks: List[Dict[str, Any]], token_budget: int) -> List[Dict[str, Any]]:
+    """Łączy kolejne chunki (chronologicznie) w fragmenty mieszczące się w token_budget."""
+    groups: List[Dict[str, Any]] = []
+    cur: Optional[Dict[str, Any]] = None
+    for c in sorted(chunks, key=lambda x: (x.get("start") or 0.0)):
+        line = f"[{c.get('start')}-{c.get('end')}] {c.get('speaker', 'UNKNOWN')}: {c.get('text', '')}"
+        tokens = int(c.get("tokens") or _estimate_tokens(line))
+        if cur is None or cur["tokens"] + tokens > token_budget:
+            cur = {"start": c.get("start"), "end": c.get("end"), "lines": [], "tokens": 0}
+            groups.append(cur)
+        cur["lines"].append(line)
+        cur["end"] = c.get("end")
+        cur["tokens"] += tokens
+    return [{"start": g["start"], "end": g["end"], "text": "\n".join(g["lines"])} for g in groups]
+
+def summarize_chunks(chunks: List[Dict[str, Any]], max_tokens: int = 800) -> Dict[str, Any]:
     """
-    Używa LLM do wyodrębnienia listy pytań z wejścia użytkownika.
-    Zwraca listę pytań; w razie problemów – [raw] jako fallback.
+    Niestrumieniowe podsumowanie z chunków (np. w tle po ingescie): fragmenty z kolejnych chunków są
+    streszczane (z cache cząstkowych), a następnie redukowane. Zwraca podsumowanie i streszczenia cząstkowe.
     """
-    raw = (raw or "").strip()
-    if not raw:
-        return []
-    sys_msg = (
-        "Jesteś asystentem, który wyodrębnia jedno lub więcej pytań z podanego tekstu. "
-        "Zwróć TYLKO poprawny JSON: {\"questions\": [\"pytanie 1?\", \"pytanie 2?\", ...]} bez dodatkowego tekstu."
+    groups = _group_chunks(chunks, SUMMARIZE_INPUT_TOKEN_BUDGET)
+    if len(groups) <= 1:
+        text = groups[0]["text"] if groups else ""
+        return {"summary": "".join(summarize(text, max_tokens=max_tokens)), "partials": []}
+    partial_summaries = _drain(_map_fragments([g["text"] for g in groups], level=1))
+    summary = "".join(_reduce_stream(partial_summaries, max_tokens))
+    partials = [{"start": g["start"], "end": g["end"], "summary": ps} for g, ps in zip(groups, partial_summaries)]
+    return {"summary": summary, "partials": partials}
+
+def _summarize_fragment_cached(fragment: str) -> str:
+    """_summarize_fragment z zapisem wyniku w trwałym cache (summary_cache)."""
+    summary = _summarize_fragment(fragment)
+    key = partial_key(fragment, SUMMARIZE_MODEL, PARTIAL_PROMPT_VERSION)
+    put_partial(
+        key, summary,
+        model=SUMMARIZE_MODEL,
+        prompt_version=PARTIAL_PROMPT_VERSION,
+        prompt_tokens=_estimate_tokens(fragment),
+        completion_tokens=_estimate_tokens(summary),
     )
+    return summary
+
+def _map_fragments(parts: List[str], level: int = 1, progress: bool = False):
+    """
+    Faza map: fragmenty z cache (summary_cache) są brane od razu, pozostałe streszczane równolegle
+    (SUMMARIZE_MAP_CONCURRENCY). Z progress=True po każdym ukończonym fragmencie emituje znacznik postępu.
+    Zwraca (przez StopIteration) streszczenia w kolejności fragmentów.
+    """
+    results: List[Optional[str]] = [None] * len(parts)
+    hits, saved = 0, 0
+    misses: List[int] = []
+    for idx, frag in enumerate(parts):
+        entry = get_partial(partial_key(frag, SUMMARIZE_MODEL, PARTIAL_PROMPT_VERSION))
+        if entry is None:
+            misses.append(idx)
+            continue
+        results[idx] = entry.get("summary", "")
+        hits += 1
+        saved += int(entry.get("prompt_tokens", 0)) + int(entry.get("completion_tokens", 0))
+        if progress:
+            yield f"{PROGRESS_MARKER} poziom {level}: część {idx + 1}/{len(parts)} z cache ({hits}/{len(parts)})\n"
+    logger.info(f"[SUMMARIZE] level={level} parts={len(parts)} cache_hits={hits} tokens_saved~{saved}")
+
+    if misses:
+        workers = max(1, min(SUMMARIZE_MAP_CONCURRENCY, len(misses)))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="summarize-map") as ex:
+            futures = {ex.submit(in_context(_summarize_fragment_cached), parts[idx]): idx for idx in misses}
+            for done, fut in enumerate(as_completed(futures), start=hits + 1):
+                idx = futures[fut]
+                results[idx] = fut.result()
+                logger.info(f"[SUMMARIZE] level={level} part {idx + 1}/{len(parts)} done ({done}/{len(parts)})")
+                if progress:
+                    yield f"{PROGRESS_MARKER} poziom {level}: część {idx + 1}/{len(parts)} gotowa ({done}/{len(parts)})\n"
+    if progress:
+        if hits:
+            yield f"{PROGRESS_MARKER} cache: {hits}/{len(parts)} części, zaoszczędzone tokeny ~{saved}\n"
+        yield "\n"
+    return [r or "" for r in results]
+
+_QUESTIONS_SYSTEM = (
+    "Jesteś asystentem, który wyodrębnia jedno lub więcej pytań z podanego tekstu. "
+    "Zwróć TYLKO poprawny JSON: {\"questions\": [\"pytanie 1?\", \"pytanie 2?\", ...]} bez dodatkowego tekstu."
+)
+
+def _questions_messages(raw: str) -> List[Dict[str, str]]:
     user_msg = (
         "Tekst użytkownika (może zawierać kilka pytań, zdania, wypunktowania):\n"
         f"{raw}\n\n"
         "Upewnij się, że każde pytanie kończy się znakiem '?'."
     )
+    return [
+        {"role": "system", "content": _QUESTIONS_SYSTEM},
+        {"role": "user", "content": user_msg},
+    ]
+
+def _questions_from_content(content: str) -> List[str]:
+    data = _json.loads(content or "")
+    qs = data.get("questions", [])
+    return [q.strip() for q in qs if isinstance(q, str) and q.strip()]
+
+def _questions_fallback(raw: str) -> List[str]:
+    # traktuj cały tekst jako jedno pytanie
+    return [raw if raw.endswith("?") else f"{raw}?"]
+
+@traced("llm_call")
+def _parse_questions_llm(raw: str, model: str = "gpt-4.1") -> List[str]:
+    """
+    Używa LLM do wyodrębnienia listy pytań z wejścia użytkownika.
+    Zwraca listę pytań; w razie problemów – [raw] jako fallback.
+    """
+    raw = (raw or "").strip()
+    if not raw:
+        return []
     try:
+        messages = _questions_messages(raw)
+        current_span().set(operation="parse_questions", model=model)
+        started = time.perf_counter()
         resp = client.chat.completions.create(
             model=model,
-            messages=[
-                {"role": "system", "content": sys_msg},
-                {"role": "user", "content": user_msg},
-            ],
+            messages=messages,
             temperature=0.0,
             max_completion_tokens=256
         )
-        content = resp.choices[0].message.content or ""
-        data = _json.loads(content)
-        qs = data.get("questions", [])
-        qs = [q.strip() for q in qs if isinstance(q, str) and q.strip()]
+        record_completion("parse_questions", resp, started, prompt_tokens=_messages_tokens(messages),
+                          count_tokens=_estimate_tokens)
+        qs = _questions_from_content(resp.choices[0].message.content)
         if qs:
             return qs
     except Exception:
         pass
-    # Fallback: traktuj cały tekst jako jedno pytanie
-    return [raw if raw.endswith("?") else f"{raw}?"]
+    return _questions_fallback(raw)
 
-def answer(contexts, question: str, model: str = "gpt-4.1", top_k: int = None):
+ANSWER_CONCURRENCY = int(os.getenv("ANSWER_CONCURRENCY", "4"))
+_BULLET_RE = _re.compile(r"^\s*(?:[-*•]|\d+[.)])\s+")
+_QUESTION_RE = _re.compile(r"[^?]*\?")
+
+def _split_questions_heuristic(raw: str) -> Optional[List[str]]:
+    """
+    Szybki podział bez LLM: linie/wypunktowania i znaki '?'.
+    Zwraca None, gdy podział nie jest jednoznaczny (tekst bez '?' obok pytań, bardzo krótkie fragmenty).
+    """
+    raw = (raw or "").strip()
+    if not raw:
+        return []
+    lines = [l for l in raw.splitlines() if l.strip()]
+    questions: List[str] = []
+    for line in lines:
+        bullet = bool(_BULLET_RE.match(line))
+        line = _BULLET_RE.sub("", line).strip()
+        found = [q.strip() for q in _QUESTION_RE.findall(line) if q.strip(" ?")]
+        rest = _QUESTION_RE.sub("", line).strip()
+        if rest:
+            if found or not (bullet or len(lines) == 1):
+                return None
+            found = [f"{rest}?"]
+        questions.extend(found)
+    if len(questions) > 1 and any(len(q.split()) < 2 for q in questions):
+        return None
+    return questions
+
+def split_questions(raw: str, model: str = "gpt-4.1") -> List[str]:
+    """Lista pod-pytań: heurystyka lokalna, a gdy niejednoznaczna – _parse_questions_llm."""
+    qs = _split_questions_heuristic(raw)
+    if qs is not None:
+        return qs
+    logger.info("[ANSWER] question split ambiguous, using LLM parser")
+    return _parse_questions_llm(raw, model=model)
+
+def _stream_answer(ctx_list, question: str, model: str):
+    user_content = ANSWER_PROMPT_USER_TEMPLATE.format(contexts=_format_context_blocks(ctx_list), question=question)
+    yield from _stream_chat(
+        "answer",
+        model,
+        [
+            {"role": "system", "content": ANSWER_PROMPT_SYSTEM},
+            {"role": "user", "content": user_content}
+        ],
+        temperature=0.0,
+    )
+
+_DONE = object()
+
+@timed("answer")
+def answer(contexts, question: str, model: str = "gpt-4.1", top_k: int = None,
+           sub_questions: Optional[List[str]] = None, contexts_per_question: Optional[List[Any]] = None,
+           packed: bool = False):
+    """
+    Strumień odpowiedzi. Wiele pod-pytań (sub_questions lub split_questions) jest generowanych równolegle
+    (ANSWER_CONCURRENCY), ale wysyłanych w kolejności pytań; contexts_per_question[i] – osobne konteksty
+    dla i-tego pod-pytania (domyślnie wspólne contexts). packed=True – konteksty są już po
+    pack_answer_contexts (wywołujący raportuje te same, które widzi model), inaczej pakowane tutaj.
+    """
     ctx_list = _normalize_contexts(contexts)
     if top_k is not None and isinstance(ctx_list, list):
         ctx_list = ctx_list[:top_k]
 
     # separacja wielu pytań
-    sub_questions = _parse_questions_llm(question, model=model)
+    if sub_questions is None:
+        sub_questions = split_questions(question, model=model)
+    if not sub_questions:
+        sub_questions = [question]
+
+    def _ctx_for(i: int):
+        if contexts_per_question is not None and i < len(contexts_per_question):
+            ctxs = _normalize_contexts(contexts_per_question[i])
+        else:
+            ctxs = ctx_list
+        return ctxs if packed else pack_answer_contexts(ctxs)
 
     if len(sub_questions) == 1:
-        context_block = _format_context_blocks(ctx_list)
-        user_content = ANSWER_PROMPT_USER_TEMPLATE.format(contexts=context_block, question=sub_questions[0])
-
-        def _gen_single():
-            stream_resp = client.chat.completions.create(
-                model=model,
-                messages=[
-                    {"role": "system", "content": ANSWER_PROMPT_SYSTEM},
-                    {"role": "user", "content": user_content}
-                ],
-                temperature=0.0,
-                stream=True
-            )
-            for chunk in stream_resp:
-                try:
-                    delta = chunk.choices[0].delta.content  
-                except Exception:
-                    delta = None
-                if delta:
-                    yield delta
-        return _gen_single()
-
-    # wiele pytań – każde osobno, w jednym strumieniu
+        return _stream_answer(_ctx_for(0), sub_questions[0], model)
+
+    # wiele pytań – generowane równolegle, w strumieniu w kolejności pytań
     def _gen_multi():
-        context_block = _format_context_blocks(ctx_list)
+        queues = [queue.Queue() for _ in sub_questions]
+        stop = threading.Event()
+
+        def _worker(i: int):
+            try:
+                for delta in _stream_answer(_ctx_for(i), sub_questions[i], model):
+                    if stop.is_set():
+                        return
+                    queues[i].put(delta)
+            except Exception as e:
+                queues[i].put(e)
+            finally:
+                queues[i].put(_DONE)
+
+        workers = max(1, min(ANSWER_CONCURRENCY, len(sub_questions)))
+        ex = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="answer")
+        try:
+            for i in range(len(sub_questions)):
+                ex.submit(in_context(_worker), i)
+            for i, q in enumerate(sub_questions, start=1):
+                yield f"\n\n[Pytanie {i}] {q}\n"
+                while True:
+                    item = queues[i - 1].get()
+                    if item is _DONE:
+                        break
+                    if isinstance(item, Exception):
+                        raise item
+                    yield item
+            yield "\n"
+        finally:
+            # klient przerwał strumień albo błąd – niezaczęte pytania odpadają z kolejki,
+            # trwające wątki kończą przy najbliższej delcie
+            stop.set()
+            ex.shutdown(wait=False, cancel_futures=True)
+    return _gen_multi()
+
+
+# --- ścieżka async (endpointy async): klient aclient, praca CPU w puli async_utils.run_cpu ---
+
+@traced("llm_stream")
+async def _astream_chat(operation: str, model: str, messages: List[Dict[str, str]], **kwargs) -> AsyncIterator[str]:
+    current_span().set(operation=operation, model=model)
+    started = time.perf_counter()
+    stream_resp = await aclient.chat.completions.create(
+        model=model,
+        messages=messages,
+        stream=True,
+        stream_options={"include_usage": True},
+        **kwargs
+    )
+    async for delta in atrack_stream(operation, stream_resp, started,
+                                     prompt_tokens=_messages_tokens(messages), count_tokens=_estimate_tokens):
+        yield delta
+
+@traced("llm_call")
+async def _asummarize_fragment_cached(fragment: str) -> str:
+    current_span().set(operation="summarize_partial", model=SUMMARIZE_MODEL)
+    messages = [
+        {"role": "system", "content": PARTIAL_PROMPT_SYSTEM},
+        {"role": "user", "content": PARTIAL_PROMPT_USER_TEMPLATE.format(fragment=fragment)},
+    ]
+    started = time.perf_counter()
+    r = await aclient.chat.completions.create(
+        model=SUMMARIZE_MODEL,
+        messages=messages,
+        temperature=0.2,
+        max_tokens=PARTIAL_MAX_TOKENS
+    )
+    record_completion("summarize_partial", r, started, prompt_tokens=_messages_tokens(messages),
+                      count_tokens=_estimate_tokens)
+    summary = r.choices[0].message.content or ""
+    key = partial_key(fragment, SUMMARIZE_MODEL, PARTIAL_PROMPT_VERSION)
+    await run_cpu(
+        put_partial, key, summary,
+        model=SUMMARIZE_MODEL,
+        prompt_version=PARTIAL_PROMPT_VERSION,
+        prompt_tokens=_estimate_tokens(fragment),
+        completion_tokens=_estimate_tokens(summary),
+    )
+    return summary
+
+async def _amap_fragments(parts: List[str], results: List[str], level: int = 1,
+                          progress: bool = False) -> AsyncIterator[str]:
+    """Jak _map_fragments: wyniki trafiają do results (w kolejności fragmentów), strumień – znaczniki postępu."""
+    results[:] = [""] * len(parts)
+    hits, saved = 0, 0
+    misses: List[int] = []
+    for idx, frag in enumerate(parts):
+        entry = await run_cpu(get_partial, partial_key(frag, SUMMARIZE_MODEL, PARTIAL_PROMPT_VERSION))
+        if entry is None:
+            misses.append(idx)
+            continue
+        results[idx] = entry.get("summary", "")
+        hits += 1
+        saved += int(entry.get("prompt_tokens", 0)) + int(entry.get("completion_tokens", 0))
+        if progress:
+            yield f"{PROGRESS_MARKER} poziom {level}: część {idx + 1}/{len(parts)} z cache ({hits}/{len(parts)})\n"
+    logger.info(f"[SUMMARIZE] level={level} parts={len(parts)} cache_hits={hits} tokens_saved~{saved}")
+
+    if misses:
+        sem = asyncio.Semaphore(max(1, SUMMARIZE_MAP_CONCURRENCY))
+
+        async def _one(idx: int):
+            async with sem:
+                return idx, await _asummarize_fragment_cached(parts[idx])
+
+        tasks = [asyncio.ensure_future(_one(idx)) for idx in misses]
+        try:
+            for done, fut in enumerate(asyncio.as_completed(tasks), start=hits + 1):
+                idx, summary = await fut
+                results[idx] = summary
+                logger.info(f"[SUMMARIZE] level={level} part {idx + 1}/{len(parts)} done ({done}/{len(parts)})")
+                if progress:
+                    yield f"{PROGRESS_MARKER} poziom {level}: część {idx + 1}/{len(parts)} gotowa ({done}/{len(parts)})\n"
+        finally:
+            for t in tasks:
+                t.cancel()
+    if progress:
+        if hits:
+            yield f"{PROGRESS_MARKER} cache: {hits}/{len(parts)} części, zaoszczędzone tokeny ~{saved}\n"
+        yield "\n"
+
+async def _areduce_stream(partial_summaries: List[str], max_tokens: int,
+                          progress: bool = False) -> AsyncIterator[str]:
+    combined = "\n\n".join(f"[CZĘŚĆ {idx}] {ps}" for idx, ps in enumerate(partial_summaries, start=1))
+    level = 1
+    while await run_cpu(_estimate_tokens, combined) > SUMMARIZE_INPUT_TOKEN_BUDGET and level < SUMMARIZE_MAX_REDUCE_LEVELS:
+        level += 1
+        parts = await run_cpu(_split_text_by_tokens_optimal, combined, SUMMARIZE_INPUT_TOKEN_BUDGET)
+        summaries: List[str] = []
+        async for marker in _amap_fragments(parts, summaries, level=level, progress=progress):
+            yield marker
+        combined = "\n\n".join(f"[CZĘŚĆ {idx}] {ps}" for idx, ps in enumerate(summaries, start=1))
+
+    user_content = SUMMARY_PROMPT_USER_TEMPLATE.format(panel_text=combined)
+    async for delta in _astream_chat(
+        "summarize_reduce",
+        SUMMARIZE_MODEL,
+        [
+            {"role": "system", "content": SUMMARY_PROMPT_SYSTEM},
+            {"role": "user", "content": user_content}
+        ],
+        temperature=0.2,
+        max_tokens=max_tokens,
+    ):
+        yield delta
+
+@timed("summarize")
+async def summarize_async(text: str, max_tokens: int = 800, progress: bool = False) -> AsyncIterator[str]:
+    """Async odpowiednik summarize (ten sam podział, cache cząstkowych; znaczniki postępu przy progress=True)."""
+    if await run_cpu(_estimate_tokens, text) <= SUMMARIZE_INPUT_TOKEN_BUDGET:
+        async for delta in _astream_chat(
+            "summarize",
+            SUMMARIZE_MODEL,
+            [
+                {"role": "system", "content": SUMMARY_PROMPT_SYSTEM},
+                {"role": "user", "content": SUMMARY_PROMPT_USER_TEMPLATE.format(panel_text=text)}
+            ],
+            temperature=0.2,
+            max_tokens=max_tokens,
+        ):
+            yield delta
+        return
+
+    parts = await run_cpu(_split_text_by_tokens_optimal, text, SUMMARIZE_INPUT_TOKEN_BUDGET)
+    partial_summaries: List[str] = []
+    async for marker in _amap_fragments(parts, partial_summaries, level=1, progress=progress):
+        yield marker
+    async for delta in _areduce_stream(partial_summaries, max_tokens, progress=progress):
+        yield delta
+
+@traced("llm_call")
+async def _aparse_questions_llm(raw: str, model: str = "gpt-4.1") -> List[str]:
+    raw = (raw or "").strip()
+    if not raw:
+        return []
+    try:
+        messages = _questions_messages(raw)
+        current_span().set(operation="parse_questions", model=model)
+        started = time.perf_counter()
+        resp = await aclient.chat.completions.create(
+            model=model,
+            messages=messages,
+            temperature=0.0,
+            max_completion_tokens=256
+        )
+        record_completion("parse_questions", resp, started, prompt_tokens=_messages_tokens(messages),
+                          count_tokens=_estimate_tokens)
+        qs = _questions_from_content(resp.choices[0].message.content)
+        if qs:
+            return qs
+    except Exception:
+        pass
+    return _questions_fallback(raw)
+
+async def split_questions_async(raw: str, model: str = "gpt-4.1") -> List[str]:
+    qs = _split_questions_heuristic(raw)
+    if qs is not None:
+        return qs
+    logger.info("[ANSWER] question split ambiguous, using LLM parser")
+    return await _aparse_questions_llm(raw, model=model)
+
+async def _astream_answer(ctx_list, question: str, model: str) -> AsyncIterator[str]:
+    user_content = ANSWER_PROMPT_USER_TEMPLATE.format(contexts=_format_context_blocks(ctx_list), question=question)
+    async for delta in _astream_chat(
+        "answer",
+        model,
+        [
+            {"role": "system", "content": ANSWER_PROMPT_SYSTEM},
+            {"role": "user", "content": user_content}
+        ],
+        temperature=0.0,
+    ):
+        yield delta
+
+@timed("answer")
+async def answer_async(contexts, question: str, model: str = "gpt-4.1", top_k: int = None,
+                       sub_questions: Optional[List[str]] = None,
+                       contexts_per_question: Optional[List[Any]] = None,
+                       packed: bool = False) -> AsyncIterator[str]:
+    """Async odpowiednik answer: pod-pytania generowane współbieżnie (ANSWER_CONCURRENCY), wysyłane w kolejności."""
+    ctx_list = _normalize_contexts(contexts)
+    if top_k is not None and isinstance(ctx_list, list):
+        ctx_list = ctx_list[:top_k]
+    if sub_questions is None:
+        sub_questions = await split_questions_async(question, model=model)
+    if not sub_questions:
+        sub_questions = [question]
+
+    async def _ctx_for(i: int):
+        if contexts_per_question is not None and i < len(contexts_per_question):
+            ctxs = _normalize_contexts(contexts_per_question[i])
+        else:
+            ctxs = ctx_list
+        return ctxs if packed else await run_cpu(pack_answer_contexts, ctxs)
+
+    if len(sub_questions) == 1:
+        async for delta in _astream_answer(await _ctx_for(0), sub_questions[0], model):
+            yield delta
+        return
+
+    queues = [asyncio.Queue() for _ in sub_questions]
+    sem = asyncio.Semaphore(max(1, ANSWER_CONCURRENCY))
+
+    async def _worker(i: int):
+        try:
+            async with sem:
+                async for delta in _astream_answer(await _ctx_for(i), sub_questions[i], model):
+                    queues[i].put_nowait(delta)
+        except Exception as e:
+            queues[i].put_nowait(e)
+        finally:
+            queues[i].put_nowait(_DONE)
+
+    tasks = [asyncio.ensure_future(_worker(i)) for i in range(len(sub_questions))]
+    try:
         for i, q in enumerate(sub_questions, start=1):
             yield f"\n\n[Pytanie {i}] {q}\n"
-            user_content = ANSWER_PROMPT_USER_TEMPLATE.format(contexts=context_block, question=q)
-            stream_resp = client.chat.completions.create(
-                model=model,
-                messages=[
-                    {"role": "system", "content": ANSWER_PROMPT_SYSTEM},
-                    {"role": "user", "content": user_content}
-                ],
-                temperature=0.0,
-                stream=True
-            )
-            for chunk in stream_resp:
-                try:
-                    delta = chunk.choices[0].delta.content 
-                except Exception:
-                    delta = None
-                if delta:
-                    yield delta
+            while True:
+                item = await queues[i - 1].get()
+                if item is _DONE:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                yield item
         yield "\n"
-    return _gen_multi()
\ No newline at end of file
+    finally:
+        # klient przerwał strumień albo błąd – anulujemy pozostałe generowania
+        for t in tasks:
+            t.cancel()
@@ -0,0 +1,144 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from config import DATA_DIR
+from logging_config import get_logger
+
+logger = get_logger(__name__)
+
+# Trwały cache streszczeń cząstkowych (faza map w summarizer.summarize).
+# Klucz: hash fragmentu + model + wersja promptu; jeden plik JSON na wpis w DATA_DIR/cache/partials.
+# Rozmiar ograniczony liczbą wpisów i MB – przy przekroczeniu usuwane są najdawniej używane (mtime)
+# do 90% limitów.
+# Zajętość liczona przyrostowo przy zapisie; pełny skan katalogu tylko po przekroczeniu limitu
+# i co PARTIAL_CACHE_RESCAN_WRITES zapisów (korekta o wpisy innych procesów).
+PARTIAL_CACHE_DIR = Path(os.getenv("PARTIAL_CACHE_DIR") or Path(DATA_DIR) / "cache" / "partials")
+PARTIAL_CACHE_MAX_ENTRIES = int(os.getenv("PARTIAL_CACHE_MAX_ENTRIES", "5000"))
+PARTIAL_CACHE_MAX_MB = float(os.getenv("PARTIAL_CACHE_MAX_MB", "200"))
+PARTIAL_CACHE_ENABLED = os.getenv("PARTIAL_CACHE_ENABLED", "1") != "0"
+PARTIAL_CACHE_RESCAN_WRITES = int(os.getenv("PARTIAL_CACHE_RESCAN_WRITES", "500"))
+
+_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0, "writes": 0, "evictions": 0, "tokens_saved": 0}
+_evict_lock = threading.Lock()
+_usage: Optional[Dict[str, int]] = None  # {"entries", "bytes"}; None – jeszcze bez skanu
+_writes_since_scan = 0
+
+
+def partial_key(fragment: str, model: str, prompt_version: str) -> str:
+    h = hashlib.sha256()
+    for part in (model, prompt_version, fragment):
+        h.update(part.encode("utf-8"))
+        h.update(b"\x00")
+    return h.hexdigest()
+
+
+def _path(key: str) -> Path:
+    return PARTIAL_CACHE_DIR / key[:2] / f"{key}.json"
+
+
+def get_partial(key: str) -> Optional[Dict[str, Any]]:
+    if not PARTIAL_CACHE_ENABLED:
+        return None
+    path = _path(key)
+    try:
+        entry = json.loads(path.read_text(encoding="utf-8"))
+        os.utime(path)  # LRU: mtime = ostatnie użycie
+    except (OSError, ValueError):
+        with _lock:
+            _stats["misses"] += 1
+        return None
+    with _lock:
+        _stats["hits"] += 1
+        _stats["tokens_saved"] += int(entry.get("prompt_tokens", 0)) + int(entry.get("completion_tokens", 0))
+    return entry
+
+
+def put_partial(key: str, summary: str, **meta: Any):
+    if not PARTIAL_CACHE_ENABLED:
+        return
+    global _writes_since_scan
+    path = _path(key)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    try:
+        old_size = path.stat().st_size  # nadpisanie istniejącego wpisu
+    except OSError:
+        old_size = None
+    data = json.dumps({"summary": summary, **meta}, ensure_ascii=False).encode("utf-8")
+    # unikalny plik tymczasowy także między procesami (workery mogą mieć te same identyfikatory wątków)
+    fd, tmp = tempfile.mkstemp(prefix=f".{key[:16]}.", suffix=".tmp", dir=path.parent)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        Path(tmp).unlink(missing_ok=True)
+        raise
+    with _lock:
+        _stats["writes"] += 1
+        _writes_since_scan += 1
+        if _usage is not None:
+            _usage["bytes"] += len(data) - (old_size or 0)
+            _usage["entries"] += old_size is None
+        scan = (_usage is None or _writes_since_scan >= PARTIAL_CACHE_RESCAN_WRITES
+                or _usage["entries"] > PARTIAL_CACHE_MAX_ENTRIES
+                or _usage["bytes"] > PARTIAL_CACHE_MAX_MB * 1024 * 1024)
+    if scan:
+        _evict()
+
+
+def _evict():
+    if not _evict_lock.acquire(blocking=False):
+        return  # skan/usuwanie już trwa w innym wątku
+    try:
+        _evict_scan()
+    finally:
+        _evict_lock.release()
+
+
+def _evict_scan():
+    global _usage, _writes_since_scan
+    files = []
+    total = 0
+    for p in PARTIAL_CACHE_DIR.glob("*/*.json"):
+        try:
+            st = p.stat()
+        except OSError:
+            continue
+        files.append((st.st_mtime, st.st_size, p))
+        total += st.st_size
+    with _lock:
+        _usage = {"entries": len(files), "bytes": total}
+        _writes_since_scan = 0
+    max_bytes = PARTIAL_CACHE_MAX_MB * 1024 * 1024
+    if len(files) <= PARTIAL_CACHE_MAX_ENTRIES and total <= max_bytes:
+        return
+    # usuwanie do 90% limitów – kolejny skan dopiero po kilku(set) nowych wpisach, nie przy każdym zapisie
+    max_entries, max_bytes = int(PARTIAL_CACHE_MAX_ENTRIES * 0.9), max_bytes * 0.9
+    files.sort()
+    count = len(files)
+    removed = 0
+    for _, size, p in files:
+        if count <= max_entries and total <= max_bytes:
+            break
+        try:
+            p.unlink()
+        except OSError:
+            continue
+        count -= 1
+        total -= size
+        removed += 1
+    with _lock:
+        _stats["evictions"] += removed
+        _usage = {"entries": count, "bytes": total}
+    logger.info(f"[PARTIAL_CACHE] evicted={removed} entries={count} size_mb={total / (1024 * 1024):.1f}")
+
+
+def cache_stats() -> Dict[str, Any]:
+    with _lock:
+        return {**_stats, "dir": str(PARTIAL_CACHE_DIR), "enabled": PARTIAL_CACHE_ENABLED}
@@ -0,0 +1,88 @@
+import json
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from config import DATA_DIR
+from summarizer import summarize_chunks, SUMMARIZE_MODEL, PARTIAL_PROMPT_VERSION
+from logging_config import get_logger
+
+logger = get_logger(__name__)
+
+# Gotowe podsumowania per video_id (DATA_DIR/summaries/<video_id>.json), liczone w tle po ingescie
+# albo zapisywane po wygenerowaniu na żądanie w /summarize_stream.
+SUMMARIES_DIR = Path(DATA_DIR) / "summaries"
+SUMMARY_WORKERS = int(os.getenv("SUMMARY_WORKERS", "1"))
+
+_executor = ThreadPoolExecutor(max_workers=SUMMARY_WORKERS, thread_name_prefix="summary")
+_lock = threading.Lock()
+_pending: Dict[str, Tuple[Future, int]] = {}  # video_id -> (zadanie, max_tokens)
+
+
+def _path(video_id: str) -> Path:
+    return SUMMARIES_DIR / f"{video_id}.json"
+
+
+def load_summary(video_id: str) -> Optional[Dict[str, Any]]:
+    try:
+        return json.loads(_path(video_id).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+
+
+def save_summary(video_id: str, summary: str, max_tokens: int, source: str,
+                 partials: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
+    record = {
+        "video_id": video_id,
+        "summary": summary,
+        "max_tokens": int(max_tokens),
+        "model": SUMMARIZE_MODEL,
+        "prompt_version": PARTIAL_PROMPT_VERSION,
+        "source": source,
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "partials": partials or [],
+    }
+    SUMMARIES_DIR.mkdir(parents=True, exist_ok=True)
+    tmp = _path(video_id).with_suffix(".tmp")
+    tmp.write_text(json.dumps(record, ensure_ascii=False, indent=2), encoding="utf-8")
+    os.replace(tmp, _path(video_id))
+    return record
+
+
+def _run(video_id: str, chunks: List[Dict[str, Any]], max_tokens: int) -> Dict[str, Any]:
+    try:
+        t0 = time.perf_counter()
+        logger.info(f"[SUMMARY_JOB] start video_id={video_id} chunks={len(chunks)} max_tokens={max_tokens}")
+        res = summarize_chunks(chunks, max_tokens=max_tokens)
+        record = save_summary(video_id, res["summary"], max_tokens, source="ingest", partials=res["partials"])
+        logger.info(f"[SUMMARY_JOB] done video_id={video_id} partials={len(res['partials'])} "
+              f"in {time.perf_counter() - t0:.1f}s")
+        return record
+    except Exception as e:
+        logger.error(f"[SUMMARY_JOB] ERROR video_id={video_id}: {e}")
+        raise
+    finally:
+        with _lock:
+            _pending.pop(video_id, None)
+
+
+def schedule_summary(video_id: str, chunks: List[Dict[str, Any]], max_tokens: int, force: bool = False) -> str:
+    """Zleca podsumowanie w tle. Zwraca: 'exists' | 'running' | 'queued'."""
+    stored = load_summary(video_id)
+    if stored and stored.get("max_tokens") == int(max_tokens) and not force:
+        return "exists"
+    with _lock:
+        if video_id in _pending:
+            return "running"
+        fut = _executor.submit(_run, video_id, list(chunks), int(max_tokens))
+        _pending[video_id] = (fut, int(max_tokens))
+    return "queued"
+
+
+def pending_summary(video_id: str) -> Optional[Tuple[Future, int]]:
+    """Trwające zadanie podsumowania dla video_id: (future, max_tokens) albo None."""
+    with _lock:
+        return _pending.get(video_id)
@@ -0,0 +1,407 @@
+import contextvars
+import functools
+import inspect
+import json
+import os
+import random
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional
+
+from config import DATA_DIR
+from logging_config import get_logger
+
+logger = get_logger(__name__)
+
+# Śledzenie etapów żądania (spany): ślad (trace) na żądanie HTTP albo zadanie w tle, zagnieżdżone spany
+# przez contextvars (także w generatorach, korutynach i pulach wątków – patrz in_context / run_cpu).
+# Zakończony ślad trafia do pamięci (ostatnie TRACE_MAX_TRACES, /traces/{id}) i jako jedna linia
+# do pliku JSONL (TRACE_FILE; pusty = bez eksportu). Bez aktywnego śladu dekoratory są przezroczyste.
+TRACE_ENABLED = os.getenv("TRACE_ENABLED", "1") != "0"
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "1.0"))
+TRACE_FILE = os.getenv("TRACE_FILE", str(Path(DATA_DIR) / "traces.jsonl"))
+TRACE_FILE_MAX_MB = float(os.getenv("TRACE_FILE_MAX_MB", "50"))  # potem rotacja do TRACE_FILE.1
+TRACE_MAX_TRACES = int(os.getenv("TRACE_MAX_TRACES", "200"))
+TRACE_MAX_SPANS = int(os.getenv("TRACE_MAX_SPANS", "2000"))  # na ślad (długie ingesty)
+TRACE_EXCLUDE_PATHS = tuple(
+    p for p in os.getenv("TRACE_EXCLUDE_PATHS", "/metrics,/health,/traces,/jobs,/docs,/openapi.json").split(",") if p
+)
+
+_TRACE_ID_RE = re.compile(r"^[0-9A-Za-z_-]{8,64}$")
+
+
+class Span:
+    __slots__ = ("trace", "span_id", "parent_id", "name", "started", "attrs", "events", "error", "duration_ms",
+                 "thread")
+
+    def __init__(self, trace: "Trace", name: str, parent_id: Optional[str], attrs: Dict[str, Any]):
+        self.trace = trace
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.name = name
+        self.started = time.perf_counter()
+        self.attrs = dict(attrs)
+        self.events: List[Dict[str, Any]] = []
+        self.error: Optional[str] = None
+        self.duration_ms: Optional[float] = None
+        self.thread = threading.current_thread().name
+
+    def set(self, **attrs: Any):
+        self.attrs.update(attrs)
+
+    def event(self, name: str, **attrs: Any):
+        self.events.append({"name": name, "at_ms": self.trace.offset_ms(time.perf_counter()), **attrs})
+
+    def end(self, error: Optional[BaseException] = None):
+        if self.duration_ms is not None:
+            return
+        if isinstance(error, Exception):
+            self.error = f"{type(error).__name__}: {error}"
+        self.duration_ms = round((time.perf_counter() - self.started) * 1000, 3)
+
+    def to_dict(self) -> Dict[str, Any]:
+        out = {
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start_ms": self.trace.offset_ms(self.started),
+            "duration_ms": self.duration_ms,
+            "thread": self.thread,
+        }
+        if self.attrs:
+            out["attrs"] = self.attrs
+        if self.events:
+            out["events"] = self.events
+        if self.error:
+            out["error"] = self.error
+        return out
+
+
+class _NoopSpan:
+    def set(self, **attrs: Any):
+        pass
+
+    def event(self, name: str, **attrs: Any):
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class Trace:
+    def __init__(self, trace_id: str, name: str):
+        self.trace_id = trace_id
+        self.name = name
+        self.started = time.perf_counter()
+        self.started_at = time.time()
+        self.spans: List[Span] = []
+        self.dropped = 0
+        self.finished = False
+        self._lock = threading.Lock()
+
+    def offset_ms(self, t: float) -> float:
+        return round((t - self.started) * 1000, 3)
+
+    def open(self, name: str, parent_id: Optional[str], attrs: Dict[str, Any]) -> Optional[Span]:
+        with self._lock:
+            if len(self.spans) >= TRACE_MAX_SPANS:
+                self.dropped += 1
+                return None
+            span = Span(self, name, parent_id, attrs)
+            self.spans.append(span)
+            return span
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            spans = [s.to_dict() for s in self.spans]
+        root = spans[0] if spans else {}
+        return {
+            "trace_id": self.trace_id,
+            "name": self.name,
+            "started_at": self.started_at,
+            "duration_ms": root.get("duration_ms"),
+            "spans": spans,
+            "dropped_spans": self.dropped,
+        }
+
+
+_trace: contextvars.ContextVar[Optional[Trace]] = contextvars.ContextVar("trace", default=None)
+_span: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar("span", default=None)
+
+_lock = threading.Lock()
+_recent: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+_file_lock = threading.Lock()
+
+
+def current_trace_id() -> Optional[str]:
+    trace = _trace.get()
+    return trace.trace_id if trace is not None else None
+
+
+def current_span():
+    """Bieżący span (do dopisania atrybutów/zdarzeń) albo NOOP_SPAN poza śladem."""
+    return _span.get() or NOOP_SPAN
+
+
+def _open(name: str, attrs: Dict[str, Any]) -> Optional[Span]:
+    trace = _trace.get()
+    if trace is None:
+        return None
+    parent = _span.get()
+    return trace.open(name, parent.span_id if parent is not None else None, attrs)
+
+
+@contextmanager
+def span(name: str, **attrs: Any) -> Iterator[Any]:
+    s = _open(name, attrs)
+    if s is None:
+        yield NOOP_SPAN
+        return
+    token = _span.set(s)
+    error = None
+    try:
+        yield s
+    except BaseException as e:
+        error = e
+        raise
+    finally:
+        _span.reset(token)
+        s.end(error)
+
+
+def _traced_gen(gen: Iterator[Any], s: Span):
+    # span ustawiany tylko na czas kroku generatora – między krokami kontekst należy do konsumenta
+    error = None
+    try:
+        while True:
+            token = _span.set(s)
+            try:
+                item = next(gen)
+            except StopIteration as stop:
+                return stop.value
+            finally:
+                _span.reset(token)
+            yield item
+    except BaseException as e:
+        error = e
+        raise
+    finally:
+        gen.close()
+        s.end(error)
+
+
+async def _atraced_gen(agen: AsyncIterator[Any], s: Span):
+    error = None
+    try:
+        while True:
+            token = _span.set(s)
+            try:
+                item = await agen.__anext__()
+            except StopAsyncIteration:
+                return
+            finally:
+                _span.reset(token)
+            yield item
+    except BaseException as e:
+        error = e
+        raise
+    finally:
+        try:
+            await agen.aclose()
+        finally:
+            s.end(error)
+
+
+async def _atraced_coro(coro, s: Span):
+    token = _span.set(s)
+    error = None
+    try:
+        return await coro
+    except BaseException as e:
+        error = e
+        raise
+    finally:
+        _span.reset(token)
+        s.end(error)
+
+
+def traced(name: str) -> Callable:
+    """
+    Dekorator: wywołanie jako span `name` w bieżącym śladzie. Generator (także async) i korutyna
+    są mierzone do wyczerpania/zamknięcia, jak w metrics.timed.
+    """
+    def deco(fn: Callable) -> Callable:
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            s = _open(name, {})
+            if s is None:
+                return fn(*args, **kwargs)
+            token = _span.set(s)
+            try:
+                result = fn(*args, **kwargs)
+            except BaseException as e:
+                s.end(e)
+                raise
+            finally:
+                _span.reset(token)
+            if inspect.isgenerator(result):
+                return _traced_gen(result, s)
+            if inspect.isasyncgen(result):
+                return _atraced_gen(result, s)
+            if inspect.iscoroutine(result):
+                return _atraced_coro(result, s)
+            s.end()
+            return result
+        return wrapper
+    return deco
+
+
+def in_context(fn: Callable) -> Callable:
+    """fn związana z bieżącym kontekstem (ślad, span) – do przekazania do puli wątków."""
+    return functools.partial(contextvars.copy_context().run, fn)
+
+
+def _sampled() -> bool:
+    return TRACE_ENABLED and (TRACE_SAMPLE_RATE >= 1 or random.random() < TRACE_SAMPLE_RATE)
+
+
+@contextmanager
+def start_trace(name: str, trace_id: Optional[str] = None, **attrs: Any) -> Iterator[Optional[Trace]]:
+    """Nowy ślad ze spanem głównym `name`; None, gdy śledzenie wyłączone albo ślad niewylosowany."""
+    if not _sampled():
+        yield None
+        return
+    trace = Trace(trace_id if trace_id and _TRACE_ID_RE.match(trace_id) else uuid.uuid4().hex, name)
+    t_token = _trace.set(trace)
+    s_token = _span.set(None)
+    try:
+        with span(name, **attrs):
+            yield trace
+    finally:
+        _span.reset(s_token)
+        _trace.reset(t_token)
+        _finish(trace)
+
+
+def _finish(trace: Trace):
+    trace.finished = True
+    record = trace.to_dict()
+    with _lock:
+        _recent[trace.trace_id] = record
+        _recent.move_to_end(trace.trace_id)
+        while len(_recent) > TRACE_MAX_TRACES:
+            _recent.popitem(last=False)
+    if TRACE_FILE:
+        try:
+            _export(record)
+        except OSError as e:
+            logger.warning(f"[TRACE] export to {TRACE_FILE} failed: {e}")
+
+
+def _export(record: Dict[str, Any]):
+    path = Path(TRACE_FILE)
+    line = json.dumps(record, ensure_ascii=False, default=str) + "\n"
+    with _file_lock:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        if TRACE_FILE_MAX_MB > 0 and path.exists() and path.stat().st_size > TRACE_FILE_MAX_MB * 1024 * 1024:
+            os.replace(path, path.with_name(path.name + ".1"))
+        # jedna linia na zapis w trybie append – linie z kilku workerów się nie przeplatają
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(line)
+
+
+def get_trace(trace_id: str) -> Optional[Dict[str, Any]]:
+    """Ślad z pamięci procesu, a gdy go tam nie ma (inny worker, restart) – z pliku JSONL."""
+    with _lock:
+        record = _recent.get(trace_id)
+    if record is not None or not TRACE_FILE:
+        return record
+    needle = f'"trace_id": "{trace_id}"'
+    for path in (Path(TRACE_FILE), Path(TRACE_FILE + ".1")):
+        if not path.exists():
+            continue
+        found = None
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if needle in line:
+                    found = line
+        if found:
+            return json.loads(found)
+    return None
+
+
+def recent_traces(limit: int = 20) -> List[Dict[str, Any]]:
+    with _lock:
+        records = list(_recent.values())[-limit:]
+    return [{"trace_id": r["trace_id"], "name": r["name"], "started_at": r["started_at"],
+             "duration_ms": r["duration_ms"], "spans": len(r["spans"])} for r in reversed(records)]
+
+
+def waterfall(record: Dict[str, Any], width: int = 40) -> List[str]:
+    """Tekstowy wykres kaskadowy: start, pasek czasu, czas trwania i nazwa spanu (wcięcie = zagnieżdżenie)."""
+    spans = record["spans"]
+    total = record.get("duration_ms") or max((s["start_ms"] + (s["duration_ms"] or 0) for s in spans), default=0)
+    children: Dict[Optional[str], List[Dict[str, Any]]] = {}
+    ids = {s["span_id"] for s in spans}
+    for s in spans:
+        parent = s["parent_id"] if s["parent_id"] in ids else None
+        children.setdefault(parent, []).append(s)
+    lines = [f"trace {record['trace_id']} {record['name']} {total:.1f} ms"]
+
+    def _walk(parent: Optional[str], depth: int):
+        for s in sorted(children.get(parent, []), key=lambda x: x["start_ms"]):
+            dur = s["duration_ms"]
+            scale = width / total if total else 0
+            left = min(width - 1, int(s["start_ms"] * scale))
+            bar = max(1, int((dur or (total - s["start_ms"])) * scale))
+            cells = " " * left + "█" * min(bar, width - left)
+            dur_txt = f"{dur:9.1f} ms" if dur is not None else "   (open)   "
+            attrs = " ".join(f"{k}={v}" for k, v in (s.get("attrs") or {}).items())
+            events = " ".join(
+                f"{e['name']}{'(' + ','.join(str(v) for k, v in e.items() if k not in ('name', 'at_ms')) + ')' if len(e) > 2 else ''}"
+                f"@{e['at_ms']:.1f}ms" for e in s.get("events") or []
+            )
+            err = f" ERROR {s['error']}" if s.get("error") else ""
+            lines.append(f"{s['start_ms']:9.1f} ms |{cells:<{width}}| {dur_txt}  {'  ' * depth}{s['name']}"
+                         f"{(' ' + attrs) if attrs else ''}{(' [' + events + ']') if events else ''}{err}")
+            _walk(s["span_id"], depth + 1)
+
+    _walk(None, 0)
+    return lines
+
+
+class TraceMiddleware:
+    """
+    Middleware ASGI: ślad na żądanie HTTP (span główny do końca wysłania ciała – także dla strumieni),
+    nagłówek X-Trace-Id w odpowiedzi; przychodzący X-Trace-Id jest używany jako id śladu.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"].startswith(TRACE_EXCLUDE_PATHS):
+            await self.app(scope, receive, send)
+            return
+        incoming = dict(scope.get("headers") or []).get(b"x-trace-id")
+        name = f"{scope['method']} {scope['path']}"
+        with start_trace(name, trace_id=incoming.decode("latin-1") if incoming else None) as trace:
+            if trace is None:
+                await self.app(scope, receive, send)
+                return
+            root = current_span()
+
+            async def _send(message):
+                if message["type"] == "http.response.start":
+                    message = {**message, "headers": [*message.get("headers", []),
+                                                      (b"x-trace-id", trace.trace_id.encode())]}
+                    root.set(status=message["status"])
+                    root.event("response_start")
+                await send(message)
+
+            await self.app(scope, receive, _send)
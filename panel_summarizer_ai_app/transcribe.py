@@ -1,5 +1,7 @@
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from openai import OpenAI, APIConnectionError
+from typing import Iterable, Tuple
+from openai import APIConnectionError
 import time, json, os, math, subprocess, tempfile, re
 import soundfile as sf
 import shutil
@@ -7,14 +9,20 @@ import torch
 from torch.serialization import add_safe_globals
 add_safe_globals([torch.torch_version.TorchVersion])
 from pyannote.audio import Pipeline
-from config import HUGGINGFACE_TOKEN, DATA_DIR, FFMPEG_DIR, OPENAI_API_KEY
+from config import HUGGINGFACE_TOKEN, DATA_DIR, FFMPEG_DIR
+from llm_client import get_openai_client
+from logging_config import get_logger
+from metrics import timed
+from tracing import traced, in_context, current_span
+
+logger = get_logger(__name__)
 
 os.environ.setdefault("PYANNOTE_AUDIO_DISABLE_TORCHCODEC", "1")
 
 TRANSCRIPT_DIR = Path(DATA_DIR) / "transcripts"
 TRANSCRIPT_DIR.mkdir(parents=True, exist_ok=True)
 
-client = OpenAI(api_key=OPENAI_API_KEY)
+client = get_openai_client()
 
 SEGMENT_SECONDS =180  # 600 10 min; zmniejsz do 300/180 jeśli potrzeba
 EXPECTED_SPEAKERS = 5  # 0 = nieznana liczba mówców
@@ -22,6 +30,11 @@ MODEL_NAME = "whisper-1"  # lub "gpt-4o-mini-transcribe"
 
 OVERLAP_SECONDS = 3    # zakładka między chunkami
 
+# ingest strumieniowy (transcribe_stream): równoległe wywołania Whisper i diarizacji segmentów w trakcie pobierania;
+# diarizacja domyślnie w jednym wątku (jeden współdzielony pipeline pyannote)
+TRANSCRIBE_WORKERS = int(os.getenv("TRANSCRIBE_WORKERS", "2"))
+DIARIZE_WORKERS = int(os.getenv("DIARIZE_WORKERS", "1"))
+
 FILLER_PATTERN = re.compile(r"\b(uh|umm|er|yyy+|ee+|mmm+)\b", re.IGNORECASE)
 def clean_fillers(text: str) -> str:
     return re.sub(r"\s+", " ", FILLER_PATTERN.sub("", text)).strip()
@@ -32,11 +45,11 @@ def _ff_bin(name: str) -> str:
         exe = f"{name}.exe" if os.name == "nt" else name
         cand = Path(FFMPEG_DIR) / exe
         if cand.exists():
-            print(f"[FF] Using {name} from FFMPEG_DIR: {cand}")
+            logger.info(f"[FF] Using {name} from FFMPEG_DIR: {cand}")
             return str(cand)
     found = shutil.which(name)
     if found:
-        print(f"[FF] Using {name} from PATH: {found}")
+        logger.info(f"[FF] Using {name} from PATH: {found}")
         return found
     raise FileNotFoundError(f"{name} not found. Set FFMPEG_DIR in .env or add it to PATH.")
 
@@ -44,32 +57,36 @@ FFPROBE_BIN = _ff_bin("ffprobe")
 FFMPEG_BIN = _ff_bin("ffmpeg")
 
 def _get_duration(audio_path: str) -> float:
-    print(f"[DURATION] Probing duration via ffprobe for: {audio_path}")
+    logger.info(f"[DURATION] Probing duration via ffprobe for: {audio_path}")
     result = subprocess.run([
         FFPROBE_BIN, "-v", "error", "-show_entries",
         "format=duration", "-of", "default=noprint_wrappers=1:nokey=1",
         str(audio_path)
     ], capture_output=True, text=True, check=True)
     dur = float(result.stdout.strip())
-    print(f"[DURATION] {dur:.2f}s")
+    logger.info(f"[DURATION] {dur:.2f}s")
     return dur
 
+def _segment_offset(i: int) -> float:
+    # start segmentu i z overlapem (oprócz pierwszego) – ten sam układ co yt_download.pcm_segments
+    return float(max(0, i * SEGMENT_SECONDS - (OVERLAP_SECONDS if i > 0 else 0)))
+
+@traced("_split_audio")
 def _split_audio(audio_path: str) -> list[str]:
-    print(f"[SPLIT] Preparing chunks for: {audio_path}")
+    logger.info(f"[SPLIT] Preparing chunks for: {audio_path}")
     duration = _get_duration(audio_path)
     parts = []
     total_segments = math.ceil(duration / SEGMENT_SECONDS)
     tmpdir = Path(tempfile.gettempdir()) / f"chunks_{Path(audio_path).stem}"
     tmpdir.mkdir(exist_ok=True)
-    print(f"[SPLIT] Total chunks: {total_segments}, dir: {tmpdir}")
+    logger.info(f"[SPLIT] Total chunks: {total_segments}, dir: {tmpdir}")
     for i in range(total_segments):
-        # start z overlapem (oprócz pierwszego)
-        start = max(0, i * SEGMENT_SECONDS - (OVERLAP_SECONDS if i > 0 else 0))
+        start = int(_segment_offset(i))
         # długość segmentu + overlap jeśli nie ostatni
         seg_len = SEGMENT_SECONDS + (OVERLAP_SECONDS if i < total_segments - 1 else 0)
         out = tmpdir / f"{Path(audio_path).stem}_chunk_{i:03d}.wav"
         if not out.exists():
-            print(f"[SPLIT] Creating chunk {i}: start={start}s -> {out}")
+            logger.info(f"[SPLIT] Creating chunk {i}: start={start}s -> {out}")
             subprocess.run([
                 FFMPEG_BIN, "-y", "-i", str(audio_path),
                 "-ss", str(start),
@@ -78,43 +95,40 @@ def _split_audio(audio_path: str) -> list[str]:
                 str(out)
             ], check=True)
         else:
-            print(f"[SPLIT] Chunk {i} already exists: {out}")
+            logger.info(f"[SPLIT] Chunk {i} already exists: {out}")
         parts.append(str(out))
     return parts
 
-def _transcribe_segment(path: str, base_offset: float, retries: int = 3, timeout: float = 600.0) -> dict:
-    print(f"[TRANSCRIBE] Start segment: file={path}, offset={base_offset:.2f}")
-    last_err = None
-    for attempt in range(1, retries + 1):
-        try:
-            with open(path, "rb") as f:
-                resp = client.audio.transcriptions.create(
-                    model=MODEL_NAME,
-                    file=f,
-                    response_format="verbose_json",
-                    timeout=timeout
-                )
-            data = resp.model_dump() if hasattr(resp, "model_dump") else json.loads(resp)
-            segs = data.get("segments", [])
-            for s in segs:
-                s["start"] = (s.get("start") or 0.0) + base_offset
-                s["end"] = (s.get("end") or s.get("start") or 0.0) + base_offset
-            print(f"[TRANSCRIBE] OK segments={len(segs)}")
-            return {"segments": segs, "text": data.get("text", "")}
-        except APIConnectionError as e:
-            print(f"[TRANSCRIBE] APIConnectionError attempt={attempt}: {e}")
-            last_err = e
-            time.sleep(2 * attempt)
-        except Exception as e:
-            print(f"[TRANSCRIBE] ERROR attempt={attempt}: {e}")
-            last_err = e
-            break
-    print(f"[TRANSCRIBE] FAIL: {last_err}")
-    raise last_err or RuntimeError(f"Transkrypcja segmentu nieudana: {path}")
+@traced("_transcribe_segment")
+def _transcribe_segment(path: str, base_offset: float, timeout: float = 600.0) -> dict:
+    # ponowienia (błędy połączenia, 429/5xx) z backoffem obsługuje wspólny klient z llm_client
+    logger.info(f"[TRANSCRIBE] Start segment: file={path}, offset={base_offset:.2f}")
+    try:
+        with open(path, "rb") as f:
+            resp = client.audio.transcriptions.create(
+                model=MODEL_NAME,
+                file=f,
+                response_format="verbose_json",
+                timeout=timeout
+            )
+    except APIConnectionError as e:
+        logger.error(f"[TRANSCRIBE] FAIL (connection, after retries): {e}")
+        raise
+    except Exception as e:
+        logger.error(f"[TRANSCRIBE] FAIL: {e}")
+        raise
+    data = resp.model_dump() if hasattr(resp, "model_dump") else json.loads(resp)
+    segs = data.get("segments", [])
+    for s in segs:
+        s["start"] = (s.get("start") or 0.0) + base_offset
+        s["end"] = (s.get("end") or s.get("start") or 0.0) + base_offset
+    logger.info(f"[TRANSCRIBE] OK segments={len(segs)}")
+    return {"segments": segs, "text": data.get("text", "")}
 
 
+@traced("_diarize_segment")
 def _diarize_segment(path: str, base_offset: float, pipeline: Pipeline) -> list:
-    print(f"[DIAR] Start diarization: file={path}, offset={base_offset:.2f}")
+    logger.info(f"[DIAR] Start diarization: file={path}, offset={base_offset:.2f}")
     kwargs = {}
     if EXPECTED_SPEAKERS > 0:
         # wymuszenie liczby mówców (jeśli znana)
@@ -129,11 +143,11 @@ def _diarize_segment(path: str, base_offset: float, pipeline: Pipeline) -> list:
             "speaker": speaker
         })
         cnt += 1
-    print(f"[DIAR] OK segments={cnt}")
+    logger.info(f"[DIAR] OK segments={cnt}")
     return speaker_segments
 
 def assign_speakers(whisper_segments: list, speaker_segments: list) -> list:
-    print(f"[ASSIGN] Assigning speakers: whisper={len(whisper_segments)}, diar={len(speaker_segments)}")
+    logger.info(f"[ASSIGN] Assigning speakers: whisper={len(whisper_segments)}, diar={len(speaker_segments)}")
     def find_speaker(ts):
         for s in speaker_segments:
             if s["start"] <= ts <= s["end"]:
@@ -153,7 +167,7 @@ def assign_speakers(whisper_segments: list, speaker_segments: list) -> list:
             "speaker": speaker,
             "text": seg.get("text", "")
         })
-    print(f"[ASSIGN] Done. UNKNOWN={unknown}/{len(whisper_segments)}")
+    logger.info(f"[ASSIGN] Done. UNKNOWN={unknown}/{len(whisper_segments)}")
     return enriched
 
 def save_transcript_outputs(audio_path: str, segments: list, pretty_txt: bool = True) -> tuple[str, str]:
@@ -161,21 +175,21 @@ def save_transcript_outputs(audio_path: str, segments: list, pretty_txt: bool =
     json_out = TRANSCRIPT_DIR / f"{stem}.json"
     txt_out = TRANSCRIPT_DIR / f"{stem}.txt"
 
-    print(f"[SAVE] Writing JSON: {json_out}")
+    logger.info(f"[SAVE] Writing JSON: {json_out}")
     json_out.write_text(json.dumps(segments, ensure_ascii=False, indent=2), encoding="utf-8")
 
-    print(f"[SAVE] Writing TXT: {txt_out}")
+    logger.info(f"[SAVE] Writing TXT: {txt_out}")
     if pretty_txt:
         lines = [f"[{s['start']:.2f} - {s['end']:.2f}] {s['speaker']}: {clean_fillers(s['text'])}" for s in segments]
         txt_out.write_text("\n".join(lines), encoding="utf-8")
     else:
         txt_out.write_text("\n".join(clean_fillers(s["text"]) for s in segments), encoding="utf-8")
 
-    print(f"[SAVE] Done.")
+    logger.info(f"[SAVE] Done.")
     return str(json_out), str(txt_out)
 
 def _relabel_speakers_globally(speaker_segments: list) -> list:
-    print(f"[RELABEL] Raw diar segments={len(speaker_segments)}")
+    logger.info(f"[RELABEL] Raw diar segments={len(speaker_segments)}")
     # proste mapowanie lokalnych etykiet na globalne
     mapping = {}
     next_id = 1
@@ -193,47 +207,66 @@ def _relabel_speakers_globally(speaker_segments: list) -> list:
             merged[-1]["end"] = max(merged[-1]["end"], seg["end"])
         else:
             merged.append(seg)
-    print(f"[RELABEL] Merged segments={len(merged)} unique_speakers={len({m['speaker'] for m in merged})}")
+    logger.info(f"[RELABEL] Merged segments={len(merged)} unique_speakers={len({m['speaker'] for m in merged})}")
     return merged
 
-def transcribe_api(audio_path: str) -> str:
-    print(f"[START] transcribe_api audio={audio_path}")
-    # weryfikacja pliku audio
-    try:
-        _ = sf.info(audio_path)
-        print(f"[CHECK] soundfile.info OK")
-    except Exception as e:
-        print(f"[CHECK] soundfile.info ERROR: {e}")
-        raise RuntimeError(f"Nieprawidłowy plik audio: {audio_path}") from e
-
-    # przygotuj pipeline diarization (raz)
+def _load_diarization_pipeline():
     hf_token = HUGGINGFACE_TOKEN
     if not hf_token:
-        print("[DIAR] Missing HUGGINGFACE_TOKEN in .env")
+        logger.warning("[DIAR] Missing HUGGINGFACE_TOKEN in .env")
         raise RuntimeError("Brak HUGGINGFACE_TOKEN w .env.")
 
-    print("[DIAR] Loading pyannote pipeline...")
+    logger.info("[DIAR] Loading pyannote pipeline...")
     try:
         pipeline = Pipeline.from_pretrained(
             "pyannote/speaker-diarization-3.1",
             use_auth_token=HUGGINGFACE_TOKEN  # <-- poprawiony parametr
         )
-        print("[DIAR] Pipeline loaded.")
+        logger.info("[DIAR] Pipeline loaded.")
     except Exception as e:
-        print(f"[DIAR] Pipeline load ERROR: {e}. Diarization will fallback to UNKNOWN.")
+        logger.error(f"[DIAR] Pipeline load ERROR: {e}. Diarization will fallback to UNKNOWN.")
         pipeline = None
+    return pipeline
+
+def _finalize_transcript(audio_path: str, whisper_segments: list, speaker_segments: list, total_dur: float) -> str:
+    if not speaker_segments:
+        # fallback: jeden mówca
+        speaker_segments = [{"start": 0.0, "end": total_dur, "speaker": "UNKNOWN"}]
+
+    # globalne relabel
+    speaker_segments = _relabel_speakers_globally(speaker_segments)
+
+    # przypisanie mówców do segmentów whisper
+    enriched = assign_speakers(whisper_segments, speaker_segments)
+
+    json_path, txt_path = save_transcript_outputs(audio_path, enriched, pretty_txt=True)
+    return txt_path
+
+@timed("transcribe_api")
+def transcribe_api(audio_path: str) -> str:
+    logger.info(f"[START] transcribe_api audio={audio_path}")
+    # weryfikacja pliku audio
+    try:
+        _ = sf.info(audio_path)
+        logger.info(f"[CHECK] soundfile.info OK")
+    except Exception as e:
+        logger.error(f"[CHECK] soundfile.info ERROR: {e}")
+        raise RuntimeError(f"Nieprawidłowy plik audio: {audio_path}") from e
+
+    # przygotuj pipeline diarization (raz)
+    pipeline = _load_diarization_pipeline()
 
     # podział na chunki
     chunks = _split_audio(audio_path)
-    print(f"[SPLIT] Chunks ready: {len(chunks)}")
+    logger.info(f"[SPLIT] Chunks ready: {len(chunks)}")
 
     all_text = []
     all_whisper_segments = []
     all_speaker_segments = []
-    offset = 0.0
-    chunks = _split_audio(audio_path)
     for idx, chunk in enumerate(chunks):
-        print(f"[LOOP] Processing chunk {idx}/{len(chunks)-1}: {chunk}, base_offset={offset:.2f}")
+        # offset = faktyczny start segmentu w nagraniu (z zakładką), jak w transcribe_stream
+        offset = _segment_offset(idx)
+        logger.info(f"[LOOP] Processing chunk {idx}/{len(chunks)-1}: {chunk}, base_offset={offset:.2f}")
 
         # transkrypcja chunku
         try:
@@ -242,7 +275,7 @@ def transcribe_api(audio_path: str) -> str:
             for s in segs:
                 all_whisper_segments.append(s)
         except Exception as e:
-            print(f"[LOOP] Transcribe ERROR chunk={idx}: {e}")
+            logger.error(f"[LOOP] Transcribe ERROR chunk={idx}: {e}")
 
         # diarizacja chunku
         if pipeline is not None:
@@ -250,19 +283,61 @@ def transcribe_api(audio_path: str) -> str:
                 diar_segs = _diarize_segment(chunk, base_offset=offset, pipeline=pipeline)
                 all_speaker_segments.extend(diar_segs)
             except Exception as e:
-                print(f"[LOOP] Diar ERROR chunk={idx}: {e}")
-        offset += SEGMENT_SECONDS
+                logger.error(f"[LOOP] Diar ERROR chunk={idx}: {e}")
 
-    if not all_speaker_segments:
-        # fallback: jeden mówca
-        total_dur = offset
-        all_speaker_segments = [{"start": 0.0, "end": total_dur, "speaker": "UNKNOWN"}]
+    total_dur = _segment_offset(len(chunks) - 1) + SEGMENT_SECONDS if chunks else 0.0
+    return _finalize_transcript(audio_path, all_whisper_segments, all_speaker_segments, total_dur)
 
-    # globalne relabel
-    all_speaker_segments = _relabel_speakers_globally(all_speaker_segments)
+@timed("transcribe_stream")
+def transcribe_stream(segments: Iterable[Tuple[int, str, float]], audio_path: str) -> str:
+    """
+    Transkrypcja i diarizacja segmentów napływających w trakcie pobierania (yt_download.stream_audio_segments):
+    każdy segment trafia do puli Whisper (TRANSCRIBE_WORKERS) i diarizacji (DIARIZE_WORKERS) od razu, więc czas
+    do pierwszego segmentu nie zależy od długości filmu. Offsety segmentów pochodzą ze strumienia (z zakładką).
+    audio_path – WAV całego nagrania (nazwa plików transkryptu). Zwraca ścieżkę TXT jak transcribe_api.
+    """
+    logger.info(f"[START] transcribe_stream audio={audio_path}")
+    pipeline = _load_diarization_pipeline()
+    started = time.perf_counter()
+    sp = current_span()
 
-    # przypisanie mówców do segmentów whisper
-    enriched = assign_speakers(all_whisper_segments, all_speaker_segments)
+    def _first_done(fut):
+        if fut.exception() is None:
+            elapsed = time.perf_counter() - started
+            sp.event("first_segment_transcribed")
+            logger.info(f"[STREAM] First segment transcribed after {elapsed:.1f}s")
 
-    json_path, txt_path = save_transcript_outputs(audio_path, enriched, pretty_txt=True)
-    return txt_path
\ No newline at end of file
+    tr_pool = ThreadPoolExecutor(max_workers=max(1, TRANSCRIBE_WORKERS), thread_name_prefix="whisper")
+    di_pool = ThreadPoolExecutor(max_workers=max(1, DIARIZE_WORKERS), thread_name_prefix="diarize")
+    pending = []  # (idx, offset, future transkrypcji, future diarizacji | None)
+    try:
+        for idx, path, offset in segments:
+            logger.info(f"[LOOP] Segment {idx} queued: {path}, base_offset={offset:.2f}")
+            tr = tr_pool.submit(in_context(_transcribe_segment), path, offset)
+            if idx == 0:
+                tr.add_done_callback(_first_done)
+            di = di_pool.submit(in_context(_diarize_segment), path, offset, pipeline) if pipeline is not None else None
+            pending.append((idx, offset, tr, di))
+        if not pending:
+            raise RuntimeError(f"Brak audio w strumieniu: {audio_path}")
+
+        all_whisper_segments = []
+        all_speaker_segments = []
+        for idx, offset, tr, di in pending:
+            try:
+                all_whisper_segments.extend(tr.result()["segments"])
+            except Exception as e:
+                logger.error(f"[LOOP] Transcribe ERROR chunk={idx}: {e}")
+            if di is not None:
+                try:
+                    all_speaker_segments.extend(di.result())
+                except Exception as e:
+                    logger.error(f"[LOOP] Diar ERROR chunk={idx}: {e}")
+    finally:
+        # błąd pobierania: nie zaczynamy segmentów z kolejki
+        tr_pool.shutdown(wait=True, cancel_futures=True)
+        di_pool.shutdown(wait=True, cancel_futures=True)
+
+    total_dur = pending[-1][1] + SEGMENT_SECONDS
+    logger.info(f"[STREAM] Segments={len(pending)} done in {time.perf_counter() - started:.1f}s")
+    return _finalize_transcript(audio_path, all_whisper_segments, all_speaker_segments, total_dur)
\ No newline at end of file
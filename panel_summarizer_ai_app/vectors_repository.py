@@ -1,66 +1,224 @@
 import os
 import json
-import chromadb
-from typing import List, Dict, Any
-from langchain_openai import OpenAIEmbeddings
+import threading
+import time
+from pathlib import Path
+from typing import List, Dict, Any, Optional, Tuple
+from config import DATA_DIR
+from llm_client import get_embeddings, embedding_model_id
+from index_manifest import IndexManifest, chunks_hash, file_signature
+from logging_config import get_logger
+from metrics import timed
+from tracing import traced, span
+from shared_state import SHARED_STATE, kv_get, kv_set
 
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-_client = chromadb.Client()
-embedding = OpenAIEmbeddings(api_key=OPENAI_API_KEY, model="text-embedding-3-small")
+logger = get_logger(__name__)
+
+embedding = get_embeddings()
+
+# backend indeksu: "chroma" (domyślny) lub "flat" (NumPy, float16 memmap w VECTOR_INDEX_DIR)
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "chroma").lower()
+VECTOR_INDEX_DIR = os.getenv("VECTOR_INDEX_DIR") or str(Path(DATA_DIR) / "index")
+
+# tryb Chroma: "memory" (chromadb.Client w procesie), "persistent" (PersistentClient w CHROMA_PATH)
+# albo "http" (osobny serwer `chroma run`, wspólny dla wszystkich workerów)
+CHROMA_MODE = os.getenv("CHROMA_MODE", "memory").lower()
+CHROMA_PATH = os.getenv("CHROMA_PATH") or str(Path(DATA_DIR) / "chroma")
+CHROMA_HOST = os.getenv("CHROMA_HOST", "127.0.0.1")
+CHROMA_PORT = int(os.getenv("CHROMA_PORT", "8002"))
+
+_client = None
+_flat_collections: Dict[str, Any] = {}
+_manifests: Dict[str, IndexManifest] = {}
+_manifests_lock = threading.Lock()
+
+def _chroma_client():
+    global _client
+    if _client is None:
+        import chromadb
+        if CHROMA_MODE == "http":
+            _client = chromadb.HttpClient(host=CHROMA_HOST, port=CHROMA_PORT)
+        elif CHROMA_MODE == "persistent":
+            _client = chromadb.PersistentClient(path=CHROMA_PATH)
+        else:
+            _client = chromadb.Client()
+        logger.info(f"[CHROMA] client mode={CHROMA_MODE}")
+    return _client
 
 #zwraca kolekcje lub tworzy nową
 def get_collection(name: str):
-    return _client.get_or_create_collection(name)
+    if VECTOR_BACKEND == "flat":
+        if name not in _flat_collections:
+            from flat_index import FlatCollection
+            _flat_collections[name] = FlatCollection(VECTOR_INDEX_DIR, name)
+        return _flat_collections[name]
+    return _chroma_client().get_or_create_collection(name)
+
+# manifest kolekcji (index_manifest.py) obok danych indeksu: flat – w katalogu kolekcji, Chroma persistent –
+# w CHROMA_PATH, Chroma http – w DATA_DIR (reset serwera wymaga force_reindex), Chroma w procesie – w pamięci
+def _manifest_path(name: str) -> Optional[Path]:
+    if VECTOR_BACKEND == "flat":
+        return Path(VECTOR_INDEX_DIR) / name / "manifest.json"
+    if CHROMA_MODE == "persistent":
+        return Path(CHROMA_PATH) / f"manifest_{name}.json"
+    if CHROMA_MODE == "http":
+        return Path(DATA_DIR) / "index_manifest" / f"{CHROMA_HOST}_{CHROMA_PORT}_{name}.json"
+    return None
+
+def get_manifest(name: str) -> IndexManifest:
+    with _manifests_lock:
+        if name not in _manifests:
+            _manifests[name] = IndexManifest(_manifest_path(name))
+        return _manifests[name]
+
+def indexed_entry(collection_name: str, video_id: str, chunks_path=None,
+                  chunks: Optional[List[Dict[str, Any]]] = None) -> Optional[Dict[str, Any]]:
+    """
+    Wpis manifestu, jeśli film jest już w kolekcji z tym samym zestawem chunków i modelem embeddingów:
+    najpierw sygnatura pliku chunków (bez czytania), potem – gdy podano chunks – hash zawartości.
+    """
+    manifest = get_manifest(collection_name)
+    entry = manifest.get(video_id)
+    if entry is None or entry.get("embedding_model") != embedding_model_id():
+        return None
+    if chunks_path is not None and entry.get("source") and entry["source"] == file_signature(chunks_path):
+        return entry
+    if chunks is not None and entry.get("chunk_hash") == chunks_hash(chunks):
+        if chunks_path is not None:
+            manifest.update_source(video_id, file_signature(chunks_path))
+        return entry
+    return None
+
+# wersja indeksu per (kolekcja, video_id) i per kolekcja (video_id=None); zmienia się przy każdym zapisie
+# chunków – zależne cache (answer_cache) porównują wersję zamiast śledzić zmiany w kolekcji
+_index_versions: Dict[Tuple[str, Optional[str]], int] = {}
+_versions_lock = threading.Lock()
+
+# przy STATE_BACKEND=sqlite wersje są w stanie współdzielonym – zapis w jednym workerze unieważnia cache w innych
+def index_version(collection_name: str, video_id: Optional[str] = None) -> int:
+    if SHARED_STATE:
+        return int(kv_get("index_version", f"{collection_name}|{video_id or ''}") or 0)
+    with _versions_lock:
+        return _index_versions.get((collection_name, video_id), 0)
+
+def _bump_index_version(collection_name: str, video_id: Optional[str]):
+    version = time.time_ns()
+    if SHARED_STATE:
+        kv_set("index_version", f"{collection_name}|", version)
+        if video_id:
+            kv_set("index_version", f"{collection_name}|{video_id}", version)
+        return
+    with _versions_lock:
+        _index_versions[(collection_name, None)] = version
+        if video_id:
+            _index_versions[(collection_name, video_id)] = version
 
 #zapisuje chunki do bazy wektorowej z metadanymi
-def store_chunks(collection, chunks):
+@timed("store_chunks")
+def store_chunks(collection, chunks, video_id: Optional[str] = None, source=None):
+    # source: ścieżka pliku chunków – jego sygnatura trafia do manifestu (szybkie sprawdzenie przy reuse)
     documents = [c["text"] for c in chunks]
     metadatas = [{
         "id": c.get("id", i),
         "speaker": c.get("speaker", "UNKNOWN"),
         "start": c.get("start"),
         "end": c.get("end"),
+        # granice wypowiedzi (turnu) – context_packer scala chunki z tego samego turnu
+        "turn_start": c.get("turn_start", c.get("start")),
+        "turn_end": c.get("turn_end", c.get("end")),
     } for i, c in enumerate(chunks)]
-    ids = [str(m["id"]) for m in metadatas]
-    vectors = embedding.embed_documents(documents)
-    collection.upsert(documents=documents, metadatas=metadatas, ids=ids, embeddings=vectors)
+    if video_id:
+        # video_id w metadanych pozwala filtrować zapytania i nie nadpisuje chunków innych filmów
+        for m in metadatas:
+            m["video_id"] = video_id
+        ids = [f"{video_id}_{m['id']}" for m in metadatas]
+    else:
+        ids = [str(m["id"]) for m in metadatas]
+    with span("embed_documents", count=len(documents)):
+        vectors = embedding.embed_documents(documents)
+    if video_id:
+        # ponowna indeksacja filmu: wiersze starego zestawu chunków, których upsert nie nadpisze (np. krótszy
+        # nowy zestaw) – inaczej zostałyby w indeksie i nadal trafiały do wyników
+        stale = sorted(set(collection.get(where={"video_id": video_id}, include=[])["ids"]) - set(ids))
+        if stale:
+            with span("index_delete_stale", count=len(stale)):
+                collection.delete(ids=stale)
+            logger.info(f"[INDEX] Removed {len(stale)} stale chunks of video_id={video_id}")
+    with span("index_upsert", count=len(documents)):
+        collection.upsert(documents=documents, metadatas=metadatas, ids=ids, embeddings=vectors)
+    name = getattr(collection, "name", "")
+    _bump_index_version(name, video_id)
+    if video_id:
+        get_manifest(name).record(video_id, chunks_hash(chunks), embedding_model_id(), len(chunks),
+                                  source=file_signature(source) if source is not None else None)
 
-# zapytanie do bazy wektorowej
-def query_db(collection, question: str, n_results: int = 5):
-    q_vec = embedding.embed_query(question)
+@traced("embed_question")
+def embed_question(question: str) -> List[float]:
+    return embedding.embed_query(question)
+
+@traced("embed_question")
+async def aembed_question(question: str) -> List[float]:
+    return await embedding.aembed_query(question)
+
+@traced("embed_questions")
+async def aembed_questions(questions: List[str]) -> List[List[float]]:
+    return await embedding.aembed_documents(list(questions))
+
+# zapytanie do bazy wektorowej (where: opcjonalny filtr metadanych, np. {"video_id": "..."})
+@traced("query_db")
+def query_db(collection, question: str, n_results: int = 5, where: Optional[Dict[str, Any]] = None,
+             q_vec: Optional[List[float]] = None):
+    # q_vec: gotowy embedding pytania (np. policzony już dla answer_cache)
+    if q_vec is None:
+        q_vec = embedding.embed_query(question)
+    if where:
+        return collection.query(query_embeddings=[q_vec], n_results=n_results, where=where)
     return collection.query(query_embeddings=[q_vec], n_results=n_results)
 
-# initializacja cross-encodera do rerankingu 
-try:
-    from sentence_transformers import CrossEncoder
-    CROSS_ENCODER_MODEL = os.getenv("CROSS_ENCODER_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
-    _cross_encoder = CrossEncoder(CROSS_ENCODER_MODEL)
-    print(f"[RERANK] CrossEncoder loaded: {CROSS_ENCODER_MODEL}")
-except Exception as e:
-    _cross_encoder = None
-    print(f"[RERANK] CrossEncoder not available: {e}")
-
-def query_and_rerank_crossencoder(collection, question: str, n_candidates: int = 20, top_k: int = 5) -> List[Dict[str, Any]]:
+# initializacja cross-encodera do rerankingu (wspólna instancja z evaluatorem przez model_manager)
+from model_manager import get_model_manager, KIND_CROSS_ENCODER
+CROSS_ENCODER_MODEL = os.getenv("CROSS_ENCODER_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+_cross_encoder = get_model_manager().get(CROSS_ENCODER_MODEL, KIND_CROSS_ENCODER)
+if _cross_encoder is not None:
+    logger.info(f"[RERANK] CrossEncoder loaded: {CROSS_ENCODER_MODEL}")
+else:
+    logger.warning(f"[RERANK] CrossEncoder not available: {CROSS_ENCODER_MODEL}")
+
+@timed("query_and_rerank_crossencoder")
+def query_and_rerank_crossencoder(collection, question: str, n_candidates: int = 20, top_k: int = 5,
+                                  where: Optional[Dict[str, Any]] = None,
+                                  q_vec: Optional[List[float]] = None) -> List[Dict[str, Any]]:
     top_k = max(1, min(int(top_k), 20)) #ograniczenie top_k do [1,20]
-    res = query_db(collection, question, n_results=n_candidates)
+    res = query_db(collection, question, n_results=n_candidates, where=where, q_vec=q_vec)
     ctxs = _build_contexts_from_query(res)
     return _cross_encode_rerank(question, ctxs, top_k)
 
 # reranking z cross-encoderem
-def _build_contexts_from_query(res: Dict[str, Any]) -> List[Dict[str, Any]]:
-    docs = res.get("documents", [[]])[0] or []
-    metas = res.get("metadatas", [[]])[0] or []
+def _build_contexts_from_query(res: Dict[str, Any], qi: int = 0) -> List[Dict[str, Any]]:
+    # qi: indeks zapytania, gdy w jednym query przekazano kilka wektorów
+    def _row(key):
+        rows = res.get(key) or [[]]
+        return (rows[qi] if qi < len(rows) else []) or []
+    docs, metas, dists = _row("documents"), _row("metadatas"), _row("distances")
     contexts: List[Dict[str, Any]] = []
-    for d, m in zip(docs, metas):
+    for i, (d, m) in enumerate(zip(docs, metas)):
         m = m or {}
-        contexts.append({
+        ctx = {
+            "id": m.get("id"),
             "text": d,
             "speaker": m.get("speaker"),
             "start": m.get("start"),
             "end": m.get("end"),
-        })
+            "turn_start": m.get("turn_start"),
+            "turn_end": m.get("turn_end"),
+            "video_id": m.get("video_id"),
+        }
+        if i < len(dists):
+            ctx["distance"] = float(dists[i])
+        contexts.append(ctx)
     return contexts
 
+@traced("_cross_encode_rerank")
 def _cross_encode_rerank(question: str, contexts: List[Dict[str, Any]], top_k: int) -> List[Dict[str, Any]]:
     if not contexts or _cross_encoder is None:
         return contexts[:top_k]
@@ -70,5 +228,129 @@ def _cross_encode_rerank(question: str, contexts: List[Dict[str, Any]], top_k: i
     items.sort(key=lambda x: x["rerank_score"], reverse=True)
     return items[:top_k]
 
+# Kaskadowy retrieval: reranking tylko wtedy, gdy wynik wektorowy nie jest rozstrzygający
+CASCADE_MAX_CANDIDATES = int(os.getenv("CASCADE_MAX_CANDIDATES", "20"))
+CASCADE_SKIP_GAP = float(os.getenv("CASCADE_SKIP_GAP", "0.35"))   # luka k/k+1 względem rozrzutu -> bez rerankingu
+CASCADE_MARGIN = float(os.getenv("CASCADE_MARGIN", "0.5"))        # kandydaci w odległości k-tego + margin*rozrzut
+CASCADE_STEP = int(os.getenv("CASCADE_STEP", "4"))                # rozmiar kolejnego okna rerankingu
+
+def _cascade_budget(distances: List[float], top_k: int) -> Tuple[float, int]:
+    """
+    Zwraca (względna luka między k-tym i (k+1)-szym kandydatem, liczba kandydatów do rerankingu).
+    Liczba kandydatów wynika z top_k i rozrzutu odległości: im gęściej wokół k-tego wyniku, tym więcej.
+    Progi są względne (ułamek rozrzutu); oba backendy zwracają odległość l2² znormalizowanych wektorów.
+    """
+    n = len(distances)
+    spread = distances[-1] - distances[0]
+    if n <= top_k or spread <= 0:
+        return 0.0, n
+    kth = distances[top_k - 1]
+    rel_gap = (distances[top_k] - kth) / spread
+    close = sum(1 for d in distances if d <= kth + CASCADE_MARGIN * spread)
+    return rel_gap, max(top_k + 1, min(n, close))
+
+@timed("query_and_rerank_cascade")
+def query_and_rerank_cascade(collection, question: str, top_k: int = 5,
+                             where: Optional[Dict[str, Any]] = None,
+                             stats: Optional[Dict[str, Any]] = None,
+                             q_vec: Optional[List[float]] = None) -> List[Dict[str, Any]]:
+    """
+    Kaskada: 1) zapytanie wektorowe (z odległościami), 2) jeśli luka po top_k jest wyraźna – bez rerankingu,
+    3) w przeciwnym razie reranking rosnącego okna kandydatów z wczesnym zatrzymaniem, gdy kolejne okno
+    nie poprawia top_k. Ścieżka trafia do logu i (opcjonalnie) do słownika stats.
+    """
+    top_k = max(1, min(int(top_k), CASCADE_MAX_CANDIDATES))
+    res = query_db(collection, question, n_results=CASCADE_MAX_CANDIDATES, where=where, q_vec=q_vec)
+    ctxs = _build_contexts_from_query(res)
+    distances = [c.get("distance", 0.0) for c in ctxs]
+
+    if len(ctxs) <= top_k or _cross_encoder is None:
+        path, reranked, out = "passthrough", 0, ctxs[:top_k]
+        rel_gap, budget = 0.0, len(ctxs)
+    else:
+        rel_gap, budget = _cascade_budget(distances, top_k)
+        if rel_gap >= CASCADE_SKIP_GAP:
+            path, reranked, out = "vector_only", 0, ctxs[:top_k]
+        else:
+            window = min(budget, top_k + CASCADE_STEP)
+            scored = _cross_encode_rerank(question, ctxs[:window], top_k=window)
+            path = "rerank_window"
+            while window < budget:
+                nxt = ctxs[window:min(budget, window + CASCADE_STEP)]
+                nxt_scored = _cross_encode_rerank(question, nxt, top_k=len(nxt))
+                window += len(nxt)
+                kth_score = scored[top_k - 1]["rerank_score"]
+                scored = sorted(scored + nxt_scored, key=lambda x: x["rerank_score"], reverse=True)
+                if nxt_scored[0]["rerank_score"] <= kth_score:
+                    path = "rerank_early_stop"
+                    break
+            reranked, out = window, scored[:top_k]
+
+    logger.info(f"[CASCADE] path={path} top_k={top_k} fetched={len(ctxs)} budget={budget} "
+          f"reranked={reranked} rel_gap={rel_gap:.3f}")
+    if stats is not None:
+        stats.update({"path": path, "fetched": len(ctxs), "budget": budget,
+                      "reranked": reranked, "rel_gap": rel_gap})
+    return out
+
+@timed("query_and_rerank_batch")
+def query_and_rerank_batch(collection, questions: List[str], top_k: int = 5,
+                           where: Optional[Dict[str, Any]] = None,
+                           stats: Optional[List[Dict[str, Any]]] = None,
+                           q_vecs: Optional[List[List[float]]] = None) -> List[List[Dict[str, Any]]]:
+    """
+    Retrieval dla kilku pytań naraz: jedno wywołanie embeddingów, jedno zapytanie wektorowe z wieloma
+    wektorami i jeden predict cross-encodera dla par wszystkich pytań. Liczba kandydatów do rerankingu
+    per pytanie jak w kaskadzie (_cascade_budget; wyraźna luka po top_k -> bez rerankingu).
+    Zwraca listy kontekstów w kolejności pytań; q_vecs – gotowe embeddingi pytań (ścieżka async).
+    """
+    if not questions:
+        return []
+    top_k = max(1, min(int(top_k), CASCADE_MAX_CANDIDATES))
+    if q_vecs is None:
+        with span("embed_questions", count=len(questions)):
+            q_vecs = embedding.embed_documents(list(questions))
+    vecs = q_vecs
+    with span("query_db", queries=len(questions)):
+        if where:
+            res = collection.query(query_embeddings=vecs, n_results=CASCADE_MAX_CANDIDATES, where=where)
+        else:
+            res = collection.query(query_embeddings=vecs, n_results=CASCADE_MAX_CANDIDATES)
+
+    candidates: List[List[Dict[str, Any]]] = []
+    pairs: List[Tuple[str, str]] = []
+    owners: List[Tuple[int, int]] = []  # (indeks pytania, indeks kandydata) dla każdej pary
+    paths: List[Tuple[str, float, int]] = []
+    for qi, q in enumerate(questions):
+        ctxs = _build_contexts_from_query(res, qi)
+        candidates.append(ctxs)
+        if len(ctxs) <= top_k or _cross_encoder is None:
+            paths.append(("passthrough", 0.0, 0))
+            continue
+        rel_gap, budget = _cascade_budget([c.get("distance", 0.0) for c in ctxs], top_k)
+        if rel_gap >= CASCADE_SKIP_GAP:
+            paths.append(("vector_only", rel_gap, 0))
+            continue
+        paths.append(("rerank_batch", rel_gap, budget))
+        for ci in range(budget):
+            pairs.append((q, ctxs[ci].get("text") or ""))
+            owners.append((qi, ci))
 
+    with span("_cross_encode_rerank", pairs=len(pairs)):
+        scores = _cross_encoder.predict(pairs) if pairs else []
+    scored: Dict[int, List[Dict[str, Any]]] = {}
+    for (qi, ci), sc in zip(owners, scores):
+        scored.setdefault(qi, []).append({**candidates[qi][ci], "rerank_score": float(sc)})
 
+    out: List[List[Dict[str, Any]]] = []
+    for qi, ctxs in enumerate(candidates):
+        if qi in scored:
+            out.append(sorted(scored[qi], key=lambda x: x["rerank_score"], reverse=True)[:top_k])
+        else:
+            out.append(ctxs[:top_k])
+    logger.info(f"[CASCADE] batch questions={len(questions)} top_k={top_k} pairs={len(pairs)} "
+          f"paths={[p[0] for p in paths]}")
+    if stats is not None:
+        stats.extend({"path": p, "rel_gap": g, "reranked": b, "fetched": len(c)}
+                     for (p, g, b), c in zip(paths, candidates))
+    return out
@@ -1,12 +1,24 @@
 from yt_dlp import YoutubeDL
 from pathlib import Path
-import os
+from typing import BinaryIO, Iterator, Optional, Tuple
+import os, shutil, subprocess, sys, tempfile, threading, wave
 from config import FFMPEG_DIR, DATA_DIR
+from logging_config import get_logger
+from tracing import traced
+from yt_utils import extract_video_id
+
+logger = get_logger(__name__)
 
 DATA_DIR = Path(DATA_DIR) / "audio"
 DATA_DIR.mkdir(parents=True, exist_ok=True)
 
+# strumień PCM z ffmpeg: 16 kHz, mono, 16 bit (jak postprocessor w download_audio_from_youtube)
+STREAM_SAMPLE_RATE = 16000
+STREAM_READ_BYTES = 64 * 1024
+_BYTES_PER_SECOND = STREAM_SAMPLE_RATE * 2
+
 #pobranie audio z YouTube w formacie WAV
+@traced("download_audio_from_youtube")
 def download_audio_from_youtube(url: str) -> str:
     ydl_opts = {
         "format": "bestaudio/best",
@@ -33,4 +45,145 @@ def download_audio_from_youtube(url: str) -> str:
         return str(matches[0])
 
     original = next(DATA_DIR.glob(f"{video_id}.*"), None)
-    return str(original) if original else str(expected)
\ No newline at end of file
+    return str(original) if original else str(expected)
+
+
+def audio_path_for(video_id: str) -> str:
+    return str(DATA_DIR / f"{video_id}.wav")
+
+
+def _ffmpeg_bin() -> str:
+    if FFMPEG_DIR:
+        cand = Path(FFMPEG_DIR) / ("ffmpeg.exe" if os.name == "nt" else "ffmpeg")
+        if cand.exists():
+            return str(cand)
+    found = shutil.which("ffmpeg")
+    if not found:
+        raise FileNotFoundError("ffmpeg not found. Set FFMPEG_DIR in .env or add it to PATH.")
+    return found
+
+
+def _open_wav(path: Path):
+    w = wave.open(str(path), "wb")
+    w.setnchannels(1)
+    w.setsampwidth(2)
+    w.setframerate(STREAM_SAMPLE_RATE)
+    return w
+
+
+def pcm_segments(pcm: BinaryIO, stem: str, segment_seconds: int, overlap_seconds: int,
+                 full_wav: Optional[Path] = None) -> Iterator[Tuple[int, str, float]]:
+    """
+    Dzieli strumień PCM (s16le, 16 kHz, mono) na segmenty WAV o układzie jak transcribe._split_audio:
+    segment i obejmuje [i*S - overlap, (i+1)*S + overlap), bez zakładki przed pierwszym i po ostatnim.
+    Segment jest oddawany, gdy tylko strumień dojdzie do jego końca. Zwraca (indeks, ścieżka, offset startu w s).
+    full_wav – opcjonalny zapis całego nagrania (równolegle ze strumieniem).
+    """
+    seg_b = int(segment_seconds * _BYTES_PER_SECOND)
+    ov_b = int(overlap_seconds * _BYTES_PER_SECOND)
+    out_dir = Path(tempfile.gettempdir()) / f"chunks_{stem}"
+    out_dir.mkdir(exist_ok=True)
+    buf, buf_start, idx = bytearray(), 0, 0  # buf_start – pozycja początku bufora w całym strumieniu (bajty)
+    writer = _open_wav(full_wav) if full_wav is not None else None
+
+    def _emit(end: int) -> Tuple[int, str, float]:
+        start = max(0, idx * seg_b - ov_b)
+        out = out_dir / f"{stem}_chunk_{idx:03d}.wav"
+        with _open_wav(out) as w:
+            w.writeframes(bytes(buf[start - buf_start:end - buf_start]))
+        logger.info(f"[STREAM] Segment {idx} ready: {start / _BYTES_PER_SECOND:.1f}-{end / _BYTES_PER_SECOND:.1f}s -> {out}")
+        return idx, str(out), start / _BYTES_PER_SECOND
+
+    try:
+        while True:
+            block = pcm.read(STREAM_READ_BYTES)
+            if block:
+                buf += block
+                if writer is not None:
+                    writer.writeframes(block)
+            total = buf_start + len(buf)
+            if not block:
+                total -= total % 2  # niepełna próbka na końcu strumienia
+            # segment bez końca strumienia: musi być dostępna zakładka po nim (inaczej może być ostatni)
+            while total >= (idx + 1) * seg_b + ov_b or (not block and idx * seg_b < total):
+                end = min(total, (idx + 1) * seg_b + ov_b)
+                yield _emit(end)
+                idx += 1
+                cut = max(0, idx * seg_b - ov_b) - buf_start
+                del buf[:cut]
+                buf_start += cut
+            if not block:
+                return
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+@traced("stream_audio_segments")
+def stream_audio_segments(url: str, segment_seconds: int, overlap_seconds: int,
+                          source: Optional[BinaryIO] = None) -> Iterator[Tuple[int, str, float]]:
+    """
+    Pobieranie połączone z dekodowaniem: yt-dlp (stdout) -> jeden proces ffmpeg (16 kHz mono PCM) -> segmenty
+    z pcm_segments oddawane w trakcie pobierania. Całe nagranie zapisywane jest jak w download_audio_from_youtube
+    (audio_path_for) – najpierw do pliku tymczasowego, podmienianego dopiero po poprawnym zakończeniu obu procesów
+    (przerwany strumień nie zostawia uciętego {video_id}.wav, który inne ścieżki uznałyby za kompletny).
+    source – zakodowane audio zamiast yt-dlp (benchmarki).
+    """
+    video_id = extract_video_id(url) or "stream"
+    errors = tempfile.TemporaryFile()
+    procs = []
+    feeder = None
+    fd, partial = tempfile.mkstemp(prefix=f".{video_id}.", suffix=".wav.part", dir=DATA_DIR)
+    os.close(fd)
+    try:
+        if source is None:
+            dl = subprocess.Popen(
+                [sys.executable, "-m", "yt_dlp", "-f", "bestaudio/best", "-o", "-", "--quiet", "--no-warnings",
+                 "--no-part", url],
+                stdout=subprocess.PIPE, stderr=errors,
+            )
+            procs.append(dl)
+        ff = subprocess.Popen(
+            [_ffmpeg_bin(), "-hide_banner", "-loglevel", "error", "-i", "pipe:0",
+             "-f", "s16le", "-ac", "1", "-ar", str(STREAM_SAMPLE_RATE), "pipe:1"],
+            stdin=procs[0].stdout if source is None else subprocess.PIPE, stdout=subprocess.PIPE, stderr=errors,
+        )
+        procs.append(ff)
+        if source is None:
+            procs[0].stdout.close()  # ffmpeg jest jedynym czytelnikiem; SIGPIPE dla yt-dlp, gdy ffmpeg padnie
+        else:
+            def _feed():
+                try:
+                    while True:
+                        block = source.read(STREAM_READ_BYTES)
+                        if not block:
+                            break
+                        ff.stdin.write(block)
+                except (BrokenPipeError, ValueError):
+                    pass
+                finally:
+                    try:
+                        ff.stdin.close()
+                    except OSError:
+                        pass
+            feeder = threading.Thread(target=_feed, daemon=True)
+            feeder.start()
+
+        logger.info(f"[STREAM] Streaming audio url={url} segment={segment_seconds}s overlap={overlap_seconds}s")
+        yield from pcm_segments(ff.stdout, video_id, segment_seconds, overlap_seconds, full_wav=Path(partial))
+        codes = [p.wait() for p in procs]
+        if any(codes):
+            errors.seek(0)
+            tail = errors.read()[-2000:].decode("utf-8", errors="replace")
+            raise RuntimeError(f"Pobieranie/dekodowanie audio nie powiodło się (kody {codes}): {tail}")
+        os.replace(partial, audio_path_for(video_id))
+    finally:
+        if os.path.exists(partial):
+            os.remove(partial)
+        for p in procs:
+            if p.poll() is None:
+                p.kill()
+                p.wait()
+        if feeder is not None:
+            feeder.join(timeout=5)
+        errors.close()
@@ -13,6 +13,29 @@ def extract_video_id(url: str) -> Optional[str]:
         return m.group(1)
     return None
 
+_VIDEO_ID_RE = re.compile(r"^[A-Za-z0-9_\-]{11}$")
+_CHANNEL_RE = re.compile(r"youtube\.com/(@[^/?#]+|channel/[^/?#]+|c/[^/?#]+|user/[^/?#]+)")
+
+#ekstrakcja id playlisty (list=...) z URL
+def extract_playlist_id(url: str) -> Optional[str]:
+    m = re.search(r"[?&]list=([A-Za-z0-9_\-]+)", url)
+    return m.group(1) if m else None
+
+#rodzaj źródła: video | playlist | channel | None (nierozpoznane); goły 11-znakowy id traktujemy jak film
+def classify_source(url: str) -> Optional[str]:
+    url = url.strip()
+    if _VIDEO_ID_RE.match(url):
+        return "video"
+    if "/playlist" in url and extract_playlist_id(url):
+        return "playlist"
+    if extract_video_id(url):
+        return "video"
+    if extract_playlist_id(url):
+        return "playlist"
+    if _CHANNEL_RE.search(url):
+        return "channel"
+    return None
+
 #metoda sciezki z transkrupcją i chunkami 
 def existing_paths_for_id(video_id: str):
     transcripts_dir = Path(DATA_DIR) / "transcripts"
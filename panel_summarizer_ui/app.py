@@ -1,9 +1,13 @@
+import json
 import re
+import time
 from typing import Optional
 import requests
 import gradio as gr
 
 API = "http://127.0.0.1:8000"
+PROGRESS_MARKER = "[POSTĘP]"  # linie postępu map-reduce z /summarize_stream
+POLL_INTERVAL_S = 2.0  # odpytywanie statusu zadania /jobs/{id}
 
 def _extract_video_id(url: str) -> Optional[str]:
     m = re.search(r"[?&]v=([A-Za-z0-9_\-]{6,})", url)
@@ -14,33 +18,65 @@ def _extract_video_id(url: str) -> Optional[str]:
         return m.group(1)
     return None
 
-def process_video(url):
+def process_video(url, precompute_summary=False, summary_max_tokens=2000):
     # generator: pokaż spinner od razu i aktualizuj status w trakcie
     yield "Inicjalizacja...", None, gr.update(visible=True)
     if not url:
         yield "Brak URL", None, gr.update(visible=False)
         return
     try:
-        yield "Wywołuję /process_youtube (to może potrwać)...", None, gr.update(visible=True)
-        r = requests.post(f"{API}/process_youtube", json={"url": url}, timeout=600)
+        yield "Zgłaszam film do przetwarzania...", None, gr.update(visible=True)
+        payload = {
+            "url": url,
+            "precompute_summary": bool(precompute_summary),
+            "summary_max_tokens": int(summary_max_tokens or 2000),
+        }
+        r = requests.post(f"{API}/process_youtube", json=payload, timeout=30)
         if r.status_code != 200:
             yield f"ERROR {r.status_code}: {r.text}", None, gr.update(visible=False)
             return
         data = r.json()
-        vid = _extract_video_id(url)
+        if data.get("error"):
+            yield f"ERROR: {data['error']}", None, gr.update(visible=False)
+            return
+        # zadanie w tle – odpytujemy status i pokazujemy bieżący etap
+        job_id = data["job_id"]
+        note = " (dołączono do trwającego przetwarzania)" if data.get("deduplicated") else ""
+        while True:
+            job = requests.get(f"{API}/jobs/{job_id}", timeout=30).json()
+            if job.get("status") not in ("queued", "running"):
+                break
+            yield f"Przetwarzanie{note}: etap={job.get('stage')}", None, gr.update(visible=True)
+            time.sleep(POLL_INTERVAL_S)
+        if job.get("status") != "done":
+            yield f"ERROR: {job.get('error')}", None, gr.update(visible=False)
+            return
+        data = requests.get(f"{API}/jobs/{job_id}/result", timeout=30).json()
+        vid = data.get("video_id") or _extract_video_id(url)
         mode = data.get("mode")
         idx = data.get("indexed_chunks")
         msg = f"OK. mode={mode}, zindeksowano={idx}"
+        if data.get("summary_job"):
+            msg += f", podsumowanie w tle: {data['summary_job']}"
         yield msg, vid, gr.update(visible=False)
     except Exception as e:
         yield f"Exception: {e}", None, gr.update(visible=False)
 
-def get_summary_stream(video_id, max_tokens):
+def _strip_progress(buf: str) -> str:
+    # pokazuj znaczniki postępu tylko dopóki nie zacznie napływać właściwe podsumowanie
+    body = [ln for ln in buf.split("\n") if not ln.startswith(PROGRESS_MARKER)]
+    if "".join(body).strip():
+        return "\n".join(body).lstrip("\n")
+    return buf
+
+def get_summary_stream(video_id, max_tokens, refresh=False):
     # stream z /summarize
     payload = {}
     if video_id:
         payload["video_id"] = video_id
     payload["max_tokens"] = int(max_tokens or 2000)
+    payload["refresh"] = bool(refresh)
+    payload["progress"] = True  # linie [POSTĘP] podczas map-reduce
     buf = ""
     try:
         with requests.post(f"{API}/summarize_stream", json=payload) as r:
@@ -49,65 +85,59 @@ def get_summary_stream(video_id, max_tokens):
                 if not chunk:
                     continue
                 buf += chunk.decode("utf-8", errors="ignore")
-                yield buf
+                yield _strip_progress(buf)
     except Exception as e:
         yield f"Exception: {e}"
 
+def _format_contexts(used) -> str:
+    chunks_preview = []
+    for c in used:
+        speaker = c.get("speaker")
+        start = c.get("start")
+        end = c.get("end")
+        text = c.get("text") or ""
+        chunks_preview.append(f"{speaker} [{start}-{end}]: {text}")
+    return "\n\n".join(chunks_preview)
+
+def _format_metrics(m) -> str:
+    fai = m.get("faithfulness", 0)
+    rel = m.get("relevancy", 0)
+    return f"Metryki ewaluacji (CE):\n- Faithfulness: {fai}\n- Relevancy: {rel}"
+
 def ask_question_stream(question, top_k):
-    # stream z /ask; po zakończeniu: dociąg kontekstów oraz wywołanie /ask_eval_ce i pokazanie metryk w "Uwagi"
+    # jeden strumień NDJSON z /ask_ndjson: konteksty, potem delty odpowiedzi, na końcu metryki CE
     if not question:
         yield "Brak pytania", "", "Brak pytania do ewaluacji."
         return
     buf = ""
+    ctx_preview = ""
+    eval_md = "Ewaluacja będzie dostępna po zakończeniu odpowiedzi..."
     try:
         with requests.post(
-            f"{API}/ask_stream",
-            json={"question": question, "top_k": int(top_k or 5), "collection_name": "panel"}
+            f"{API}/ask_ndjson",
+            json={"question": question, "top_k": int(top_k or 5)},
+            stream=True,
         ) as r:
             r.raise_for_status()
-            for chunk in r.iter_content(chunk_size=1024):
-                if not chunk:
+            for line in r.iter_lines(decode_unicode=True):
+                if not line:
                     continue
-                buf += chunk.decode("utf-8", errors="ignore")
-                # w trakcie streamu nie mamy metryk – placeholder
-                yield buf, "", "Ewaluacja będzie dostępna po zakończeniu odpowiedzi..."
-        # Po zakończeniu streamu – pobierz użyte konteksty
-        ctx_preview = ""
-        try:
-            rr = requests.get(f"{API}/used_contexts", timeout=30)
-            if rr.status_code == 200:
-                data = rr.json()
-                used = data.get("contexts", [])
-                chunks_preview = []
-                for c in used:
-                    speaker = c.get("speaker")
-                    start = c.get("start")
-                    end = c.get("end")
-                    text = c.get("text") or ""
-                    chunks_preview.append(f"{speaker} [{start}-{end}]: {text}")
-                ctx_preview = "\n\n".join(chunks_preview)
-            else:
-                ctx_preview = f"ERROR {rr.status_code}: {rr.text}"
-        except Exception as e2:
-            ctx_preview = f"Exception: {e2}"
-        # Wywołaj ewaluację CE (relevancy i faithfulness)
-        eval_md = ""
-        try:
-            er = requests.post(f"{API}/ask_eval_ce", json={"question": question, "top_k": int(top_k or 5)}, timeout=60)
-            if er.status_code == 200:
-                ed = er.json()
-                m = ed.get("metrics_ce", {})
-                fai = m.get("faithfulness", 0)
-                rel = m.get("relevancy", 0)
-                eval_md = f"Metryki ewaluacji (CE):\n- Faithfulness: {fai}\n- Relevancy: {rel}"
-            else:
-                eval_md = f"[CE] error {er.status_code}: {er.text}"
-        except Exception as e3:
-            eval_md = f"[CE] exception: {e3}"
-        # Zwróć: odpowiedź, konteksty, metryki do sekcji Uwagi
-        yield buf, ctx_preview, eval_md
+                event = json.loads(line)
+                kind = event.get("type")
+                if kind == "contexts":
+                    ctx_preview = _format_contexts(event.get("contexts", []))
+                elif kind == "delta":
+                    buf += event.get("text", "")
+                elif kind == "metrics":
+                    eval_md = _format_metrics(event.get("metrics_ce", {}))
+                elif kind == "error":
+                    buf += f"\n\n[ERROR] {event.get('error')}"
+                    eval_md = f"[CE] brak metryk: {event.get('error')}"
+                else:
+                    continue
+                yield buf, ctx_preview, eval_md
     except Exception as e:
-        yield f"Exception: {e}", "", f"Exception: {e}"
+        yield f"Exception: {e}", ctx_preview, f"Exception: {e}"
 
 
 with gr.Blocks() as demo:
@@ -134,16 +164,18 @@ with gr.Blocks() as demo:
             visible=False,
         )
 
+    precompute = gr.Checkbox(label="Przygotuj podsumowanie w tle po przetworzeniu", value=False)  # jak API: domyślnie bez kosztownego podsumowania w tle
     status = gr.Textbox(label="Status", interactive=False)
     video_id_box = gr.Textbox(label="video_id (auto)", interactive=False)
-    process_btn.click(process_video, inputs=url, outputs=[status, video_id_box, spinner])
 
     gr.Markdown("## 📌 Podsumowanie")
     with gr.Row():
         max_tokens = gr.Number(label="Limit tokenów ", value=2000)
+        refresh = gr.Checkbox(label="Wygeneruj ponownie", value=False)
         summary_btn = gr.Button("Podsumuj")
     summary_out = gr.Markdown()
-    summary_btn.click(get_summary_stream, inputs=[video_id_box, max_tokens], outputs=summary_out)
+    process_btn.click(process_video, inputs=[url, precompute, max_tokens], outputs=[status, video_id_box, spinner])
+    summary_btn.click(get_summary_stream, inputs=[video_id_box, max_tokens, refresh], outputs=summary_out)
 
     gr.Markdown("## 💬 Zapytania")
     question = gr.Textbox(label="Pytanie")
@@ -158,7 +190,7 @@ with gr.Blocks() as demo:
     gr.Markdown("## ℹ️ Uwagi")
     gr.Markdown(
         "- Podsumowanie i odpowiedzi mogą trwać, zależnie od długości materiału i modelu.\n"
-        "- Konteksty są dociągane po zakończeniu strumienia odpowiedzi.\n"
+        "- Konteksty pojawiają się przed odpowiedzią (jeden strumień NDJSON z /ask_ndjson).\n"
         "- Metryki ewaluacji (CE) pojawiają się po zakończeniu odpowiedzi w polu powyżej."
     )
 